@@ -1,6 +1,8 @@
-import bpy
-from bpy.props import StringProperty
-from bpy_extras.io_utils import orientation_helper, ImportHelper, axis_conversion
+#  the parser (mdb_parser, model_data...) also works outside Blender, the add-on part needs bpy
+try:
+    import bpy
+except ImportError:
+    bpy = None
 
 bl_info = {
     "name": "The Witcher .mdb (.mba) importer",
@@ -15,68 +17,12 @@ bl_info = {
 }
 
 
-@orientation_helper(axis_forward='Y', axis_up='Z')
-class ImportMDB(bpy.types.Operator, ImportHelper):
-    """Import from MDB file format (.mdb, .mba)"""
-    bl_idname = "import_scene.thewitcher_mdb"
-    bl_label = 'Import MDB'
-    bl_options = {'UNDO'}
-
-    filename_ext = ".mdb;.mba"
-    filter_glob: StringProperty(default="*.mdb;*.mba", options={'HIDDEN'})
-
-    base_path: StringProperty(
-        name="Extracted BIF base path",
-        description="The Wither extracted .bif path (contains textures00/ meshes00/)",
-        default="../",
-    )
-
-    def execute(self, context):
-        import importlib
-        import sys
-
-        def reloadClass(c):
-            mod = sys.modules.get(c.__module__)
-            importlib.reload(mod)
-            return mod.__dict__[c.__name__]
-
-        # imports to be updated
-        from . import file_utils, model_data, model_types, debug_utils
-        from . import import_mdb
-
-        importlib.reload(file_utils)
-        importlib.reload(model_data)
-        importlib.reload(model_types)
-        importlib.reload(debug_utils)
-        importlib.reload(import_mdb)
-
-        keywords = self.as_keywords(
-            ignore=(
-                "axis_forward",
-                "axis_up",
-                "filter_glob",
-            )
-        )
-
-        global_matrix = axis_conversion(from_forward=self.axis_forward, from_up=self.axis_up).to_4x4()
-        keywords["global_matrix"] = global_matrix
-
-        debug_utils.setDebug(bl_info['support'] == 'TESTING')
-        return import_mdb.load(self, context, **keywords)
-
-
 addon_keymaps = []
 
-classes = (
-    ImportMDB,
-)
-
-
-def menu_func_import(self, context):
-    self.layout.operator(ImportMDB.bl_idname, text="The Witcher (.mdb, .mba)")
-
 
 def register():
+    from .operators import classes, menu_func_import, ImportMDB
+
     for cls in classes:
         bpy.utils.register_class(cls)
 
@@ -92,6 +38,8 @@ def register():
 
 
 def unregister():
+    from .operators import classes, menu_func_import
+
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
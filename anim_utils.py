@@ -0,0 +1,199 @@
+# keyframe reduction and resampling on decoded controller key arrays (times (N,), values (N, c))
+from typing import List, Tuple
+
+import numpy as np
+
+from .model_data import ModelAnimationNode, ModelAnimationMeta
+
+
+#  Linear interpolation of the inner keys of segment [first, last]
+def _lerpSegment(times: np.ndarray, values: np.ndarray, first: int, last: int) -> np.ndarray:
+    duration = times[last] - times[first]
+    factors = (times[first:last + 1] - times[first]) / duration if duration > 0 else np.zeros(last - first + 1)
+    return values[first] + factors[:, None] * (values[last] - values[first])
+
+
+#  Spherical interpolation between two unit quaternions for an array of factors
+def _slerp(start: np.ndarray, end: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    dot = float(np.dot(start, end))
+    if dot < 0.0:
+        end, dot = -end, -dot
+    if dot > 0.9995:  # nearly parallel, normalized lerp is accurate enough
+        result = start + factors[:, None] * (end - start)
+        return result / np.linalg.norm(result, axis=1, keepdims=True)
+
+    angle = np.arccos(dot)
+    sinAngle = np.sin(angle)
+    return (np.sin((1.0 - factors) * angle)[:, None] * start + np.sin(factors * angle)[:, None] * end) / sinAngle
+
+
+def _slerpSegment(times: np.ndarray, values: np.ndarray, first: int, last: int) -> np.ndarray:
+    duration = times[last] - times[first]
+    factors = (times[first:last + 1] - times[first]) / duration if duration > 0 else np.zeros(last - first + 1)
+    return _slerp(values[first], values[last], factors)
+
+
+def _distanceError(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    return np.linalg.norm(expected - actual, axis=1)
+
+
+#  Angle between unit quaternions, sign independent
+def _angleError(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    dot = np.abs(np.einsum('ij,ij->i', expected, actual))
+    return 2.0 * np.arccos(np.clip(dot, 0.0, 1.0))
+
+
+#  Keys of the same hemisphere as their predecessor, normalized
+def _continuousQuaternions(values: np.ndarray) -> np.ndarray:
+    values = values / np.linalg.norm(values, axis=1, keepdims=True)
+    signs = np.ones(len(values), dtype=values.dtype)
+    if len(values) > 1:
+        flips = np.einsum('ij,ij->i', values[:-1], values[1:]) < 0.0
+        signs[1:] = np.where(np.cumsum(flips) % 2 == 1, -1.0, 1.0)
+    return values * signs[:, None]
+
+
+#  Indices of the keys to keep so that interpolating between them stays within tolerance (Ramer-Douglas-Peucker)
+def _reduceKeys(times: np.ndarray, values: np.ndarray, tolerance: float, interpolate, error) -> np.ndarray:
+    keyCount = len(times)
+    keep = np.zeros(keyCount, dtype=bool)
+    keep[[0, -1]] = True
+
+    segments = [(0, keyCount - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        errors = error(interpolate(times, values, first, last), values[first:last + 1])
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            split = first + worst
+            keep[split] = True
+            segments.append((first, split))
+            segments.append((split, last))
+
+    return np.flatnonzero(keep)
+
+
+#  Single key if every key is within tolerance of the first one
+def _isConstant(values: np.ndarray, tolerance: float, error) -> bool:
+    return bool(np.all(error(np.broadcast_to(values[0], values.shape), values) <= tolerance))
+
+
+#  Uniform keys every 1 / framesPerSecond over the channel time range, last key kept
+def resampleTimes(times: np.ndarray, framesPerSecond: float) -> np.ndarray:
+    step = 1.0 / framesPerSecond
+    resampled = np.arange(times[0], times[-1], step, dtype=np.float32)
+    return np.append(resampled, np.float32(times[-1]))
+
+
+def resampleLinear(times: np.ndarray, values: np.ndarray, newTimes: np.ndarray) -> np.ndarray:
+    return np.stack([np.interp(newTimes, times, values[:, column]) for column in range(values.shape[1])], axis=1)
+
+
+def resampleQuaternions(times: np.ndarray, values: np.ndarray, newTimes: np.ndarray) -> np.ndarray:
+    values = _continuousQuaternions(values)
+    segments = np.clip(np.searchsorted(times, newTimes, side='right') - 1, 0, len(times) - 2)
+    durations = times[segments + 1] - times[segments]
+    factors = np.clip(np.divide(
+        newTimes - times[segments], durations, out=np.zeros(len(newTimes)), where=durations > 0
+    ), 0.0, 1.0)
+
+    start, end = values[segments], values[segments + 1]
+    dot = np.clip(np.einsum('ij,ij->i', start, end), -1.0, 1.0)
+    angle = np.arccos(dot)
+    sinAngle = np.sin(angle)
+    nearlyParallel = sinAngle < 1e-4
+    safeSin = np.where(nearlyParallel, 1.0, sinAngle)
+    startWeight = np.where(nearlyParallel, 1.0 - factors, np.sin((1.0 - factors) * angle) / safeSin)
+    endWeight = np.where(nearlyParallel, factors, np.sin(factors * angle) / safeSin)
+    result = startWeight[:, None] * start + endWeight[:, None] * end
+    return result / np.linalg.norm(result, axis=1, keepdims=True)
+
+
+#  Reduced (times, values) of a position or scale channel
+def simplifyLinearChannel(
+    times: np.ndarray,
+    values: np.ndarray,
+    tolerance: float,
+    framesPerSecond: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    if len(times) < 2:
+        return times, values
+    if framesPerSecond > 0:
+        newTimes = resampleTimes(times, framesPerSecond)
+        times, values = newTimes, resampleLinear(times, values, newTimes).astype(values.dtype)
+    if _isConstant(values, tolerance, _distanceError):
+        return times[:1], values[:1]
+
+    kept = _reduceKeys(times, values, tolerance, _lerpSegment, _distanceError)
+    return times[kept], values[kept]
+
+
+#  Reduced (times, values) of a rotation channel, tolerance in radians
+def simplifyRotationChannel(
+    times: np.ndarray,
+    values: np.ndarray,
+    tolerance: float,
+    framesPerSecond: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    if len(times) < 2:
+        return times, values
+    if framesPerSecond > 0:
+        newTimes = resampleTimes(times, framesPerSecond)
+        times, values = newTimes, resampleQuaternions(times, values, newTimes).astype(values.dtype)
+    values = _continuousQuaternions(values)
+    if _isConstant(values, tolerance, _angleError):
+        return times[:1], values[:1]
+
+    kept = _reduceKeys(times, values, tolerance, _slerpSegment, _angleError)
+    return times[kept], values[kept]
+
+
+#  Simplifies every channel of the node tree in place, returns (key count before, key count after)
+def simplifyAnimationNode(
+    node: ModelAnimationNode,
+    positionTolerance: float,
+    rotationTolerance: float,
+    scaleTolerance: float,
+    framesPerSecond: float = 0.0
+) -> Tuple[int, int]:
+    before, after = 0, 0
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.children)
+
+        before += node.keyCount
+        node.positionTime, node.position = simplifyLinearChannel(
+            node.positionTime, node.position, positionTolerance, framesPerSecond
+        )
+        node.rotationTime, node.rotation = simplifyRotationChannel(
+            node.rotationTime, node.rotation, rotationTolerance, framesPerSecond
+        )
+        node.scaleTime, node.scale = simplifyLinearChannel(
+            node.scaleTime, node.scale, scaleTolerance, framesPerSecond
+        )
+        after += node.keyCount
+
+    return before, after
+
+
+#  Simplifies every decoded clip, returns (key count before, key count after)
+def simplifyAnimations(
+    animations: List[ModelAnimationMeta],
+    positionTolerance: float,
+    rotationTolerance: float,
+    scaleTolerance: float,
+    framesPerSecond: float = 0.0
+) -> Tuple[int, int]:
+    before, after = 0, 0
+    for animation in animations:
+        if not animation.isLoaded:
+            continue
+        animationBefore, animationAfter = simplifyAnimationNode(
+            animation.animationNode, positionTolerance, rotationTolerance, scaleTolerance, framesPerSecond
+        )
+        before += animationBefore
+        after += animationAfter
+    return before, after
@@ -0,0 +1,232 @@
+#  read access to the game archives without extracting them: KEY files index the resources (name, type -> BIF, slot),
+#  BIF files are memory mapped and every resource is served as a zero-copy slice of its mapping
+#  (layouts as read by xoreos, src/aurora/keyfile.cpp and biffile.cpp)
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .debug_utils import debugPrint as print
+from .file_utils import FileWrapper
+from .session_cache import getCache
+
+# Aurora resource type ids of the files the importer reads
+RESOURCE_TYPES = {
+    'tga': 3,
+    'txi': 2022,
+    'dds': 2033,
+    'mdb': 4000,
+}
+_RESOURCE_EXTENSIONS = {typeId: extension for extension, typeId in RESOURCE_TYPES.items()}
+
+_KEY_SIGNATURES = (b'KEY V1  ', b'KEY V1.1')
+_BIF_SIGNATURES = (b'BIFFV1  ', b'BIFFV1.1')
+
+# signature, bif count, resource count, file table offset, resource table offset (build date and reserved skipped)
+_KEY_HEADER = struct.Struct('<8sIIII')
+# signature, variable resource count, fixed resource count, variable resource table offset
+_BIF_HEADER = struct.Struct('<8sIII')
+
+# file table: size, name offset, name size (u16 + drives in V1, u32 in V1.1)
+_KEY_FILE_DTYPES = {
+    b'KEY V1  ': np.dtype([('size', '<u4'), ('nameOffset', '<u4'), ('nameSize', '<u2'), ('drives', '<u2')]),
+    b'KEY V1.1': np.dtype([('size', '<u4'), ('nameOffset', '<u4'), ('nameSize', '<u4')]),
+}
+# resource table: the bif index is the top 12 bits of id in V1 and of the extra flags in V1.1
+_KEY_RESOURCE_DTYPES = {
+    b'KEY V1  ': np.dtype([('name', 'S16'), ('type', '<u2'), ('id', '<u4')]),
+    b'KEY V1.1': np.dtype([('name', 'S16'), ('type', '<u2'), ('id', '<u4'), ('flags', '<u4')]),
+}
+_BIF_RESOURCE_DTYPES = {
+    b'BIFFV1  ': np.dtype([('id', '<u4'), ('offset', '<u4'), ('size', '<u4'), ('type', '<u4')]),
+    b'BIFFV1.1': np.dtype([('id', '<u4'), ('flags', '<u4'), ('offset', '<u4'), ('size', '<u4'), ('type', '<u4')]),
+}
+
+
+#  Path of relativePath under directory, components matched case insensitively when the exact path does not exist
+def _resolvePath(directory: str, relativePath: str) -> Optional[str]:
+    path = os.path.join(directory, *relativePath.split('/'))
+    if os.path.isfile(path):
+        return path
+
+    path = directory
+    for component in relativePath.split('/'):
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return None
+        match = next((name for name in names if name.lower() == component.lower()), None)
+        if match is None:
+            return None
+        path = os.path.join(path, match)
+    return path if os.path.isfile(path) else None
+
+
+# memory mapped BIF archive, the resource table is decoded once
+class BifArchive(object):
+    def __init__(self, path: str):
+        super(object, self).__init__()
+        self.path = path
+        with open(path, "rb") as file:
+            self.content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        signature, variableCount, fixedCount, offsetTable = _BIF_HEADER.unpack_from(self.content, 0)
+        if signature not in _BIF_SIGNATURES:
+            raise Exception('BIF V1 or V1.1 expected, got {!r} in {}'.format(signature, path))
+        if fixedCount != 0:
+            raise Exception('Fixed resources are not supported, {} found in {}'.format(fixedCount, path))
+
+        table = np.frombuffer(
+            self.content, dtype=_BIF_RESOURCE_DTYPES[signature], count=variableCount, offset=offsetTable
+        )
+        self.offsets = table['offset'].astype(np.int64)
+        self.sizes = table['size'].astype(np.int64)
+
+    def getData(self, resourceIndex: int) -> memoryview:
+        offset = int(self.offsets[resourceIndex])
+        return memoryview(self.content)[offset:offset + int(self.sizes[resourceIndex])]
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__name__, self.path)
+
+
+# resource of a BIF archive, its data is a read-only view on the archive mapping
+class ArchiveResource(object):
+    def __init__(self,
+                 archiveDirectory: str,
+                 name: str,
+                 typeId: int,
+                 archive: BifArchive,
+                 resourceIndex: int
+                 ):
+        super(object, self).__init__()
+        self.archiveDirectory = archiveDirectory
+        self.name = name
+        self.typeId = typeId
+        self.archive = archive
+        self.resourceIndex = resourceIndex
+
+    @property
+    def extension(self) -> str:
+        return _RESOURCE_EXTENSIONS.get(self.typeId, str(self.typeId))
+
+    @property
+    def fileName(self) -> str:
+        return "{}.{}".format(self.name, self.extension)
+
+    @property
+    def size(self) -> int:
+        return int(self.archive.sizes[self.resourceIndex])
+
+    @property
+    def data(self) -> memoryview:
+        return self.archive.getData(self.resourceIndex)
+
+    def openWrapper(self) -> FileWrapper:
+        return FileWrapper(self.data)
+
+    # pickled as a lookup, the mapping is reopened (once per session) by the receiving process
+    def __reduce__(self):
+        return findArchiveResource, (self.archiveDirectory, self.name, self.typeId)
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__name__, self.fileName)
+
+
+# every resource indexed by the KEY files of a folder, later KEY files (patches) override the earlier ones
+class ResourceProvider(object):
+    def __init__(self, archiveDirectory: str):
+        super(object, self).__init__()
+        self.archiveDirectory = archiveDirectory
+        self.resources: Dict[Tuple[str, int], Tuple[str, int]] = {}  # (name, type) -> (bif path, resource index)
+        self.archives: Dict[str, BifArchive] = {}
+
+        for keyPath in getKeyPaths(archiveDirectory):
+            self.readKey(keyPath)
+        print('archive index', archiveDirectory=archiveDirectory, resources=len(self.resources))
+
+    def readKey(self, keyPath: str):
+        with open(keyPath, "rb") as file:
+            content = file.read()
+
+        signature, bifCount, resourceCount, offsetFiles, offsetResources = _KEY_HEADER.unpack_from(content, 0)
+        if signature not in _KEY_SIGNATURES:
+            raise Exception('KEY V1 or V1.1 expected, got {!r} in {}'.format(signature, keyPath))
+
+        keyDirectory = os.path.dirname(keyPath)
+        bifPaths = []
+        for entry in np.frombuffer(content, dtype=_KEY_FILE_DTYPES[signature], count=bifCount, offset=offsetFiles):
+            nameOffset, nameSize = int(entry['nameOffset']), int(entry['nameSize'])
+            name = content[nameOffset:nameOffset + nameSize].split(b'\x00')[0].decode('ascii')
+            name = name.replace('\\', '/').lstrip('/')
+            path = _resolvePath(keyDirectory, name) or _resolvePath(os.path.dirname(keyDirectory), name)
+            if path is None:
+                print('bif not found', key=keyPath, name=name)
+            bifPaths.append(path)
+
+        table = np.frombuffer(
+            content, dtype=_KEY_RESOURCE_DTYPES[signature], count=resourceCount, offset=offsetResources
+        )
+        bifIndices = (table['flags'] if 'flags' in table.dtype.names else table['id']) >> 20
+        resourceIndices = table['id'] & 0xFFFFF
+        for name, typeId, bifIndex, resourceIndex in zip(
+            table['name'].tolist(), table['type'].tolist(), bifIndices.tolist(), resourceIndices.tolist()
+        ):
+            if bifIndex >= len(bifPaths) or bifPaths[bifIndex] is None:
+                continue
+            name = name.split(b'\x00')[0].decode('ascii', 'ignore').lower()
+            self.resources[(name, typeId)] = (bifPaths[bifIndex], resourceIndex)
+
+    def getArchive(self, path: str) -> BifArchive:
+        archive = self.archives.get(path)
+        if archive is None:
+            archive = self.archives[path] = BifArchive(path)
+        return archive
+
+    #  First resource named name with one of the extensions (in that order)
+    def find(self, name: str, extensions: Sequence[str]) -> Optional[ArchiveResource]:
+        name = name.lower()
+        for extension in extensions:
+            typeId = RESOURCE_TYPES.get(extension)
+            location = self.resources.get((name, typeId))
+            if location is not None:
+                return ArchiveResource(
+                    self.archiveDirectory, name, typeId, self.getArchive(location[0]), location[1]
+                )
+        return None
+
+    # pickled as a lookup, the receiving process builds (or reuses) its own index
+    def __reduce__(self):
+        return getResourceProvider, (self.archiveDirectory,)
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__name__, self.archiveDirectory)
+
+
+#  KEY files of a folder, sorted by name (main before patch)
+def getKeyPaths(archiveDirectory: str) -> List[str]:
+    try:
+        names = os.listdir(archiveDirectory)
+    except OSError:
+        return []
+    return [os.path.join(archiveDirectory, name) for name in sorted(names, key=str.lower)
+            if name.lower().endswith('.key')]
+
+
+#  Resource index of a folder, built once per session and rebuilt when its KEY files change
+def getResourceProvider(archiveDirectory: str) -> ResourceProvider:
+    key = os.path.normcase(os.path.abspath(archiveDirectory))
+    stamp = tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in getKeyPaths(archiveDirectory))
+    cached = getCache('resourceProviders').get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    provider = ResourceProvider(archiveDirectory)
+    getCache('resourceProviders')[key] = (stamp, provider)
+    return provider
+
+
+def findArchiveResource(archiveDirectory: str, name: str, typeId: int) -> Optional[ArchiveResource]:
+    return getResourceProvider(archiveDirectory).find(name, [_RESOURCE_EXTENSIONS[typeId]])
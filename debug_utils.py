@@ -1,22 +1,28 @@
 import datetime
+import threading
 
 global G_DEBUG
-global G_DEPTH
+
+G_DEBUG = False
+
+# indent depth per thread, parsing may run in a worker thread while Blender data is built in the main one
+_LOCAL = threading.local()
+
+
+def getDepth() -> int:
+    return getattr(_LOCAL, 'depth', 0)
 
 
 def setDepth(depth: int):
-    global G_DEPTH
-    G_DEPTH = int(depth)
+    _LOCAL.depth = int(depth)
 
 
 def increaseDepth():
-    global G_DEPTH
-    G_DEPTH += 1
+    _LOCAL.depth = getDepth() + 1
 
 
 def decreaseDepth():
-    global G_DEPTH
-    G_DEPTH -= 1
+    _LOCAL.depth = getDepth() - 1
 
 
 def setDebug(debug: bool):
@@ -26,12 +32,12 @@ def setDebug(debug: bool):
 
 def debugPrint(*args, **kwargs):
     global G_DEBUG
-    global G_DEPTH
     if G_DEBUG:
+        depth = getDepth()
         currentTime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f")
         print(
             f"[{currentTime[:-3]}] ",
-            '--' * G_DEPTH + ('> ' if G_DEPTH > 0 else ''),
+            '--' * depth + ('> ' if depth > 0 else ''),
             ', '.join(map(lambda arg: str(arg), args)) if len(args) > 0 else '',
             ' | ' if len(args) > 0 and len(kwargs) > 0 else '',
             ' '.join([f'{key}: {value},' for key, value in kwargs.items()])[:-1] if len(kwargs) > 0 else '',
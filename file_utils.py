@@ -1,21 +1,61 @@
+import mmap
 import struct
-from functools import reduce
+import sys
+from collections import namedtuple
+
+import numpy as np
 
 from .model_data import ModelData
-from typing import Callable
-from typing.io import BinaryIO
+from typing import BinaryIO, Callable, Sequence, Tuple
+
+
+_NON_ASCII = bytes(range(0x80, 0x100))
+_STRING_TABLE_LIMIT = 1 << 16
+
+# raw bytes -> interned string, so the same bone/texture name is decoded once and shared by every node
+_STRING_TABLE = {}
 
 
 # simple method to read string from something like 0x[ASCII]dcdcdcdcdc...00
-def _dataToString(data):
-    return reduce(
-        lambda acc, next: acc + next.decode('utf-8') if next != b'\xdc' and next.isascii() else acc, data, ""
-    )
+# (everything past the first null is garbage, 0xdc padding and other non-ascii bytes are dropped)
+def _dataToString(data) -> str:
+    data = bytes(data)
+    end = data.find(b'\x00')
+    if end >= 0:
+        data = data[:end]
+
+    string = _STRING_TABLE.get(data)
+    if string is None:
+        if len(_STRING_TABLE) >= _STRING_TABLE_LIMIT:
+            _STRING_TABLE.clear()
+        string = _STRING_TABLE[data] = sys.intern(data.translate(None, _NON_ASCII).decode('ascii'))
+    return string
+
+
+def clearStringTable():
+    _STRING_TABLE.clear()
+
+
+_UINT32 = struct.Struct("<I")
+_UINT16 = struct.Struct("<H")
+_UBYTE = struct.Struct("<B")
+_INT32 = struct.Struct("<i")
+_INT16 = struct.Struct("<h")
+_BYTE = struct.Struct("<b")
+_FLOAT32 = struct.Struct("<f")
+
+_UINT32_DTYPE = np.dtype("<u4")
+_UINT16_DTYPE = np.dtype("<u2")
+_UBYTE_DTYPE = np.dtype("u1")
+_INT32_DTYPE = np.dtype("<i4")
+_INT16_DTYPE = np.dtype("<i2")
+_FLOAT32_DTYPE = np.dtype("<f4")
 
 
 # easier to sync code with RedTools
+# content may be bytes, a memoryview or a read-only mmap, values are decoded in place with unpack_from
 class FileWrapper(object):
-    def __init__(self, content: bytes):
+    def __init__(self, content):
         super(object, self).__init__()
         self.content = content
         self.offset = 0
@@ -25,66 +65,163 @@ class FileWrapper(object):
         self.offset = self.offset + offset if relative else offset
 
     def readUInt32(self):
-        data = struct.unpack("I", self.content[self.offset:self.offset + 4])[0]
-        self.seek(4, relative=True)
+        data = _UINT32.unpack_from(self.content, self.offset)[0]
+        self.offset += 4
         return data
 
     def readUInt16(self):
-        data = struct.unpack("H", self.content[self.offset:self.offset + 2])[0]
-        self.seek(2, relative=True)
+        data = _UINT16.unpack_from(self.content, self.offset)[0]
+        self.offset += 2
         return data
 
     def readUByte(self):
-        data = struct.unpack("B", self.content[self.offset:self.offset + 1])[0]
-        self.seek(1, relative=True)
+        data = _UBYTE.unpack_from(self.content, self.offset)[0]
+        self.offset += 1
         return data
 
     def readInt32(self):
-        data = struct.unpack("i", self.content[self.offset:self.offset + 4])[0]
-        self.seek(4, relative=True)
+        data = _INT32.unpack_from(self.content, self.offset)[0]
+        self.offset += 4
         return data
 
     def readInt16(self):
-        data = struct.unpack("h", self.content[self.offset:self.offset + 2])[0]
-        self.seek(2, relative=True)
+        data = _INT16.unpack_from(self.content, self.offset)[0]
+        self.offset += 2
         return data
 
     def readByte(self):
-        data = struct.unpack("b", self.content[self.offset:self.offset + 1])[0]
-        self.seek(1, relative=True)
+        data = _BYTE.unpack_from(self.content, self.offset)[0]
+        self.offset += 1
         return data
 
     def readFloat32(self):
-        data = struct.unpack("f", self.content[self.offset:self.offset + 4])[0]
-        self.seek(4, relative=True)
+        data = _FLOAT32.unpack_from(self.content, self.offset)[0]
+        self.offset += 4
         return data
 
     def readString(self, size: int):
-        data = _dataToString(struct.unpack("c" * size, self.content[self.offset:self.offset + size]))
+        data = _dataToString(self.content[self.offset:self.offset + size])
         self.seek(size, relative=True)
         return data
 
     def readStringUntilNull(self):
-        data = []
+        end = self._findNull(self.offset)
+        data = _dataToString(self.content[self.offset:end])
+        self.seek(end + 1)
+        return data
+
+    # offset of the first null at or after start (end of content if there is none)
+    def _findNull(self, start: int):
+        find = getattr(self.content, 'find', None)  # bytes and mmap, memoryview has no find
+        if find is not None:
+            end = find(b'\x00', start)
+            return end if end >= 0 else len(self.content)
+
+        end = start
+        while end < len(self.content):
+            chunk = bytes(self.content[end:end + 256])
+            found = chunk.find(b'\x00')
+            if found >= 0:
+                return end + found
+            end += len(chunk)
+        return len(self.content)
+
+    # bulk readers, one frombuffer over the content (no copy, arrays are read-only views)
+    def _readTypedArray(self, dtype: np.dtype, count: int):
+        data = np.frombuffer(self.content, dtype=dtype, count=count, offset=self.offset)
+        self.offset += dtype.itemsize * count
+        return data
+
+    def readUInt32Array(self, count: int):
+        return self._readTypedArray(_UINT32_DTYPE, count)
+
+    def readUInt16Array(self, count: int):
+        return self._readTypedArray(_UINT16_DTYPE, count)
+
+    def readUByteArray(self, count: int):
+        return self._readTypedArray(_UBYTE_DTYPE, count)
 
-        counter = 0
-        while True:
-            tempChar = struct.unpack("c", self.content[self.offset + counter:self.offset + counter + 1])[0]
-            data.append(tempChar)
-            counter += 1
-            if tempChar == b'\x00':
-                break
+    def readInt32Array(self, count: int):
+        return self._readTypedArray(_INT32_DTYPE, count)
 
-        self.seek(counter, relative=True)
-        return _dataToString(data)
+    def readInt16Array(self, count: int):
+        return self._readTypedArray(_INT16_DTYPE, count)
 
+    def readFloat32Array(self, count: int):
+        return self._readTypedArray(_FLOAT32_DTYPE, count)
+
+    # records of a structured dtype (fields may skip bytes through offsets/itemsize)
+    def readStructArray(self, dtype: np.dtype, count: int):
+        return self._readTypedArray(dtype, count)
+
+    # decode a whole StructLayout at once
+    def readLayout(self, layout: 'StructLayout'):
+        data = layout.unpackFrom(self.content, self.offset)
+        self.offset += layout.size
+        return data
+
+    # release the mapping (if any), wrapper must not be used afterwards
+    def close(self):
+        if isinstance(self.content, mmap.mmap):
+            try:
+                self.content.close()
+            except BufferError:
+                pass  # arrays still point into the mapping, it is released together with them
+        self.content = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # mapped = True maps the file instead of reading it, nothing is copied until it is actually read
     @classmethod
-    def fromFile(cls, file: BinaryIO):
-        instance = cls(file.read())
+    def fromFile(cls, file: BinaryIO, mapped: bool = False):
+        content = None
+        if mapped:
+            try:
+                content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                pass  # empty or unmappable file (pipe, archive member...), fallback to plain read
+
+        instance = cls(content if content is not None else file.read())
         file.close()
         return instance
 
 
+# declarative binary layout compiled once into a single struct.Struct
+# fields are (name, format[, converter]), name None marks skipped bytes;
+# converter gets the value (or the tuple of values for multi-value formats like '3f')
+class StructLayout(object):
+    def __init__(self, name: str, fields: Sequence[Tuple]):
+        super(object, self).__init__()
+        self.name = name
+        self.struct = struct.Struct('<' + ''.join(field[1] for field in fields))
+        self.size = self.struct.size
+        self.record = namedtuple(name, [field[0] for field in fields if field[0] is not None])
+
+        self.plan = []  # (first value, value count, converter) for each record field
+        valueIndex = 0
+        for field in fields:
+            fieldName, fieldFormat = field[:2]
+            valueCount = len(struct.Struct('<' + fieldFormat).unpack(bytes(struct.calcsize('<' + fieldFormat))))
+            if fieldName is not None:
+                self.plan.append((valueIndex, valueCount, field[2] if len(field) > 2 else None))
+            valueIndex += valueCount
+
+    def unpackFrom(self, buffer, offset: int = 0):
+        values = self.struct.unpack_from(buffer, offset)
+        fields = []
+        for first, count, converter in self.plan:
+            value = values[first] if count == 1 else values[first:first + count]
+            fields.append(converter(value) if converter is not None else value)
+        return self.record._make(fields)
+
+    def __repr__(self) -> str:
+        return "{}({!r}, size={})".format(self.__class__.__name__, self.name, self.size)
+
+
 # array header containing its size and elements
 class ArrayDefinition(object):
     def __init__(self, firstElemOffset: int, nbUsedEntries: int, nbAllocatedEntries: int):
@@ -105,8 +242,21 @@ class ArrayDefinition(object):
         )
 
 
+# primitive readers which have a bulk counterpart
+_BULK_READERS = {
+    FileWrapper.readUInt32: FileWrapper.readUInt32Array,
+    FileWrapper.readUInt16: FileWrapper.readUInt16Array,
+    FileWrapper.readUByte: FileWrapper.readUByteArray,
+    FileWrapper.readInt32: FileWrapper.readInt32Array,
+    FileWrapper.readInt16: FileWrapper.readInt16Array,
+    FileWrapper.readFloat32: FileWrapper.readFloat32Array,
+}
+
+
 # read array using its definition
 # (all arrays' contents start globally @offsetModelData)
+# primitive delegates (wrapper.readFloat32, wrapper.readUByte...) are read in bulk and give a numpy array,
+# any other delegate gives a list
 def readArray(
     wrapper: FileWrapper,
     modelData: ModelData,
@@ -115,9 +265,13 @@ def readArray(
 ):
     back = wrapper.offset
     wrapper.seek(modelData.offsetModelData + definition.firstElemOffset)
-    arrayData = [
-        wrapperReaderDelegate() for i in range(definition.nbUsedEntries)
-    ]
+    bulkReader = _BULK_READERS.get(getattr(wrapperReaderDelegate, '__func__', None))
+    if bulkReader is not None:
+        arrayData = bulkReader(wrapper, definition.nbUsedEntries)
+    else:
+        arrayData = [
+            wrapperReaderDelegate() for i in range(definition.nbUsedEntries)
+        ]
     wrapper.seek(back)
 
     return arrayData
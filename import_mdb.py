@@ -1,1323 +1,930 @@
 # nk2's craft made of plasticine (level: Kindergarten, 1 year)
 # heavily based on https://github.com/JLouis-B/RedTools/blob/master/W2ENT_QT/IO_MeshLoader_WitcherMDL.cpp
+#  Blender side of the importer: turns what mdb_parser produced into Blender data
+import hashlib
+import multiprocessing
 import os
-from collections import OrderedDict
-from itertools import chain
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
 
 import bpy
-from bpy_extras.io_utils import unpack_list
-from bpy_extras.object_utils import object_data_add
-from typing import List, Optional, Tuple
+
+import numpy as np
 
 from bpy_types import Object, Mesh
-from mathutils import Matrix, Vector, Quaternion, Color
+from mathutils import Matrix
 
-from .debug_utils import debugPrint as print, setDepth as debugSetDepth, increaseDepth as debugIncreaseDepth, \
-    decreaseDepth as debugDecreaseDepth
-from .model_types import ControllerType, NodeType
-from .model_data import ModelData, StaticControllersData, ControllersData, ModelMesh, ModelJoint, _defaultMatrix, \
-    ModelBoundingBox, ModelMaterial, ModelMeshBuffer, ModelVertex, ModelTextureLayer, ModelWeight, ModelBoundingSphere, \
-    ModelAnimationNode, ModelPositionKey, ModelRotationKey, ModelScaleKey, ModelAnimationMeta
-from .file_utils import FileWrapper, ArrayDefinition, readArray
+from .debug_utils import debugPrint as print, setDepth as debugSetDepth
+from .model_data import ModelData, ModelMesh, ModelJoint, _defaultMatrix, ModelMaterial, ModelMeshBuffer, \
+    ModelAnimationNode, ModelMaterialType, quaternionToMatrix, normalizeQuaternion
+from .mdb_parser import findTextureImage, parse_mdb_resource, ModelStream
+from .archive_utils import ArchiveResource
+from .parse_cache import parseModel
+from .anim_utils import simplifyAnimations
+from .session_cache import getCache
+from .transport_utils import parseForTransport, unpackModel, releaseModel, discardModel
 
 
-#  Function that reads all controllers in mdb-eqsue format
-def readNodeControllers(
-    wrapper: FileWrapper,
-    modelData: ModelData,
-    controllerKeyDef: ArrayDefinition,
-    controllerDataDef: ArrayDefinition
-):
-    debugIncreaseDepth()
-    controllers = ControllersData.default()
-    controllerData = readArray(wrapper, modelData, controllerDataDef, wrapper.readFloat32)
-    back = wrapper.offset
-
-    wrapper.seek(modelData.offsetModelData + controllerKeyDef.firstElemOffset)
-    for i in range(controllerKeyDef.nbUsedEntries):
-        controllerType = ControllerType(wrapper.readUInt32())
-        nbRows = wrapper.readInt16()
-        firstKeyIndex = wrapper.readInt16()
-        firstValueIndex = wrapper.readInt16()
-        nbColumns = wrapper.readUByte()
-
-        wrapper.seek(1, relative=True)
-        print('read node controller', type=controllerType)
-        if controllerType == ControllerType.ControllerPosition:
-            for j in range(nbRows):
-                offset = j * nbColumns
-                controllers.positionTime.append(controllerData[firstKeyIndex + j])
-                controllers.position.append(Vector((
-                    controllerData[offset + firstValueIndex],
-                    controllerData[offset + firstValueIndex + 1],
-                    controllerData[offset + firstValueIndex + 2]
-                )))
-        elif controllerType == ControllerType.ControllerOrientation:
-            for j in range(nbRows):
-                offset = j * nbColumns
-                controllers.rotationTime.append(controllerData[firstKeyIndex + j])
-                controllers.rotation.append(Quaternion((
-                    controllerData[offset + firstValueIndex],
-                    controllerData[offset + firstValueIndex + 1],
-                    controllerData[offset + firstValueIndex + 2],
-                    controllerData[offset + firstValueIndex + 3]
-                )))
-        elif controllerType == ControllerType.ControllerScale:
-            for j in range(nbRows):
-                offset = j * nbColumns
-                controllers.scaleTime.append(controllerData[firstKeyIndex + j])
-                controllers.scale.append(Vector((
-                    controllerData[offset + firstValueIndex],
-                    controllerData[offset + firstValueIndex],
-                    controllerData[offset + firstValueIndex]
-                )))
-        elif controllerType == ControllerType.ControllerSelfIllumColor:
-            for j in range(nbRows):
-                offset = j * nbColumns
-                controllers.selfIllumColorTime.append(controllerData[firstKeyIndex + j])
-                controllers.selfIllumColor.append(Color((
-                    controllerData[offset + firstValueIndex],
-                    controllerData[offset + firstValueIndex + 1],
-                    controllerData[offset + firstValueIndex + 2]
-                )))
-        elif controllerType == ControllerType.ControllerAlpha:
-            for j in range(nbRows):
-                offset = j * nbColumns
-                controllers.alphaTime.append(controllerData[firstKeyIndex + j])
-                controllers.alpha.append(
-                    controllerData[offset + firstValueIndex]
-                )
+# ---------------------------------------------------------------------
+# (bpy.data collection name, datablock name) of the datablocks created while recordDatablocks is active
+_RECORDED: Optional[List[Tuple[str, str]]] = None
 
-    wrapper.seek(back)
-    debugDecreaseDepth()
-    return controllers
 
+#  Records datablock as created by the current import (if one is recording), returns it
+def _created(collectionName: str, datablock):
+    if _RECORDED is not None:
+        _RECORDED.append((collectionName, datablock.name))
+    return datablock
 
-#  Function that wraps animation for static mesh (which has no animation, only first key)
-def getStaticNodeControllers(
-    wrapper: FileWrapper,
-    modelData: ModelData,
-    controllerKeyDef: ArrayDefinition,
-    controllerDataDef: ArrayDefinition
-):
-    controllersData = StaticControllersData.default()
-    controllers = readNodeControllers(wrapper, modelData, controllerKeyDef, controllerDataDef)
-    if len(controllers.position) > 0:
-        controllersData.position = controllers.position[0]
-    if len(controllers.rotation) > 0:
-        controllersData.rotation = controllers.rotation[0]
-    if len(controllers.scale) > 0:
-        controllersData.scale = controllers.scale[0]
-    if len(controllers.alpha) > 0:
-        controllersData.alpha = controllers.alpha[0]
-    if len(controllers.selfIllumColor) > 0:
-        controllersData.selfIllumColor = controllers.selfIllumColor[0]
-    controllersData.computeLocalTransform()
-
-    return controllersData
-
-
-def getTexture(
-    modelData: ModelData,
-    name: str
-):
-    try:
-        return next(
-            list(filter(
-                lambda path: os.path.exists(path),
-                chain.from_iterable(map(
-                    lambda ext: list(map(
-                        lambda folder: os.path.join(modelData.baseDirectory, folder, '{}.{}'.format(name, ext)),
-                        ['meshes00', 'textures00', 'textures01']
-                    )),
-                    ['dds', 'txi', 'jpg', 'jpeg']
-                ))
-            ))
-        )
-    except StopIteration:
-        return None
-
-
-def readTextures(
-    wrapper: FileWrapper,
-    modelData: ModelData
-):
-    wrapper.seek(
-        modelData.offsetRawData + modelData.offsetTexData
-            if modelData.fileVersion == 133
-            else modelData.offsetTexData + modelData.offsetTextureInfo
-    )
 
-    textureCount = wrapper.readUInt32()
-    offTexture = wrapper.readUInt32()
+#  Datablocks created inside the block are appended to recorded, so an import can be rolled back precisely
+@contextmanager
+def recordDatablocks(recorded: List[Tuple[str, str]]):
+    global _RECORDED
+    previous, _RECORDED = _RECORDED, recorded
+    try:
+        yield
+    finally:
+        _RECORDED = previous
+
+
+#  Removes recorded datablocks, last created first (objects before the data they use)
+def removeDatablocks(recorded: List[Tuple[str, str]]):
+    for collectionName, name in reversed(recorded):
+        collection = getattr(bpy.data, collectionName)
+        datablock = collection.get(name)
+        if datablock is not None:
+            collection.remove(datablock)
+    recorded.clear()
+
+
+#  Edit mode on obj alone: the user's active object, selection and mode are put back afterwards
+#  (the import may run from a modal tick while the user edits other objects)
+@contextmanager
+def editModeOnly(context, obj: Object):
+    viewLayer = context.view_layer
+    active = viewLayer.objects.active
+    mode = active.mode if active is not None else 'OBJECT'
+    selected = [selectedObject for selectedObject in viewLayer.objects if selectedObject.select_get()]
+
+    if mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for selectedObject in selected:
+        selectedObject.select_set(False)
+    obj.select_set(True)
+    viewLayer.objects.active = obj
+    bpy.ops.object.mode_set(mode='EDIT')
+    try:
+        yield
+    finally:
+        bpy.ops.object.mode_set(mode='OBJECT')
+        obj.select_set(False)
+        for selectedObject in selected:
+            selectedObject.select_set(True)
+        viewLayer.objects.active = active
+        if mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode=mode)
 
-    materialContent = ""
-    for i in range(textureCount):
-        line = wrapper.readStringUntilNull()
-        materialContent += "{}\n".format(line)
 
-    return ModelMaterial.fromString(materialContent)
+# ---------------------------------------------------------------------
+# -----------------------------BLENDER---------------------------------
+# ---------------------------------------------------------------------
+# ---------------------------------------------------------------------
 
 
-def evaluateTextures(
-    modelData: ModelData,
-    material: ModelMaterial,
-    textureCount: int,
-    staticTextureStrings: Optional[List[str]],
-    tVertsArrayDefinitions: List[ArrayDefinition],
-    lightMapDayNight: bool,
-    lightMapName: str
+#  Builds the mesh straight from the buffer arrays (no from_pydata, no per vertex Python objects),
+#  vertex normals become custom split normals as Blender recomputes plain ones on update
+def wrapMeshToBlender(
+    mesh: Mesh,
+    meshBuffer: ModelMeshBuffer
 ):
-    material.textures = OrderedDict((
-        ('texture0', material.textures['texture0'] if 'texture0' in material.textures else ''),
-        ('texture1', material.textures['texture1'] if 'texture1' in material.textures else ''),
-        ('texture2', material.textures['texture2'] if 'texture2' in material.textures else ''),
-        ('texture3', material.textures['texture3'] if 'texture3' in material.textures else '')
-    ))
+    vertexCount, faceCount = meshBuffer.vertexCount, meshBuffer.faceCount
+    loopCount = faceCount * 3
 
-    for t in range(textureCount):
-        textureType = 'texture{}'.format(t)
-        if material.textures[textureType] == "" and staticTextureStrings is not None:
-            material.textures[textureType] = staticTextureStrings[t]
+    mesh.vertices.add(vertexCount)
+    mesh.vertices.foreach_set('co', np.ascontiguousarray(meshBuffer.positions, dtype=np.float32).ravel())
 
-        if tVertsArrayDefinitions[t].nbUsedEntries == 0:
-            material.textures[textureType] = ""
+    mesh.loops.add(loopCount)
+    mesh.loops.foreach_set('vertex_index', np.ascontiguousarray(meshBuffer.indices, dtype=np.int32).ravel())
 
-        if material.textures[textureType] == "":
-            continue
+    mesh.polygons.add(faceCount)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, loopCount, 3, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set('loop_total', np.full(faceCount, 3, dtype=np.int32))
 
-        if lightMapDayNight and material.textures[textureType] == lightMapName:
-            if getTexture(modelData, material.textures[textureType] + "!d") is not None:  # dzien
-                material.textures[textureType] = material.textures[textureType] + "!d"
-            elif getTexture(modelData, material.textures[textureType] + "!r") is not None:  # rano
-                material.textures[textureType] = material.textures[textureType] + "!r"
-            elif getTexture(modelData, material.textures[textureType] + "!p") is not None:  # poludnie
-                material.textures[textureType] = material.textures[textureType] + "!p"
-            elif getTexture(modelData, material.textures[textureType] + "!w") is not None:  # wieczor
-                material.textures[textureType] = material.textures[textureType] + "!w"
-            elif getTexture(modelData, material.textures[textureType] + "!n") is not None:  # noc
-                material.textures[textureType] = material.textures[textureType] + "!n"
-            else:
-                material.textures[textureType] = ""
+    mesh.update(calc_edges=True)
 
+    if meshBuffer.normals is not None and faceCount > 0:
+        if bpy.app.version < (4, 1, 0):
+            mesh.use_auto_smooth = True
+        mesh.polygons.foreach_set('use_smooth', np.ones(faceCount, dtype=bool))
+        mesh.normals_split_custom_set_from_vertices(np.ascontiguousarray(meshBuffer.normals, dtype=np.float32))
 
-def readMeshNode(
-    wrapper: FileWrapper,
-    modelData: ModelData,
-    name: str
-):
-    debugIncreaseDepth()
-    wrapper.seek(8, relative=True)  # Function pointer
-    offMeshArrays = wrapper.readUInt32()
-
-    wrapper.seek(4, relative=True)  # Unknown
-    nodeBoundingBox = ModelBoundingBox(
-        min=Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        )),
-        max=Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        ))
-    )
 
-    wrapper.seek(28 + 4 + 16, relative=True)  # Unknown, fog scale, Unknown
-    nodeDiffuseColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    nodeAmbientColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    nodeSpecularColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    shininess = wrapper.readFloat32()
-    shadow = wrapper.readUInt32() == 1
-    beaming = wrapper.readUInt32() == 1
-    render = wrapper.readUInt32() == 1
-    transparencyHint = wrapper.readUInt32() == 1
-
-    wrapper.seek(4, relative=True)  # Unknown
-    textureStrings = list(map(
-        lambda textureString: "" if textureString == "NULL" else textureString,
-        [wrapper.readString(64) for i in range(4)]
-    ))
-    tileFade = wrapper.readUInt32() == 1
-    controlFade = wrapper.readByte() == 1
-    lightMapped = wrapper.readByte() == 1
-    rotateTexture = wrapper.readByte() == 1
-
-    wrapper.seek(1, relative=True)  # Unknown
-    transparencyShift = wrapper.readFloat32()
-    defaultRenderList = wrapper.readUInt32()
-    preserveVColors = wrapper.readUInt32()
-    fourCC = wrapper.readUInt32()
-
-    wrapper.seek(4, relative=True)  # Unknown
-    depthOffset = wrapper.readFloat32()
-    coronaCenterMult = wrapper.readFloat32()
-    fadeStartDistance = wrapper.readFloat32()
-    distFromScreenCenterFace = wrapper.readByte() == 1
-
-    wrapper.seek(3, relative=True)  # Unknown
-    enlargeStartDistance = wrapper.readFloat32()
-    affectedByWind = wrapper.readByte() == 1
-
-    wrapper.seek(3, relative=True)  # Unknown
-    dampFactor = wrapper.readFloat32()
-    blendGroup = wrapper.readUInt32()
-    dayNightLightMaps = wrapper.readByte() == 1
-    dayNightTransition = wrapper.readString(200)
-    ignoreHitCheck = wrapper.readByte() == 1
-    needsReflection = wrapper.readByte() == 1
-
-    wrapper.seek(1, relative=True)  # Unknown
-    reflectionPlaneNormal = [
-        wrapper.readFloat32() for i in range(3)
-    ]
-    reflectionPlaneDistance = wrapper.readFloat32()
-    fadeOnCameraCollision = wrapper.readByte() == 1
-    noSelfShadow = wrapper.readByte() == 1
-    isReflected = wrapper.readByte() == 1
-    onlyReflected = wrapper.readByte() == 1
-    lightMapName = wrapper.readString(64)
-    canDecal = wrapper.readByte() == 1
-    multiBillBoard = wrapper.readByte() == 1
-    ignoreLODReflection = wrapper.readByte() == 1
-    enableSpecular = wrapper.readByte() == 1
-    detailMapScape = wrapper.readFloat32()
-    modelData.offsetTextureInfo = wrapper.readUInt32()
-
-    wrapper.seek(modelData.offsetRawData + offMeshArrays)
-    wrapper.seek(4, relative=True)
-
-    vertexArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    normalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    tangentsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    biNormalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    tVertsArrayDefinitions = [
-        ArrayDefinition.fromWrapper(wrapper) for i in range(4)
-    ]
-    unknownArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    facesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+#  One UV layer per texture slot with UVs (named after the slot), V flipped to Blender's convention
+def wrapTCoordsToBlender(
+    mesh: Mesh,
+    meshBuffer: ModelMeshBuffer
+):
+    for channel, loopTCoords in meshBuffer.getLoopTCoords():
+        loopTCoords[:, 1] = 1.0 - loopTCoords[:, 1]
 
-    modelData.offsetTexData = wrapper.readUInt32() if modelData.fileVersion == 133 else modelData.offsetTexData
+        uvLayer = mesh.uv_layers.new(name='texture{}'.format(channel), do_init=False)
+        uvLayer.data.foreach_set('uv', loopTCoords.ravel())
 
-    if vertexArrayDefinition.nbUsedEntries == 0 or facesArrayDefinition.nbUsedEntries == 0:
-        debugDecreaseDepth()
-        return
 
-    material = readTextures(wrapper, modelData)
-    evaluateTextures(modelData, material, 4, textureStrings, tVertsArrayDefinitions, dayNightLightMaps, lightMapName)
-    material.setMaterialParameters(
-        diffuseColor=nodeDiffuseColor,
-        ambientColor=nodeAmbientColor,
-        specularColor=nodeSpecularColor,
-        shininess=shininess,
-        shadow=shadow,
-        beaming=beaming,
-        render=render,
-        transparencyHint=transparencyHint,
-        textureStrings=textureStrings,
-        tileFade=tileFade,
-        controlFade=controlFade,
-        lightMapped=lightMapped,
-        rotateTexture=rotateTexture,
-        transparencyShift=transparencyShift,
-        defaultRenderList=defaultRenderList,
-        preserveVColors=preserveVColors,
-        fourCC=fourCC,
-        depthOffset=depthOffset,
-        coronaCenterMult=coronaCenterMult,
-        fadeStartDistance=fadeStartDistance,
-        distFromScreenCenterFace=distFromScreenCenterFace,
-        enlargeStartDistance=enlargeStartDistance,
-        affectedByWind=affectedByWind,
-        dampFactor=dampFactor,
-        blendGroup=blendGroup,
-        dayNightLightMaps=dayNightLightMaps,
-        dayNightTransition=dayNightTransition,
-        ignoreHitCheck=ignoreHitCheck,
-        needsReflection=needsReflection,
-        reflectionPlaneNormal=reflectionPlaneNormal,
-        reflectionPlaneDistance=reflectionPlaneDistance,
-        fadeOnCameraCollision=fadeOnCameraCollision,
-        noSelfShadow=noSelfShadow,
-        isReflected=isReflected,
-        onlyReflected=onlyReflected,
-        lightMapName=lightMapName,
-        canDecal=canDecal,
-        multiBillBoard=multiBillBoard,
-        ignoreLODReflection=ignoreLODReflection,
-        detailMapScape=detailMapScape,
-        enableSpecular=enableSpecular
-    )
-    meshBuffer = ModelMeshBuffer(
-        name=name,
-        material=material,
-        boundingBox=nodeBoundingBox
-    )
-    meshBuffer.vertices = [
-        ModelVertex() for i in range(max(
-            vertexArrayDefinition.nbUsedEntries,
-            normalsArrayDefinition.nbUsedEntries,
-            tangentsArrayDefinition.nbUsedEntries,
-            biNormalsArrayDefinition.nbUsedEntries
-        ))
-    ]
+#  Hamilton product of (N, 4) w, x, y, z quaternion arrays
+def _multiplyQuaternions(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    aw, ax, ay, az = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    bw, bx, by, bz = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    return np.stack((
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    ), axis=1)
 
-    wrapper.seek(modelData.offsetRawData + vertexArrayDefinition.firstElemOffset)
-    for i in range(vertexArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].position = Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        ))
-        meshBuffer.vertices[i].color = Color((1.0, 1.0, 1.0))
-        meshBuffer.vertices[i].tCoords = Vector((0.0, 0.0))
-
-    wrapper.seek(modelData.offsetRawData + normalsArrayDefinition.firstElemOffset)
-    for i in range(normalsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].normal = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
 
-    wrapper.seek(modelData.offsetRawData + tangentsArrayDefinition.firstElemOffset)
-    for i in range(tangentsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].tangent = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
+#  Pose bone channels (data path, (N, c) values) of an animation node, relative to its joint rest pose
+def getPoseChannels(node: ModelAnimationNode):
+    joint = node.joint
+    w, x, y, z = normalizeQuaternion(joint.animatedRotation)
+    restInverse = (w, -x, -y, -z)
+    channels = []
 
-    wrapper.seek(modelData.offsetRawData + biNormalsArrayDefinition.firstElemOffset)
-    for i in range(biNormalsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].biNormal = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
+    if len(node.positionTime) > 0:
+        restPosition = np.array(joint.animatedPosition, dtype=np.float32)
+        location = (node.position - restPosition) @ quaternionToMatrix(restInverse).T.astype(np.float32)
+        channels.append(('location', node.positionTime, location))
 
-    wrapper.seek(modelData.offsetRawData + facesArrayDefinition.firstElemOffset)
-    for i in range(facesArrayDefinition.nbUsedEntries):
-        wrapper.seek(4 * 4 + 4, relative=True)
-        if modelData.fileVersion == 133:
-            wrapper.seek(3 * 4, relative=True)
+    if len(node.rotationTime) > 0:
+        rotation = node.rotation[:, [3, 0, 1, 2]]  # x, y, z, w -> w, x, y, z
+        rotation = rotation / np.linalg.norm(rotation, axis=1, keepdims=True)
+        restInverseArray = np.array(restInverse, dtype=np.float32).reshape(1, 4)
+        channels.append(('rotation_quaternion', node.rotationTime, _multiplyQuaternions(restInverseArray, rotation)))
 
-        meshBuffer.indices.append((
-            wrapper.readInt32(),
-            wrapper.readInt32(),
-            wrapper.readInt32()
-        ))
+    if len(node.scaleTime) > 0:
+        restScale = np.array(joint.animatedScale, dtype=np.float32)
+        restScale[restScale == 0.0] = 1.0
+        channels.append(('scale', node.scaleTime, node.scale / restScale))
 
-        if modelData.fileVersion == 133:
-            wrapper.seek(4, relative=True)
+    return channels
 
-    for t in range(len(material.textures)):
-        wrapper.seek(modelData.offsetRawData + tVertsArrayDefinitions[t].firstElemOffset)
-        for i in range(tVertsArrayDefinitions[t].nbUsedEntries):
-            meshBuffer.vertices[i].tCoords = Vector((
-                wrapper.readFloat32(),
-                wrapper.readFloat32()
-            ))
 
-    debugDecreaseDepth()
-    # TODO load custom materials based on textureStrings[0] (typically will be __shader__)
-    return meshBuffer
+_INTERPOLATION_LINEAR = 1  # index of 'LINEAR' in the keyframe interpolation enum
 
 
-def readTexturePaintNode(
-    wrapper: FileWrapper,
+#  Creates one F-curve per channel component, keys set in bulk
+def wrapChannelToBlender(
+    action,
+    groupName: str,
+    dataPath: str,
+    frames: np.ndarray,
+    values: np.ndarray
+):
+    keyCount = len(frames)
+    coordinates = np.empty((keyCount, 2), dtype=np.float32)
+    coordinates[:, 0] = frames
+    interpolations = np.full(keyCount, _INTERPOLATION_LINEAR, dtype=np.int32)
+
+    for index in range(values.shape[1]):
+        coordinates[:, 1] = values[:, index]
+        curve = action.fcurves.new(dataPath, index=index, action_group=groupName)
+        curve.keyframe_points.add(keyCount)
+        curve.keyframe_points.foreach_set('co', coordinates.ravel())
+        curve.keyframe_points.foreach_set('interpolation', interpolations)
+        curve.update()
+
+
+#  One action per decoded clip, targeting the pose bones named after the animated joints
+def wrapAnimationsToBlender(
+    context,
     modelData: ModelData,
-    name: str
+    modelMesh: ModelMesh
 ):
-    debugIncreaseDepth()
-    layersArrayDefinitions = ArrayDefinition.fromWrapper(wrapper)
-
-    wrapper.seek(28, relative=True)  # Unknown
-    offMeshArrays = wrapper.readUInt32()
-    sectorID0 = wrapper.readUInt32()
-    sectorID1 = wrapper.readUInt32()
-    sectorID2 = wrapper.readUInt32()
-    sectorID3 = wrapper.readUInt32()
-    nodeBoundingBox = ModelBoundingBox(
-        min=Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        )),
-        max=Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        ))
-    )
-    nodeDiffuseColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    nodeAmbientColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    nodeSpecularColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    shadow = wrapper.readUInt32() == 1
-    render = wrapper.readUInt32() == 1
-    tileFade = wrapper.readUInt32() == 1
-    controlFade = wrapper.readByte() == 1
-    lightMapped = wrapper.readByte() == 1
-    rotateTexture = wrapper.readByte() == 1
-
-    wrapper.seek(1, relative=True)  # Unknown
-    transparencyShift = wrapper.readFloat32()
-    defaultRenderList = wrapper.readUInt32()
-    fourCC = wrapper.readUInt32()
-
-    wrapper.seek(4, relative=True)  # Unknown
-    depthOffset = wrapper.readFloat32()
-    blendGroup = wrapper.readUInt32()
-    dayNightLightMaps = wrapper.readByte() == 1
-    dayNightTransition = wrapper.readString(200)
-    ignoreHitCheck = wrapper.readByte() == 1
-    needsReflection = wrapper.readByte() == 1
-
-    wrapper.seek(1, relative=True)  # Unknown
-    reflectionPlaneNormal = [
-        wrapper.readFloat32() for i in range(3)
-    ]
-    reflectionPlaneDistance = wrapper.readFloat32()
-    fadeOnCameraCollision = wrapper.readByte() == 1
-    noSelfShadow = wrapper.readByte() == 1
-    isReflected = wrapper.readByte() == 1
-
-    wrapper.seek(1, relative=True)  # Unknown
-    detailMapScape = wrapper.readFloat32()
-    onlyReflected = wrapper.readByte() == 1
-    lightMapName = wrapper.readString(64)
-    canDecal = wrapper.readByte() == 1
-    ignoreLODReflection = wrapper.readByte() == 1
-    enableSpecular = wrapper.readByte() == 1
-
-    wrapper.seek(modelData.offsetRawData + offMeshArrays)
-    wrapper.seek(4, relative=True)
-    vertexArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    normalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    tangentsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    biNormalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    tVertsArrayDefinitions = [
-        ArrayDefinition.fromWrapper(wrapper) for i in range(4)
-    ]
-    unknownArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    facesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    render = context.scene.render
+    framesPerSecond = render.fps / render.fps_base
+    timeScale = modelData.animationScale if modelData.animationScale > 0 else 1.0
 
-    if vertexArrayDefinition.nbUsedEntries == 0 or facesArrayDefinition.nbUsedEntries == 0:
-        debugDecreaseDepth()
-        return
+    actions = []
+    for animation in modelMesh.animations:
+        if not animation.isLoaded:
+            continue
 
-    textureLayers = []
-    for i in range(layersArrayDefinitions.nbUsedEntries):
-        wrapper.seek(modelData.offsetRawData + layersArrayDefinitions.firstElemOffset + i * 52)
-        textureLayer = ModelTextureLayer(hasTexture=wrapper.readByte() == 1)
+        print('wrap animation to blender', name=animation.name)
+        action = _created('actions', bpy.data.actions.new(name=animation.name))
+        action.use_fake_user = True
 
-        if not textureLayer.hasTexture:
-            continue
+        nodes = [animation.animationNode]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.children)
+            if node.joint is None:
+                continue
 
-        wrapper.seek(3 + 4, relative=True)  # Unknown, Offset to material
-        textureLayer.texture = wrapper.readString(32)
-        weightsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-        textureLayer.weights = readArray(wrapper, modelData, weightsArrayDefinition, wrapper.readFloat32)
-        textureLayers.append(textureLayer)
-
-    material = ModelMaterial(
-        textures=OrderedDict(('texture0', lightMapName)),
-        diffuseColor=nodeDiffuseColor,
-        ambientColor=nodeAmbientColor,
-        specularColor=nodeSpecularColor,
-        shadow=shadow,
-        render=render,
-        textureStrings=[],
-        tileFade=tileFade,
-        controlFade=controlFade,
-        lightMapped=lightMapped,
-        rotateTexture=rotateTexture,
-        transparencyShift=transparencyShift,
-        defaultRenderList=defaultRenderList,
-        fourCC=fourCC,
-        depthOffset=depthOffset,
-        blendGroup=blendGroup,
-        dayNightLightMaps=dayNightLightMaps,
-        dayNightTransition=dayNightTransition,
-        ignoreHitCheck=ignoreHitCheck,
-        needsReflection=needsReflection,
-        reflectionPlaneNormal=reflectionPlaneNormal,
-        reflectionPlaneDistance=reflectionPlaneDistance,
-        fadeOnCameraCollision=fadeOnCameraCollision,
-        noSelfShadow=noSelfShadow,
-        isReflected=isReflected,
-        onlyReflected=onlyReflected,
-        lightMapName=lightMapName,
-        canDecal=canDecal,
-        ignoreLODReflection=ignoreLODReflection,
-        detailMapScape=detailMapScape,
-        enableSpecular=enableSpecular
-    )
-    evaluateTextures(modelData, material, 1, None, tVertsArrayDefinitions, dayNightLightMaps, lightMapName)
-    meshBuffer = ModelMeshBuffer(
-        name=name,
-        material=material,
-        boundingBox=nodeBoundingBox,
-        textureLayers=textureLayers
-    )
-    meshBuffer.vertices = [
-        ModelVertex() for i in range(max(
-            vertexArrayDefinition.nbUsedEntries,
-            normalsArrayDefinition.nbUsedEntries,
-            tangentsArrayDefinition.nbUsedEntries,
-            biNormalsArrayDefinition.nbUsedEntries
-        ))
-    ]
+            bonePath = 'pose.bones["{}"].'.format(node.joint.name)
+            for dataPath, times, values in getPoseChannels(node):
+                frames = 1.0 + times * (timeScale * framesPerSecond)
+                wrapChannelToBlender(action, node.joint.name, bonePath + dataPath, frames, values)
 
-    wrapper.seek(modelData.offsetRawData + vertexArrayDefinition.firstElemOffset)
-    for i in range(vertexArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].position = Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        ))
-        meshBuffer.vertices[i].color = Color((1.0, 1.0, 1.0))
-        meshBuffer.vertices[i].tCoords = Vector((0.0, 0.0))
-
-    wrapper.seek(modelData.offsetRawData + normalsArrayDefinition.firstElemOffset)
-    for i in range(normalsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].normal = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
+        actions.append(action)
+    return actions
 
-    wrapper.seek(modelData.offsetRawData + tangentsArrayDefinition.firstElemOffset)
-    for i in range(tangentsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].tangent = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
 
-    wrapper.seek(modelData.offsetRawData + biNormalsArrayDefinition.firstElemOffset)
-    for i in range(biNormalsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].biNormal = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
+#  Joints making up the armature: the model ones, plus the supermodel joints used by its skins (with their ancestors)
+def getArmatureJoints(modelMesh: ModelMesh) -> List[ModelJoint]:
+    joints = list(modelMesh.joints)
+    names = set(joint.name for joint in joints)
+    for buffer in modelMesh.meshBuffers:
+        for joint in buffer.bonePalette or []:
+            missing = []
+            while joint is not None and joint.name not in names:
+                missing.append(joint)
+                names.add(joint.name)
+                joint = joint.parent
+            joints.extend(reversed(missing))  # parents before their children
+    return joints
+
+
+_ROLL_SAFE_THRESHOLD = 6.1e-3
+_ROLL_CRITICAL_THRESHOLD = 2.5e-4
+
+
+#  Bone head, tail and roll of every joint so that the edit bone frame is the joint global frame:
+#  Y along the bone, roll measured from Blender's roll-0 frame (see vec_roll_to_mat3 in armature.cc);
+#  lengths are the distance to the nearest child, else the parent length, else defaultLength
+def computeBoneFrames(
+    matrices: np.ndarray,
+    parentIndices: np.ndarray,
+    defaultLength: float = 0.1
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    heads = matrices[:, :3, 3]
+    axes = matrices[:, :3, :3] / np.linalg.norm(matrices[:, :3, :3], axis=1, keepdims=True)
+    yAxes, zAxes = axes[:, :, 1], axes[:, :, 2]
+
+    lengths = np.full(len(matrices), np.inf)
+    hasParent = parentIndices >= 0
+    childDistances = np.linalg.norm(heads[hasParent] - heads[parentIndices[hasParent]], axis=1)
+    childDistances[childDistances < 1e-4] = np.inf
+    np.minimum.at(lengths, parentIndices[hasParent], childDistances)
+    for index in np.flatnonzero(np.isinf(lengths)):  # parents come first, their length is already final
+        parentIndex = parentIndices[index]
+        lengths[index] = lengths[parentIndex] if parentIndex >= 0 and np.isfinite(lengths[parentIndex]) \
+            else defaultLength
+    tails = heads + yAxes * lengths[:, None]
+
+    x, y, z = yAxes[:, 0], yAxes[:, 1], yAxes[:, 2]
+    theta = 1.0 + y
+    thetaAlt = x * x + z * z
+    regular = (theta > _ROLL_SAFE_THRESHOLD) | (thetaAlt > _ROLL_CRITICAL_THRESHOLD ** 2)
+    theta = np.where(theta <= _ROLL_SAFE_THRESHOLD, thetaAlt * 0.5 + thetaAlt * thetaAlt * 0.125, theta)
+    theta = np.where(regular, theta, 1.0)
+    rollXAxes = np.stack((1.0 - x * x / theta, -x, -x * z / theta), axis=1)
+    rollZAxes = np.stack((-x * z / theta, -z, 1.0 - z * z / theta), axis=1)
+    rollXAxes[~regular] = (-1.0, 0.0, 0.0)  # bone pointing down -Y
+    rollZAxes[~regular] = (0.0, 0.0, 1.0)
+    rolls = np.arctan2(np.einsum('ij,ij->i', zAxes, rollXAxes), np.einsum('ij,ij->i', zAxes, rollZAxes))
+
+    return heads, tails, rolls
+
+
+#  Armature with one bone per joint, all bones created and placed in a single edit mode session
+def wrapArmatureToBlender(
+    context,
+    modelData: ModelData,
+    modelMesh: ModelMesh,
+    globalMatrix: np.ndarray
+):
+    joints = getArmatureJoints(modelMesh)
+    ownJoints = set(id(joint) for joint in modelMesh.joints)
+    indices = {id(joint): index for index, joint in enumerate(joints)}
+    parentIndices = np.array([
+        indices.get(id(joint.parent), -1) if joint.parent is not None else -1 for joint in joints
+    ], dtype=np.int64)
+    # supermodel joints are in the supermodel space, the model ones already include the global matrix
+    matrices = np.array([
+        joint.globalMatrix if id(joint) in ownJoints else globalMatrix @ joint.globalMatrix for joint in joints
+    ], dtype=np.float64).reshape(-1, 4, 4)
+    heads, tails, rolls = computeBoneFrames(matrices, parentIndices)
+
+    armature = _created('armatures', bpy.data.armatures.new(name="armature_{}".format(modelData.modelName)))
+    armatureObject: Object = _created('objects', bpy.data.objects.new(modelData.modelName, armature))
+    context.collection.objects.link(armatureObject)
+
+    with editModeOnly(context, armatureObject):
+        editBones = [armature.edit_bones.new(joint.name) for joint in joints]
+        armature.edit_bones.foreach_set('head', heads.astype(np.float32).ravel())
+        armature.edit_bones.foreach_set('tail', tails.astype(np.float32).ravel())
+        armature.edit_bones.foreach_set('roll', rolls.astype(np.float32))
+        for editBone, parentIndex in zip(editBones, parentIndices.tolist()):
+            if parentIndex >= 0:
+                editBone.parent = editBones[parentIndex]
+
+    print('armature', name=armature.name, bones=len(joints))
+    return armatureObject
+
+
+#  Vertex group per skin bone, vertices added in one call per distinct weight
+#  (vertices sorted by weight once, each call takes a slice)
+def wrapBoneWeightsToBlender(
+    obj: Object,
+    meshBuffer: ModelMeshBuffer
+):
+    for boneWeights in meshBuffer.boneWeights:
+        group = obj.vertex_groups.get(boneWeights.boneName) or obj.vertex_groups.new(name=boneWeights.boneName)
+        strengths = np.asarray(boneWeights.strengths)
+        vertexIds = np.asarray(boneWeights.vertexIds)
+        if len(strengths) == 0:
+            continue
+        values, inverse = np.unique(strengths, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        groups = np.split(vertexIds[order], np.cumsum(np.bincount(inverse, minlength=len(values)))[:-1])
+        for strength, groupVertexIds in zip(values.tolist(), groups):
+            group.add(groupVertexIds.tolist(), strength, 'REPLACE')
+
+
+_IMAGE_EXTENSIONS = ('.dds', '.tga', '.jpg', '.jpeg', '.png')
+_MATERIAL_HASH_PROPERTY = 'mdb_material_hash'
+
+
+#  Image of a texture file, loaded once per absolute path and reused by the following imports of the session
+def loadImage(path: str):
+    path = os.path.normcase(os.path.abspath(path))
+    imageName = getCache('imagesByPath').get(path)
+    image = bpy.data.images.get(imageName) if imageName is not None else None
+    if image is None or os.path.normcase(os.path.abspath(bpy.path.abspath(image.filepath))) != path:
+        imageCount = len(bpy.data.images)
+        image = bpy.data.images.load(path, check_existing=True)
+        if len(bpy.data.images) > imageCount:  # not an image of the file already pointing there
+            _created('images', image)
+        getCache('imagesByPath')[path] = image.name
+    return image
+
+
+#  Image of a texture stored in the game archives: its bytes are packed into the blend file, once per session
+def loadArchiveImage(resource: ArchiveResource):
+    key = (os.path.normcase(os.path.abspath(resource.archive.path)), resource.resourceIndex)
+    imageName = getCache('imagesByResource').get(key)
+    image = bpy.data.images.get(imageName) if imageName is not None else None
+    if image is None:
+        image = _created('images', bpy.data.images.new(resource.fileName, width=1, height=1))
+        image.pack(data=bytes(resource.data), data_len=resource.size)
+        image.source = 'FILE'
+        getCache('imagesByResource')[key] = image.name
+    return image
+
+
+def getTextureImage(modelData: ModelData, name: str):
+    texture = findTextureImage(modelData, name) if name else None  # file path or archive resource
+    if texture is None:
+        return None
+    if not isinstance(texture, str):
+        return loadArchiveImage(texture) if '.' + texture.extension in _IMAGE_EXTENSIONS else None
+    if os.path.splitext(texture)[1].lower() not in _IMAGE_EXTENSIONS:
+        return None
+    return loadImage(texture)
 
-    wrapper.seek(modelData.offsetRawData + facesArrayDefinition.firstElemOffset)
-    for i in range(facesArrayDefinition.nbUsedEntries):
-        wrapper.seek(4 * 4 + 4, relative=True)
-        if modelData.fileVersion == 133:
-            wrapper.seek(3 * 4, relative=True)
 
-        meshBuffer.indices.append((
-            wrapper.readInt32(),
-            wrapper.readInt32(),
-            wrapper.readInt32()
-        ))
+#  Identifies a material together with the folder its textures are resolved from
+def getMaterialKey(modelData: ModelData, material: ModelMaterial) -> str:
+    content = material.materialHash() + os.path.normcase(os.path.abspath(modelData.baseDirectory))
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
 
-        if modelData.fileVersion == 133:
-            wrapper.seek(4, relative=True)
 
-    for t in range(len(material.textures)):
-        wrapper.seek(modelData.offsetRawData + tVertsArrayDefinitions[t].firstElemOffset)
-        for i in range(tVertsArrayDefinitions[t].nbUsedEntries):
-            meshBuffer.vertices[i].tCoords = Vector((
-                wrapper.readFloat32(),
-                wrapper.readFloat32()
-            ))
+#  Image node reading its UVs from the layer of the texture slot
+def addImageNode(nodeTree, image, uvMapName: str, location: Tuple[float, float]):
+    imageNode = nodeTree.nodes.new('ShaderNodeTexImage')
+    imageNode.image = image
+    imageNode.location = location
 
-    debugDecreaseDepth()
-    # TODO load custom materials based on textureStrings[0] (typically will be __shader__)
-    return meshBuffer
+    uvNode = nodeTree.nodes.new('ShaderNodeUVMap')
+    uvNode.uv_map = uvMapName
+    uvNode.location = (location[0] - 200, location[1])
+    nodeTree.links.new(uvNode.outputs['UV'], imageNode.inputs['Vector'])
+    return imageNode
 
 
-def readSkinNode(
-    wrapper: FileWrapper,
-    modelData: ModelData,
-    parentMesh: ModelMesh,
-    name: str
-):
-    debugIncreaseDepth()
-    # TODO UNITE MESH HEADER (0x0 to 0x270)
-    wrapper.seek(8, relative=True)  # Function pointer
-    offMeshArrays = wrapper.readUInt32()
-
-    wrapper.seek(4, relative=True)  # Unknown
-    nodeBoundingBox = ModelBoundingBox(
-        min=Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        )),
-        max=Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        ))
-    )
-    wrapper.seek(28 + 4 + 16, relative=True)  # Unknown, fog scale, Unknown
-    nodeDiffuseColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    nodeAmbientColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    nodeSpecularColor = Color((
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-        wrapper.readFloat32(),
-    ))
-    shininess = wrapper.readFloat32()
-    shadow = wrapper.readUInt32() == 1
-    beaming = wrapper.readUInt32() == 1
-    render = wrapper.readUInt32() == 1
-    transparencyHint = wrapper.readUInt32() == 1
-
-    wrapper.seek(4, relative=True)  # Unknown
-    textureStrings = list(map(
-        lambda textureString: "" if textureString == "NULL" else textureString,
-        [wrapper.readString(64) for i in range(4)]
+#  Principled BSDF material: texture0 as base colour (and alpha for transparent shaders), first bumpmap as normal map,
+#  the other textures as unconnected image nodes; shader and raw parameters are kept as custom properties
+def buildMaterial(modelData: ModelData, material: ModelMaterial, materialKey: str):
+    blenderMaterial = _created('materials', bpy.data.materials.new(
+        name=material.textures.get('texture0') or material.shader or 'material'
     ))
-    tileFade = wrapper.readUInt32() == 1
-    controlFade = wrapper.readByte() == 1
-    lightMapped = wrapper.readByte() == 1
-    rotateTexture = wrapper.readByte() == 1
-
-    wrapper.seek(1, relative=True)  # Unknown
-    transparencyShift = wrapper.readFloat32()
-    defaultRenderList = wrapper.readUInt32()
-    preserveVColors = wrapper.readUInt32()
-    fourCC = wrapper.readUInt32()
-
-    wrapper.seek(4, relative=True)  # Unknown
-    depthOffset = wrapper.readFloat32()
-    coronaCenterMult = wrapper.readFloat32()
-    fadeStartDistance = wrapper.readFloat32()
-    distFromScreenCenterFace = wrapper.readByte() == 1
-
-    wrapper.seek(3, relative=True)  # Unknown
-    enlargeStartDistance = wrapper.readFloat32()
-    affectedByWind = wrapper.readByte() == 1
-
-    wrapper.seek(3, relative=True)  # Unknown
-    dampFactor = wrapper.readFloat32()
-    blendGroup = wrapper.readUInt32()
-    dayNightLightMaps = wrapper.readByte()
-    dayNightTransition = wrapper.readString(200)
-    ignoreHitCheck = wrapper.readByte() == 1
-    needsReflection = wrapper.readByte() == 1
-
-    wrapper.seek(1, relative=True)  # Unknown
-    reflectionPlaneNormal = [
-        wrapper.readFloat32() for i in range(3)
-    ]
-    reflectionPlaneDistance = wrapper.readFloat32()
-    fadeOnCameraCollision = wrapper.readByte() == 1
-    noSelfShadow = wrapper.readByte() == 1
-    isReflected = wrapper.readByte() == 1
-    onlyReflected = wrapper.readByte() == 1
-    lightMapName = wrapper.readString(64)
-    canDecal = wrapper.readByte() == 1
-    multiBillBoard = wrapper.readByte() == 1
-    ignoreLODReflection = wrapper.readByte() == 1
-    enableSpecular = wrapper.readByte() == 1
-    detailMapScape = wrapper.readFloat32()
-    modelData.offsetTextureInfo = wrapper.readUInt32()
-
-    wrapper.seek(4, relative=True)
-    bonesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-
-    back = wrapper.offset
-    wrapper.seek(modelData.offsetTexData + bonesArrayDefinition.firstElemOffset)
-    bones = []
-    for i in range(bonesArrayDefinition.nbUsedEntries):
-        boneId = wrapper.readUInt32()
-        boneName = wrapper.readString(92).split('+')[0]  # FIXME seems to collect garbage with name
-        joint = parentMesh.getJointByName(boneName)
-        bones.append(joint)
-
-    wrapper.seek(back)
-    wrapper.seek(4, relative=True)
-    vertexArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    normalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    tangentsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    biNormalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    tVertsArrayDefinitions = [
-        ArrayDefinition.fromWrapper(wrapper) for i in range(4)
-    ]
-    unknownArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    facesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-
-    print(vertexArrayDefinition, facesArrayDefinition)
+    blenderMaterial[_MATERIAL_HASH_PROPERTY] = materialKey
+    blenderMaterial['mdb_shader'] = material.shader
+    blenderMaterial['mdb_floats'] = dict(material.floats)
+    blenderMaterial['mdb_vectors'] = {name: list(vector) for name, vector in material.vectors.items()}
+    blenderMaterial['mdb_strings'] = dict(material.strings)
+
+    blenderMaterial.use_nodes = True
+    nodeTree = blenderMaterial.node_tree
+    shader = next(node for node in nodeTree.nodes if node.type == 'BSDF_PRINCIPLED')
+    transparent = material.getMaterialTypeFromShader() == ModelMaterialType.ModelMaterialTypeTransparent
+
+    if material.diffuseColor is not None:
+        diffuseColor = (*material.diffuseColor, 1.0)
+        shader.inputs['Base Color'].default_value = diffuseColor
+        blenderMaterial.diffuse_color = diffuseColor
+
+    for slot, (textureType, textureName) in enumerate(material.textures.items()):
+        image = getTextureImage(modelData, textureName)
+        if image is None:
+            continue
 
-    modelData.offsetTexData = wrapper.readUInt32() if modelData.fileVersion == 133 else modelData.offsetTexData
+        imageNode = addImageNode(nodeTree, image, textureType, (-500, 300 - 300 * slot))
+        if textureType == 'texture0':
+            nodeTree.links.new(imageNode.outputs['Color'], shader.inputs['Base Color'])
+            if transparent:
+                nodeTree.links.new(imageNode.outputs['Alpha'], shader.inputs['Alpha'])
 
-    if vertexArrayDefinition.nbUsedEntries == 0 or facesArrayDefinition.nbUsedEntries == 0:
-        debugDecreaseDepth()
-        return
-
-    wrapper.seek(24 + 12, relative=True)
-    weightsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    weights = readArray(wrapper, modelData, weightsArrayDefinition, wrapper.readFloat32)
-    bonesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    bones = readArray(wrapper, modelData, bonesArrayDefinition, wrapper.readUByte)
-
-    material = readTextures(wrapper, modelData)
-    evaluateTextures(modelData, material, 4, textureStrings, tVertsArrayDefinitions, dayNightLightMaps, lightMapName)
-    material.setMaterialParameters(
-        diffuseColor=nodeDiffuseColor,
-        ambientColor=nodeAmbientColor,
-        specularColor=nodeSpecularColor,
-        shininess=shininess,
-        shadow=shadow,
-        beaming=beaming,
-        render=render,
-        transparencyHint=transparencyHint,
-        textureStrings=textureStrings,
-        tileFade=tileFade,
-        controlFade=controlFade,
-        lightMapped=lightMapped,
-        rotateTexture=rotateTexture,
-        transparencyShift=transparencyShift,
-        defaultRenderList=defaultRenderList,
-        preserveVColors=preserveVColors,
-        fourCC=fourCC,
-        depthOffset=depthOffset,
-        coronaCenterMult=coronaCenterMult,
-        fadeStartDistance=fadeStartDistance,
-        distFromScreenCenterFace=distFromScreenCenterFace,
-        enlargeStartDistance=enlargeStartDistance,
-        affectedByWind=affectedByWind,
-        dampFactor=dampFactor,
-        blendGroup=blendGroup,
-        dayNightLightMaps=dayNightLightMaps,
-        dayNightTransition=dayNightTransition,
-        ignoreHitCheck=ignoreHitCheck,
-        needsReflection=needsReflection,
-        reflectionPlaneNormal=reflectionPlaneNormal,
-        reflectionPlaneDistance=reflectionPlaneDistance,
-        fadeOnCameraCollision=fadeOnCameraCollision,
-        noSelfShadow=noSelfShadow,
-        isReflected=isReflected,
-        onlyReflected=onlyReflected,
-        lightMapName=lightMapName,
-        canDecal=canDecal,
-        multiBillBoard=multiBillBoard,
-        ignoreLODReflection=ignoreLODReflection,
-        detailMapScape=detailMapScape,
-        enableSpecular=enableSpecular
-    )
-    meshBuffer = ModelMeshBuffer(
-        name=name,
-        material=material,
-        boundingBox=nodeBoundingBox
-    )
-    meshBuffer.vertices = [
-        ModelVertex() for i in range(max(
-            vertexArrayDefinition.nbUsedEntries,
-            normalsArrayDefinition.nbUsedEntries,
-            tangentsArrayDefinition.nbUsedEntries,
-            biNormalsArrayDefinition.nbUsedEntries
-        ))
-    ]
+    for bumpmapName in material.bumpmaps.values():
+        image = getTextureImage(modelData, bumpmapName)
+        if image is None:
+            continue
 
-    wrapper.seek(modelData.offsetRawData + vertexArrayDefinition.firstElemOffset)
-    skinningIndex = 0
-    for i in range(vertexArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].position = Vector((
-            wrapper.readFloat32(),
-            wrapper.readFloat32(),
-            wrapper.readFloat32()
-        ))
-        meshBuffer.vertices[i].color = Color((1.0, 1.0, 1.0))
-        meshBuffer.vertices[i].tCoords = Vector((0.0, 0.0))
-        for j in range(4):  # Skinning of the vertex
-            currentSkinningIndex = skinningIndex
-            skinningIndex += 1
-            boneId = bones[currentSkinningIndex]
-            if boneId == 255:
-                continue
+        image.colorspace_settings.name = 'Non-Color'
+        imageNode = addImageNode(nodeTree, image, 'texture0', (-800, -900))
+        normalMapNode = nodeTree.nodes.new('ShaderNodeNormalMap')
+        normalMapNode.uv_map = 'texture0'
+        normalMapNode.location = (-250, -600)
+        nodeTree.links.new(imageNode.outputs['Color'], normalMapNode.inputs['Color'])
+        nodeTree.links.new(normalMapNode.outputs['Normal'], shader.inputs['Normal'])
+        break
 
-            if boneId < len(bones):
-                weight = weights[currentSkinningIndex]
-                parentMesh.weights.append(ModelWeight(
-                    vertexId=i,
-                    strength=weight
-                ))
-
-    wrapper.seek(modelData.offsetRawData + normalsArrayDefinition.firstElemOffset)
-    for i in range(normalsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].normal = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
+    if transparent:
+        if bpy.app.version < (4, 2, 0):
+            blenderMaterial.blend_method = 'HASHED'
+        else:
+            blenderMaterial.surface_render_method = 'DITHERED'
 
-    wrapper.seek(modelData.offsetRawData + tangentsArrayDefinition.firstElemOffset)
-    for i in range(tangentsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].tangent = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
+    return blenderMaterial
 
-    wrapper.seek(modelData.offsetRawData + biNormalsArrayDefinition.firstElemOffset)
-    for i in range(biNormalsArrayDefinition.nbUsedEntries):
-        meshBuffer.vertices[i].biNormal = Vector((
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32(),  # wrapper.readInt16() / 8192,
-            wrapper.readFloat32()  # wrapper.readInt16() / 8192
-        ))
 
-    wrapper.seek(modelData.offsetRawData + facesArrayDefinition.firstElemOffset)
-    for i in range(facesArrayDefinition.nbUsedEntries):
-        wrapper.seek(4 * 4 + 4, relative=True)
-        if modelData.fileVersion == 133:
-            wrapper.seek(3 * 4, relative=True)
+#  Blender material of a ModelMaterial, built once per session for identical materials
+def wrapMaterialToBlender(modelData: ModelData, material: ModelMaterial, materialKey: str):
+    materialName = getCache('materialsByHash').get(materialKey)
+    blenderMaterial = bpy.data.materials.get(materialName) if materialName is not None else None
+    if blenderMaterial is None or blenderMaterial.get(_MATERIAL_HASH_PROPERTY) != materialKey:
+        print('build material', shader=material.shader)
+        blenderMaterial = buildMaterial(modelData, material, materialKey)
+        getCache('materialsByHash')[materialKey] = blenderMaterial.name
+    return blenderMaterial
 
-        meshBuffer.indices.append((
-            wrapper.readInt32(),
-            wrapper.readInt32(),
-            wrapper.readInt32()
-        ))
 
-        if modelData.fileVersion == 133:
-            wrapper.seek(4, relative=True)
+_GEOMETRY_HASH_PROPERTY = 'mdb_geometry_hash'
 
-    for t in range(len(material.textures)):
-        wrapper.seek(modelData.offsetRawData + tVertsArrayDefinitions[t].firstElemOffset)
-        for i in range(tVertsArrayDefinitions[t].nbUsedEntries):
-            meshBuffer.vertices[i].tCoords = Vector((
-                wrapper.readFloat32(),
-                wrapper.readFloat32()
-            ))
 
-    debugDecreaseDepth()
-    # TODO load custom materials based on textureStrings[0] (typically will be __shader__)
-    return meshBuffer
+#  Mesh already built this session for the same geometry, if it still exists in the current file
+def getSharedMesh(geometryHash: str) -> Optional[Mesh]:
+    meshName = getCache('meshesByGeometry').get(geometryHash)
+    mesh = bpy.data.meshes.get(meshName) if meshName is not None else None
+    if mesh is not None and mesh.get(_GEOMETRY_HASH_PROPERTY) == geometryHash:
+        return mesh
+    return None
 
 
-def loadSkinNode(
-    wrapper: FileWrapper,
+#  Object of one mesh buffer (mesh shared with an identical one when deduplicating), skin weights as vertex groups
+def wrapBufferToBlender(
+    context,
+    modelData: ModelData,
+    buffer: ModelMeshBuffer,
+    joint: Optional[ModelJoint],
+    deduplicateMeshes: bool = True,
+    importMaterials: bool = True,
+    importArmature: bool = True
+) -> Object:
+    print('wrap to blender', name=buffer.name)
+    materialKey = None
+    if importMaterials and buffer.material is not None and buffer.material.hasMaterial():
+        materialKey = getMaterialKey(modelData, buffer.material)
+
+    # the material is part of the mesh data, so it is part of what must match to share it
+    geometryHash = '{}:{}'.format(buffer.geometryHash(), materialKey) if deduplicateMeshes else None
+    mesh: Mesh = getSharedMesh(geometryHash) if deduplicateMeshes else None
+    if mesh is None:
+        mesh = _created('meshes', bpy.data.meshes.new(name="mesh_{}".format(buffer.name)))
+        wrapMeshToBlender(mesh, buffer)
+        wrapTCoordsToBlender(mesh, buffer)
+        if materialKey is not None:
+            mesh.materials.append(wrapMaterialToBlender(modelData, buffer.material, materialKey))
+        if deduplicateMeshes:
+            mesh[_GEOMETRY_HASH_PROPERTY] = geometryHash
+            getCache('meshesByGeometry')[geometryHash] = mesh.name
+    else:
+        print('share mesh', name=mesh.name)
+
+    obj: Object = _created('objects', bpy.data.objects.new(buffer.name, mesh))
+    context.collection.objects.link(obj)
+    if joint is not None:
+        obj.matrix_world = Matrix(joint.globalMatrix.tolist())
+    if importArmature and len(buffer.boneWeights) > 0:
+        wrapBoneWeightsToBlender(obj, buffer)
+    return obj
+
+
+#  Armature (when there is something to drive), objects parented to it (skinned ones deformed by it) and actions;
+#  objects are (object, skinned) pairs of the model buffers
+def wrapRigToBlender(
+    context,
     modelData: ModelData,
-    joint: ModelJoint,
-    parentMesh: ModelMesh
+    modelMesh: ModelMesh,
+    objects: List[Tuple[Object, bool]],
+    importArmature: bool = True,
+    globalMatrix: np.ndarray = None
 ):
-    debugIncreaseDepth()
-    print('post load skin node', name=joint.name)
-    meshBuffer = readSkinNode(
-        wrapper=wrapper,
-        modelData=modelData,
-        parentMesh=parentMesh,
-        name=joint.name
-    )
-    if meshBuffer is not None:
-        parentMesh.meshBuffers.append(meshBuffer)
-        joint.attachedMeshes.append(meshBuffer)
-    debugDecreaseDepth()
+    globalMatrix = globalMatrix if globalMatrix is not None else _defaultMatrix()
+    hasSkins = any(skinned for _, skinned in objects)
+    hasAnimations = any(animation.isLoaded for animation in modelMesh.animations)
+    armatureObject = None
+    if importArmature and (hasSkins or hasAnimations) and len(modelMesh.joints) > 0:
+        armatureObject = wrapArmatureToBlender(context, modelData, modelMesh, globalMatrix)
 
+    if armatureObject is not None:
+        for obj, skinned in objects:
+            obj.parent = armatureObject
+            if skinned:
+                modifier = obj.modifiers.new(name='Armature', type='ARMATURE')
+                modifier.object = armatureObject
+
+    actions = wrapAnimationsToBlender(context, modelData, modelMesh)
+    if armatureObject is not None and len(actions) > 0:
+        armatureObject.animation_data_create().action = actions[0]
 
-def loadNode(
-    wrapper: FileWrapper,
-    modelData: ModelData,
-    parentMesh: ModelMesh = None,
-    parentTransform: Matrix = _defaultMatrix(),
-    # why the fuck in petooh THIS IS A POINTER FOR EVERY RECURSIVE CALL?!
-    postLoad: List[Tuple[int, StaticControllersData, ModelJoint]] = []
-):
-    debugIncreaseDepth()
-    if parentMesh is None:  # root node
-        parentMesh = ModelMesh()
-
-    wrapper.seek(24 + 4, relative=True)  # Function pointers, inherit color flag
-    id = wrapper.readUInt32()
-    name = wrapper.readString(64)
-
-    wrapper.seek(8, relative=True)  # parent geometry, parent node
-    childrenNodesDef = ArrayDefinition.fromWrapper(wrapper)
-    children = readArray(wrapper, modelData, childrenNodesDef, wrapper.readUInt32)
-
-    controllerKeyDef = ArrayDefinition.fromWrapper(wrapper)
-    controllerDataDef = ArrayDefinition.fromWrapper(wrapper)
-
-    controllersData = getStaticNodeControllers(wrapper, modelData, controllerKeyDef, controllerDataDef)
-    controllersData.globalTransform = parentTransform @ controllersData.localTransform
-
-    wrapper.seek(4 + 8, relative=True)  # node flags/type, fixed rot + imposter group ?
-    minLOD = wrapper.readInt32()
-    maxLOD = wrapper.readInt32()
-    type = NodeType(wrapper.readUInt32())
-
-    joint = parentMesh.getJointByName(name)
-    if joint is None:
-        joint = ModelJoint(
-            localMatrix=controllersData.localTransform,
-            globalMatrix=controllersData.globalTransform,
-            name=name,
-            animatedPosition=controllersData.position,
-            animatedScale=controllersData.scale,
-            animatedRotation=controllersData.rotation#.invert()
-        )
-        parentMesh.joints.append(joint)
-
-    print('load node', name=name, type=type)
-
-    meshBuffer = None
-    if type == NodeType.NodeTypeTrimesh:
-        meshBuffer = readMeshNode(wrapper, modelData, joint.name)
-    elif type == NodeType.NodeTypeSkin:
-        # these should be loaded after other types
-        postLoad.append((wrapper.offset, controllersData, joint))
-    elif type == NodeType.NodeTypeSpeedTree:
-        print('spt node should be loaded')
-        # TODO SPT NODE LOADING
-    elif type == NodeType.NodeTypeTexturePaint:
-        meshBuffer = readTexturePaintNode(wrapper, modelData, joint.name)
-
-    if meshBuffer is not None:
-        print('attach buffer')
-        parentMesh.meshBuffers.append(meshBuffer)
-        joint.attachedMeshes.append(meshBuffer)
-
-    for childOffset in children:
-        wrapper.seek(modelData.offsetModelData + childOffset)
-        _, postLoadChild = loadNode(wrapper, modelData, parentMesh, parentTransform, [])
-        postLoad += postLoadChild
-
-    debugDecreaseDepth()
-    return parentMesh, postLoad
-
-
-def readAnimationNode(
-    wrapper: FileWrapper,
-    modelData: ModelData,
-    parentMesh: ModelMesh,
-    children: List[ModelAnimationNode] = []
-):
-    debugIncreaseDepth()
-    wrapper.seek(24 + 4, relative=True)  # Function pointers, inherit color flag
-    id = wrapper.readUInt32()
-    name = wrapper.readString(64)
-
-    wrapper.seek(8, relative=True)  # parent geometry + parent node
-    childNodesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    childNodes = readArray(wrapper, modelData, childNodesArrayDefinition, wrapper.readUInt32)
-
-    controllerKeyArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    controllerDataArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    controllers = readNodeControllers(wrapper, modelData, controllerKeyArrayDefinition, controllerDataArrayDefinition)
-
-    wrapper.seek(4 + 8, relative=True)  # node flags/type, fixed rot + imposter group ?
-    minLOD = wrapper.readFloat32()
-    maxLOD = wrapper.readFloat32()
-    type = NodeType(wrapper.readUInt32())
-
-    animation = ModelAnimationNode(
-        id=id,
-        name=name,
-        minLOD=minLOD,
-        maxLOD=maxLOD,
-        joint=parentMesh.getJointByName(name)
-    )
 
-    print('read animation node', id=id, name=name)
-    if animation.joint is not None:
-        for i in range(len(controllers.position)):
-            animation.positionKeys.append(ModelPositionKey(
-                frame=controllers.positionTime[i],
-                position=controllers.position[i]
-            ))
-        for i in range(len(controllers.rotation)):
-            animation.rotationKeys.append(ModelRotationKey(
-                frame=controllers.rotationTime[i],
-                rotation=controllers.rotation[i]
-            ))
-        for i in range(len(controllers.scale)):
-            animation.scaleKeys.append(ModelScaleKey(
-                frame=controllers.scaleTime[i],
-                scale=controllers.scale[i]
-            ))
-        # TODO check if other types of controllers required
-
-    for childNodeOffset in childNodes:
-        wrapper.seek(modelData.offsetModelData + childNodeOffset)
-        animation.children.append(readAnimationNode(wrapper, modelData, parentMesh, []))
-
-    debugDecreaseDepth()
-    return animation
-
-
-def loadAnimations(
-    wrapper: FileWrapper,
+def wrapToBlender(
+    context,
     modelData: ModelData,
-    parentMesh: ModelMesh
+    modelMesh: ModelMesh,
+    deduplicateMeshes: bool = True,
+    importMaterials: bool = True,
+    importArmature: bool = True,
+    globalMatrix: np.ndarray = None
 ):
-    debugIncreaseDepth()
-    wrapper.seek(
-        modelData.offsetModelData + modelData.offsetRawData
-            if modelData.fileVersion == 133
-            else modelData.offsetTexData
-    )
-    chunkStart = wrapper.offset
-
-    wrapper.seek(4, relative=True)
-    animationsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
-    wrapper.seek(chunkStart + animationsArrayDefinition.firstElemOffset)
-    for i in range(animationsArrayDefinition.nbUsedEntries):
-        animOffset = wrapper.readUInt32()
-        back = wrapper.offset
-
-        wrapper.seek(modelData.offsetModelData + animOffset)
-        wrapper.seek(8, relative=True)
-        animationName = wrapper.readString(64)
-        offsetRootNode = wrapper.readUInt32()
-
-        wrapper.seek(32, relative=True)
-        geometryType = wrapper.readUByte()
-
-        wrapper.seek(3, relative=True)
-        animationLength = wrapper.readFloat32()
-        transitionTime = wrapper.readFloat32()
-        animationRootName = wrapper.readString(64)
-        eventArrayDef = ArrayDefinition.fromWrapper(wrapper)
-        animBox = ModelBoundingBox(
-            min=Vector((
-                wrapper.readFloat32(),
-                wrapper.readFloat32(),
-                wrapper.readFloat32()
-            )),
-            max=Vector((
-                wrapper.readFloat32(),
-                wrapper.readFloat32(),
-                wrapper.readFloat32()
-            ))
+    bufferJoints = {
+        id(buffer): joint for joint in modelMesh.joints for buffer in joint.attachedMeshes
+    }
+    objects = [
+        (
+            wrapBufferToBlender(
+                context, modelData, buffer, bufferJoints.get(id(buffer)),
+                deduplicateMeshes, importMaterials, importArmature
+            ),
+            len(buffer.boneWeights) > 0
         )
-        animSphere = ModelBoundingSphere(
-            x=wrapper.readFloat32(),
-            y=wrapper.readFloat32(),
-            z=wrapper.readFloat32(),
-            radius=wrapper.readFloat32(),
-        )
-
-        print('read animation', rootName=animationRootName, name=animationName, length=animationLength)
-
-        wrapper.seek(4, relative=True)  # Unknown
-        wrapper.seek(modelData.offsetModelData + offsetRootNode)
-        animation = readAnimationNode(wrapper, modelData, parentMesh)
+        for buffer in modelMesh.meshBuffers
+    ]
+    wrapRigToBlender(context, modelData, modelMesh, objects, importArmature, globalMatrix)
 
-        parentMesh.animations.append(ModelAnimationMeta(
-            name=animationName,
-            rootName=animationRootName,
-            animationNode=animation,
-            length=animationLength,
-            transitionTime=transitionTime,
-            animationBox=animBox,
-            animationSphere=animSphere
-        ))
 
-        wrapper.seek(back)
-    debugDecreaseDepth()
+def reportSimplifiedAnimations(
+    operator,
+    modelMesh: ModelMesh,
+    positionTolerance: float,
+    rotationTolerance: float,
+    scaleTolerance: float,
+    framesPerSecond: float
+):
+    if len(modelMesh.animations) == 0:
+        return
+    keysBefore, keysAfter = simplifyAnimations(
+        modelMesh.animations,
+        positionTolerance=positionTolerance,
+        rotationTolerance=rotationTolerance,
+        scaleTolerance=scaleTolerance,
+        framesPerSecond=framesPerSecond
+    )
+    operator.report({'INFO'}, "Animation keys reduced from {} to {}".format(keysBefore, keysAfter))
 
 
-def loadMeta(
-    wrapper: FileWrapper,
-    baseDirectory: str,
-    modelName: str
+#  Blender side of an import once the model is parsed (optional key reduction, then datablocks)
+def wrapParsedModel(
+    operator,
+    context,
+    modelMesh: ModelMesh,
+    globalMatrix: np.ndarray,
+    simplify_animations: bool = False,
+    position_tolerance: float = 0.001,
+    rotation_tolerance: float = 0.001,
+    scale_tolerance: float = 0.001,
+    resample_fps: float = 0.0,
+    deduplicate_meshes: bool = True,
+    import_materials: bool = True,
+    import_armature: bool = True,
 ):
-    if wrapper.readByte() != 0:
-        raise Exception('File is not binary!')
-
-    wrapper.seek(4)
-    fileVersion = wrapper.readUInt32() & 0x0fffffff
-    modelCount = wrapper.readUInt32()
-    offsetModelData = 32
-    if fileVersion not in [133, 136] and modelCount != 1:
-        raise Exception(
-            'Version 133 or 136 expected, got {0}; Model count 1 expected, got {1}'
-                .format(fileVersion, modelCount)
+    if simplify_animations:
+        reportSimplifiedAnimations(
+            operator, modelMesh, position_tolerance, rotation_tolerance, scale_tolerance, resample_fps
         )
 
-    wrapper.seek(4, relative=True)
-    sizeModelData = wrapper.readUInt32()
-
-    wrapper.seek(4, relative=True)
-    modelData = ModelData(
-        baseDirectory=baseDirectory,
-        modelName=modelName,
-        fileVersion=fileVersion,
-        offsetModelData=offsetModelData,
-        sizeModelData=sizeModelData,
-        offsetRawData=wrapper.readUInt32() + offsetModelData if fileVersion == 133 else offsetModelData,
-        sizeRawData=wrapper.readUInt32() if fileVersion == 133 else 0,
-        offsetTexData=wrapper.readUInt32() + offsetModelData if fileVersion == 136 else offsetModelData,
-        sizeTexData=wrapper.readUInt32() if fileVersion == 136 else 0,
-        offsetTextureInfo=-1,  # will be filled later
-        offsetRootNode=-1,
-        modelType=-1,
-        firstLOD=-1,
-        lastLOD=-1,
-        detailMap='',
-        modelScale=-1,
-        superModel='',
-        animationScale=-1
+    debugSetDepth(0)
+    wrapToBlender(
+        context=context,
+        modelData=modelMesh.modelData,
+        modelMesh=modelMesh,
+        deduplicateMeshes=deduplicate_meshes,
+        importMaterials=import_materials,
+        importArmature=import_armature,
+        globalMatrix=globalMatrix
     )
 
-    wrapper.seek(8, relative=True)
-    modelData.name = wrapper.readString(64)
 
-    modelData.offsetRootNode = wrapper.readUInt32()
-    wrapper.seek(32, relative=True)
-    modelData.type = wrapper.readUByte()
+#  Blender side of a streamed import: every buffer becomes an object as soon as it is decoded and its arrays are
+#  released right away, the rig and the actions follow once the stream is exhausted; progress on the window manager
+def wrapStreamedModel(
+    operator,
+    context,
+    stream: ModelStream,
+    globalMatrix: np.ndarray,
+    simplify_animations: bool = False,
+    position_tolerance: float = 0.001,
+    rotation_tolerance: float = 0.001,
+    scale_tolerance: float = 0.001,
+    resample_fps: float = 0.0,
+    deduplicate_meshes: bool = True,
+    import_materials: bool = True,
+    import_armature: bool = True,
+):
+    windowManager = context.window_manager
+    windowManager.progress_begin(0, 100)
+    try:
+        objects = []
+        for buffer, joint in stream:
+            if buffer is not None:
+                obj = wrapBufferToBlender(
+                    context, stream.modelMesh.modelData, buffer, joint,
+                    deduplicate_meshes, import_materials, import_armature
+                )
+                objects.append((obj, len(buffer.boneWeights) > 0))
+                buffer.releaseArrays()
+            windowManager.progress_update(int(stream.progress * 100))
 
-    wrapper.seek(3 + 48, relative=True)
-    modelData.firstLOD = wrapper.readFloat32()
-    modelData.lastLOD = wrapper.readFloat32()
+        modelMesh = stream.modelMesh
+        if simplify_animations:
+            reportSimplifiedAnimations(
+                operator, modelMesh, position_tolerance, rotation_tolerance, scale_tolerance, resample_fps
+            )
+        debugSetDepth(0)
+        wrapRigToBlender(context, modelMesh.modelData, modelMesh, objects, import_armature, globalMatrix)
+    finally:
+        windowManager.progress_end()
 
-    wrapper.seek(16, relative=True)
-    modelData.detailMap = wrapper.readString(64)
 
-    wrapper.seek(4, relative=True)
-    modelData.modelScale = wrapper.readFloat32()
-    modelData.superModel = wrapper.readString(60)
-    modelData.animationScale = wrapper.readFloat32()
+#  operator keywords handled by parse_mdb, the others are for wrapParsedModel
+_PARSE_OPTIONS = (
+    'base_path', 'weight_threshold', 'normalize_weights', 'import_animations', 'animation_filter',
+    'import_supermodel_animations', 'cache_directory',
+)
 
-    wrapper.seek(16, relative=True)
-    return modelData
 
-
-# ---------------------------------------------------------------------
-# ---------------------------------------------------------------------
-# -----------------------------BLENDER---------------------------------
-# ---------------------------------------------------------------------
-# ---------------------------------------------------------------------
+def _splitOptions(options: dict):
+    parseOptions = {name: options.pop(name) for name in _PARSE_OPTIONS if name in options}
+    return parseOptions, options
 
 
-def wrapVerticesToBlender(
-    vertices: List[ModelVertex],
-    indices: List[Tuple[int, int, int]]
+def load(
+    operator,
+    context,
+    filepath="",
+    global_matrix: Matrix = None,
+    **options
 ):
-    vertexes = []
-    faces = []
-    normals = []
-    tangents = []
-    biNormals = []
-
-    for i in range(len(vertices)):
-        vertex = vertices[i]
-
-        vertexes.append((vertex.position.x, vertex.position.y, vertex.position.z))
-        normals.append((vertex.normal.x, vertex.normal.y, vertex.normal.z))
-        tangents.append(
-            (vertex.tangent.x, vertex.tangent.y, vertex.tangent.z)
-                if vertex.tangent is not None
-                else (0, 0, 0)
-        )
-        biNormals.append(
-            (vertex.biNormal.x, vertex.biNormal.y, vertex.biNormal.z)
-                if vertex.biNormal is not None
-                else (0, 0, 0)
-        )
-
-    for indice in indices:
-        faces.append(indice)
-
-    return vertexes, faces, normals, tangents, biNormals
+    globalMatrix = np.array(global_matrix, dtype=np.float64) if global_matrix is not None else _defaultMatrix()
+    parseOptions, wrapOptions = _splitOptions(options)
+    if parseOptions.get('cache_directory'):  # artifacts hold whole models, nothing to stream
+        importedMeshData = parseModel(filepath, global_matrix=globalMatrix, **parseOptions)
+        wrapParsedModel(operator, context, importedMeshData, globalMatrix, **wrapOptions)
+        return {'FINISHED'}
+
+    parseOptions.pop('cache_directory', None)
+    stream = ModelStream(filepath, global_matrix=globalMatrix, **parseOptions)
+    wrapStreamedModel(operator, context, stream, globalMatrix, **wrapOptions)
+    return {'FINISHED'}
 
 
-def wrapToBlender(
+#  Files are parsed by a pool of headless worker processes (arrays come back through shared memory),
+#  this process only builds the Blender data, in completion order
+def loadBatch(
+    operator,
     context,
-    modelData: ModelData,
-    modelMesh: ModelMesh
+    filepaths: List[str],
+    workers: int = 0,
+    global_matrix: Matrix = None,
+    **options
 ):
-    for buffer in modelMesh.meshBuffers:
-        print('wrap to blender', name=buffer.name)
-        mesh: Mesh = bpy.data.meshes.new(name="mesh_{}".format(buffer.name))
-        obj: Object = bpy.data.objects.new(buffer.name, mesh)
-        bpy.context.collection.objects.link(obj)
+    globalMatrix = np.array(global_matrix, dtype=np.float64) if global_matrix is not None else _defaultMatrix()
+    parseOptions, wrapOptions = _splitOptions(options)
+    parseOptions['global_matrix'] = globalMatrix
 
-        vertices, faces, normals, tangents, biNormals = wrapVerticesToBlender(buffer.vertices, buffer.indices)
-        mesh.from_pydata(vertices, [], faces)
-        mesh.vertices.foreach_set('normal', unpack_list(normals))
-        mesh.loops.foreach_set('tangent', unpack_list(tangents))
-        mesh.loops.foreach_set('bitangent', unpack_list(biNormals))
+    try:
+        imported = _importBatch(operator, context, filepaths, workers, globalMatrix, parseOptions, wrapOptions)
+    except BrokenProcessPool as error:
+        operator.report({'ERROR'}, "Parser processes could not be started ({}): {}".format(
+            _getPythonExecutable(), error or "worker exited"
+        ))
+        return {'CANCELLED'}
 
+    operator.report({'INFO'}, "Imported {} of {} files".format(imported, len(filepaths)))
+    return {'FINISHED'}
 
-def load(
+
+#  Python interpreter the parser processes run: sys.executable is the Blender binary itself before 2.91
+def _getPythonExecutable() -> str:
+    return getattr(bpy.app, 'binary_path_python', None) or sys.executable
+
+
+#  Number of files imported, BrokenProcessPool is left to the caller (the pool could not run at all)
+def _importBatch(operator, context, filepaths: List[str], workers: int, globalMatrix, parseOptions, wrapOptions) -> int:
+    # spawn: forking Blender itself is not safe
+    processContext = multiprocessing.get_context('spawn')
+    processContext.set_executable(_getPythonExecutable())
+
+    imported = 0
+    with ProcessPoolExecutor(max_workers=workers or None, mp_context=processContext) as executor:
+        futures = {executor.submit(parseForTransport, filepath, parseOptions): filepath for filepath in filepaths}
+        pending = set(futures)
+        try:
+            for future in as_completed(futures):
+                pending.discard(future)
+                try:
+                    importedMeshData, block = unpackModel(future.result())
+                except BrokenProcessPool:
+                    raise  # every remaining file fails the same way, reported once by loadBatch
+                except Exception as error:
+                    operator.report({'WARNING'}, "{}: {}".format(os.path.basename(futures[future]), error))
+                    continue
+
+                try:
+                    wrapParsedModel(operator, context, importedMeshData, globalMatrix, **wrapOptions)
+                    imported += 1
+                finally:
+                    del importedMeshData
+                    releaseModel(block)
+        finally:
+            # the workers gave up their blocks, the ones never unpacked must be freed here or they outlive Blender
+            for future in pending:
+                future.cancel()
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    discardModel(future.result())
+
+    return imported
+
+
+#  Models read straight from the game archives (KEY/BIF files of archive_directory), nothing is extracted
+def loadResources(
     operator,
     context,
-    filepath="",
-    base_path=None,
+    resource_names: List[str],
+    archive_directory: str,
     global_matrix: Matrix = None,
+    **options
 ):
-    debugSetDepth(0)
-    modelName, modelExtension = os.path.basename(filepath).split('.')
-    baseDirectory = os.path.join(os.path.dirname(filepath), base_path)
-
-    wrapper = FileWrapper.fromFile(open(filepath, "rb"))
+    globalMatrix = np.array(global_matrix, dtype=np.float64) if global_matrix is not None else _defaultMatrix()
+    parseOptions, wrapOptions = _splitOptions(options)
+    parseOptions.pop('base_path', None)
+    parseOptions.pop('cache_directory', None)  # resources are views on the mapped archives already
+
+    imported = 0
+    for resourceName in resource_names:
+        try:
+            importedMeshData = parse_mdb_resource(
+                resourceName, archive_directory, global_matrix=globalMatrix, **parseOptions
+            )
+        except Exception as error:
+            operator.report({'WARNING'}, "{}: {}".format(resourceName, error))
+            continue
+        wrapParsedModel(operator, context, importedMeshData, globalMatrix, **wrapOptions)
+        imported += 1
 
-    modelData = loadMeta(wrapper, baseDirectory, modelName)
-    print(name=modelData.modelName, version=modelData.fileVersion)
+    operator.report({'INFO'}, "Imported {} of {} models".format(imported, len(resource_names)))
+    return {'FINISHED'}
 
-    wrapper.seek(modelData.offsetModelData + modelData.offsetRootNode)
 
-    importedMeshData, postLoad = loadNode(
-        wrapper=wrapper,
-        modelData=modelData,
-        parentMesh=None,
-        parentTransform=global_matrix if global_matrix else _defaultMatrix()
-    )
-
-    debugSetDepth(0)
-    for offset, controllersData, joint in postLoad:
-        wrapper.seek(offset)
-        loadSkinNode(
-            wrapper=wrapper,
-            modelData=modelData,
-            parentMesh=importedMeshData,
-            joint=joint
+# import of one file run from a modal operator: a worker thread parses (Blender data must not be touched there),
+# step() turns what is ready into Blender data within a time budget, cancel() stops and removes what step() created
+class BackgroundImport(object):
+    def __init__(
+        self,
+        operator,
+        context,
+        filepath="",
+        global_matrix: Matrix = None,
+        **options
+    ):
+        super(object, self).__init__()
+        self.operator = operator
+        self.filepath = filepath
+        self.globalMatrix = np.array(global_matrix, dtype=np.float64) if global_matrix is not None \
+            else _defaultMatrix()
+        self.parseOptions, self.wrapOptions = _splitOptions(options)
+
+        # ('buffer', (modelData, buffer, joint)) / ('done', modelMesh) / ('error', error)
+        self.results = queue.Queue(maxsize=16)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.parse, name='mdb import', daemon=True)
+        self.created: List[Tuple[str, str]] = []  # datablocks of this import, see recordDatablocks
+        self.objects: List[Tuple[Object, bool]] = []
+        self.progress = 0.0
+
+    def start(self):
+        self.thread.start()
+
+    # sends to the main thread, False once cancelled
+    def send(self, kind: str, payload) -> bool:
+        while not self.stopping.is_set():
+            try:
+                self.results.put((kind, payload), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # worker thread: streams the file, or reads the whole model from the parse cache
+    def parse(self):
+        try:
+            if self.parseOptions.get('cache_directory'):
+                modelMesh = parseModel(self.filepath, global_matrix=self.globalMatrix, **self.parseOptions)
+                bufferJoints = {
+                    id(buffer): joint for joint in modelMesh.joints for buffer in joint.attachedMeshes
+                }
+                for index, buffer in enumerate(modelMesh.meshBuffers):
+                    self.progress = index / len(modelMesh.meshBuffers)
+                    if self.stopping.is_set() or not self.send('buffer', (modelMesh.modelData, buffer, bufferJoints.get(id(buffer)))):
+                        return
+            else:
+                parseOptions = dict(self.parseOptions)
+                parseOptions.pop('cache_directory', None)
+                stream = ModelStream(self.filepath, global_matrix=self.globalMatrix, **parseOptions)
+                for buffer, joint in stream:  # one step per node, skin and clip
+                    self.progress = stream.progress
+                    if self.stopping.is_set():
+                        return
+                    if buffer is not None and not self.send('buffer', (stream.modelMesh.modelData, buffer, joint)):
+                        return
+                modelMesh = stream.modelMesh
+            self.progress = 1.0
+            self.send('done', modelMesh)
+        except Exception as error:
+            self.send('error', error)
+
+    #  Main thread: wraps the buffers ready so far (at least one, then until timeBudget seconds are spent);
+    #  True once the whole model is in Blender, errors of the worker are raised here
+    def step(self, context, timeBudget: float = 0.02) -> bool:
+        with recordDatablocks(self.created):
+            return self.wrapReady(context, time.perf_counter() + timeBudget)
+
+    def wrapReady(self, context, deadline: float) -> bool:
+        while True:
+            try:
+                kind, payload = self.results.get_nowait()
+            except queue.Empty:
+                return False
+
+            if kind == 'error':
+                raise payload
+            if kind == 'done':
+                self.finish(context, payload)
+                return True
+
+            modelData, buffer, joint = payload
+            debugSetDepth(0)
+            obj = wrapBufferToBlender(
+                context, modelData, buffer, joint,
+                self.wrapOptions.get('deduplicate_meshes', True),
+                self.wrapOptions.get('import_materials', True),
+                self.wrapOptions.get('import_armature', True)
+            )
+            self.objects.append((obj, len(buffer.boneWeights) > 0))
+            buffer.releaseArrays()
+            if time.perf_counter() >= deadline:
+                return False
+
+    def finish(self, context, modelMesh: ModelMesh):
+        if self.wrapOptions.get('simplify_animations', False):
+            reportSimplifiedAnimations(
+                self.operator, modelMesh,
+                self.wrapOptions.get('position_tolerance', 0.001),
+                self.wrapOptions.get('rotation_tolerance', 0.001),
+                self.wrapOptions.get('scale_tolerance', 0.001),
+                self.wrapOptions.get('resample_fps', 0.0)
+            )
+        debugSetDepth(0)
+        wrapRigToBlender(
+            context, modelMesh.modelData, modelMesh, self.objects,
+            self.wrapOptions.get('import_armature', True), self.globalMatrix
         )
 
-    debugSetDepth(0)
-    loadAnimations(
-        wrapper=wrapper,
-        modelData=modelData,
-        parentMesh=importedMeshData
-    )
-
-    debugSetDepth(0)
-    wrapToBlender(
-        context=context,
-        modelData=modelData,
-        modelMesh=importedMeshData
-    )
-
-    return {'FINISHED'}
+    #  Stops the worker and removes every datablock created by the import so far; the worker notices between two
+    #  decoding steps, if it is still busy with a long one (supermodel, cached model) it is left to end on its own
+    #  (it is a daemon and sends nothing more) rather than blocking the UI
+    def cancel(self, timeout: float = 0.2):
+        self.stopping.set()
+        self.thread.join(timeout)
+        self.objects = []
+        removeDatablocks(self.created)
@@ -0,0 +1,1403 @@
+# nk2's craft made of plasticine (level: Kindergarten, 1 year)
+# heavily based on https://github.com/JLouis-B/RedTools/blob/master/W2ENT_QT/IO_MeshLoader_WitcherMDL.cpp
+#  parser core: plain Python + NumPy only (no bpy / mathutils), usable outside Blender
+import inspect
+import os
+import re
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Pattern, Tuple
+
+import numpy as np
+
+from .debug_utils import debugPrint as print, setDepth as debugSetDepth, increaseDepth as debugIncreaseDepth, \
+    decreaseDepth as debugDecreaseDepth
+from .model_types import ControllerType, NodeType
+from .model_data import ModelData, StaticControllersData, ControllersData, ModelMesh, ModelJoint, _defaultMatrix, \
+    ModelBoundingBox, ModelMaterial, ModelMeshBuffer, ModelTextureLayer, ModelBoneWeights, ModelBoundingSphere, \
+    ModelAnimationNode, ModelAnimationMeta, ModelSuperModel
+from .file_utils import FileWrapper, ArrayDefinition, StructLayout, readArray, _dataToString
+from .archive_utils import ResourceProvider, getResourceProvider
+from .session_cache import getCache, fileKey
+
+# version of what parse_mdb produces, bump it whenever that changes (invalidates the parse cache artifacts)
+PARSER_FORMAT_VERSION = 3
+
+
+def _isSet(value):
+    return value == 1
+
+
+def _textureStrings(values):
+    return [
+        "" if textureString == "NULL" else textureString
+        for textureString in map(_dataToString, values)
+    ]
+
+
+#  Mesh node header, shared by trimesh and skin nodes
+MESH_HEADER_LAYOUT = StructLayout('MeshHeader', (
+    (None, '8x'),  # Function pointer
+    ('offMeshArrays', 'I'),
+    (None, '4x'),  # Unknown
+    ('boundingBoxMin', '3f'),
+    ('boundingBoxMax', '3f'),
+    (None, '28x4x16x'),  # Unknown, fog scale, Unknown
+    ('diffuseColor', '3f'),
+    ('ambientColor', '3f'),
+    ('specularColor', '3f'),
+    ('shininess', 'f'),
+    ('shadow', 'I', _isSet),
+    ('beaming', 'I', _isSet),
+    ('render', 'I', _isSet),
+    ('transparencyHint', 'I', _isSet),
+    (None, '4x'),  # Unknown
+    ('textureStrings', '64s64s64s64s', _textureStrings),
+    ('tileFade', 'I', _isSet),
+    ('controlFade', 'b', _isSet),
+    ('lightMapped', 'b', _isSet),
+    ('rotateTexture', 'b', _isSet),
+    (None, 'x'),  # Unknown
+    ('transparencyShift', 'f'),
+    ('defaultRenderList', 'I'),
+    ('preserveVColors', 'I'),
+    ('fourCC', 'I'),
+    (None, '4x'),  # Unknown
+    ('depthOffset', 'f'),
+    ('coronaCenterMult', 'f'),
+    ('fadeStartDistance', 'f'),
+    ('distFromScreenCenterFace', 'b', _isSet),
+    (None, '3x'),  # Unknown
+    ('enlargeStartDistance', 'f'),
+    ('affectedByWind', 'b', _isSet),
+    (None, '3x'),  # Unknown
+    ('dampFactor', 'f'),
+    ('blendGroup', 'I'),
+    ('dayNightLightMaps', 'b', _isSet),
+    ('dayNightTransition', '200s', _dataToString),
+    ('ignoreHitCheck', 'b', _isSet),
+    ('needsReflection', 'b', _isSet),
+    (None, 'x'),  # Unknown
+    ('reflectionPlaneNormal', '3f', list),
+    ('reflectionPlaneDistance', 'f'),
+    ('fadeOnCameraCollision', 'b', _isSet),
+    ('noSelfShadow', 'b', _isSet),
+    ('isReflected', 'b', _isSet),
+    ('onlyReflected', 'b', _isSet),
+    ('lightMapName', '64s', _dataToString),
+    ('canDecal', 'b', _isSet),
+    ('multiBillBoard', 'b', _isSet),
+    ('ignoreLODReflection', 'b', _isSet),
+    ('enableSpecular', 'b', _isSet),
+    ('detailMapScape', 'f'),
+    ('offsetTextureInfo', 'I'),
+))
+
+#  Texture paint node header
+TEXTURE_PAINT_HEADER_LAYOUT = StructLayout('TexturePaintHeader', (
+    ('layersArray', '3I', lambda values: ArrayDefinition(*values)),
+    (None, '28x'),  # Unknown
+    ('offMeshArrays', 'I'),
+    ('sectorIds', '4I'),
+    ('boundingBoxMin', '3f'),
+    ('boundingBoxMax', '3f'),
+    ('diffuseColor', '3f'),
+    ('ambientColor', '3f'),
+    ('specularColor', '3f'),
+    ('shadow', 'I', _isSet),
+    ('render', 'I', _isSet),
+    ('tileFade', 'I', _isSet),
+    ('controlFade', 'b', _isSet),
+    ('lightMapped', 'b', _isSet),
+    ('rotateTexture', 'b', _isSet),
+    (None, 'x'),  # Unknown
+    ('transparencyShift', 'f'),
+    ('defaultRenderList', 'I'),
+    ('fourCC', 'I'),
+    (None, '4x'),  # Unknown
+    ('depthOffset', 'f'),
+    ('blendGroup', 'I'),
+    ('dayNightLightMaps', 'b', _isSet),
+    ('dayNightTransition', '200s', _dataToString),
+    ('ignoreHitCheck', 'b', _isSet),
+    ('needsReflection', 'b', _isSet),
+    (None, 'x'),  # Unknown
+    ('reflectionPlaneNormal', '3f', list),
+    ('reflectionPlaneDistance', 'f'),
+    ('fadeOnCameraCollision', 'b', _isSet),
+    ('noSelfShadow', 'b', _isSet),
+    ('isReflected', 'b', _isSet),
+    (None, 'x'),  # Unknown
+    ('detailMapScape', 'f'),
+    ('onlyReflected', 'b', _isSet),
+    ('lightMapName', '64s', _dataToString),
+    ('canDecal', 'b', _isSet),
+    ('ignoreLODReflection', 'b', _isSet),
+    ('enableSpecular', 'b', _isSet),
+))
+
+#  Animation (clip) header
+ANIMATION_HEADER_LAYOUT = StructLayout('AnimationHeader', (
+    (None, '8x'),  # Function pointers
+    ('name', '64s', _dataToString),
+    ('offsetRootNode', 'I'),
+    (None, '32x'),  # Unknown
+    ('geometryType', 'B'),
+    (None, '3x'),  # Unknown
+    ('length', 'f'),
+    ('transitionTime', 'f'),
+    ('rootName', '64s', _dataToString),
+    ('eventArray', '3I', lambda values: ArrayDefinition(*values)),
+    ('boundingBoxMin', '3f'),
+    ('boundingBoxMax', '3f'),
+    ('boundingSphere', '4f'),
+    (None, '4x'),  # Unknown
+))
+
+_MATERIAL_PARAMETERS = frozenset(inspect.signature(ModelMaterial.setMaterialParameters).parameters) - {'self'}
+
+
+#  Fields of a decoded node header which are material parameters (same names as in ModelMaterial)
+def getMaterialParameters(header):
+    return {
+        name: value for name, value in zip(header._fields, header) if name in _MATERIAL_PARAMETERS
+    }
+
+
+#  Controller key records (one per animated channel of a node)
+_CONTROLLER_KEY_DTYPE = np.dtype([
+    ('type', '<u4'),
+    ('nbRows', '<i2'),
+    ('firstKeyIndex', '<i2'),
+    ('firstValueIndex', '<i2'),
+    ('nbColumns', 'u1'),
+    ('unknown', 'u1')
+])
+
+# columns a controller of each type needs, narrower records are skipped
+_CONTROLLER_COLUMNS = {
+    ControllerType.ControllerPosition: 3,
+    ControllerType.ControllerOrientation: 4,
+    ControllerType.ControllerScale: 1,
+    ControllerType.ControllerSelfIllumColor: 3,
+    ControllerType.ControllerAlpha: 1,
+}
+
+
+#  Function that reads all controllers in mdb-eqsue format
+#  every channel is a (times (K,), values (K, c)) pair of float32 arrays sliced from the controller data
+def readNodeControllers(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    controllerKeyDef: ArrayDefinition,
+    controllerDataDef: ArrayDefinition
+):
+    debugIncreaseDepth()
+    controllers = ControllersData.default()
+    controllerData = readArray(wrapper, modelData, controllerDataDef, wrapper.readFloat32)
+    back = wrapper.offset
+
+    wrapper.seek(modelData.offsetModelData + controllerKeyDef.firstElemOffset)
+    controllerKeys = wrapper.readStructArray(_CONTROLLER_KEY_DTYPE, controllerKeyDef.nbUsedEntries)
+    for type, nbRows, firstKeyIndex, firstValueIndex, nbColumns, _ in controllerKeys.tolist():
+        controllerType = ControllerType(type)
+        print('read node controller', type=controllerType)
+        if nbRows <= 0 or nbColumns == 0:
+            continue
+        if nbColumns < _CONTROLLER_COLUMNS[controllerType]:
+            print('controller skipped, too few columns', type=controllerType, columns=nbColumns)
+            continue
+
+        times = controllerData[firstKeyIndex:firstKeyIndex + nbRows]
+        values = controllerData[firstValueIndex:firstValueIndex + nbRows * nbColumns].reshape(nbRows, nbColumns)
+        if controllerType == ControllerType.ControllerPosition:
+            controllers.positionTime, controllers.position = times, values[:, :3]
+        elif controllerType == ControllerType.ControllerOrientation:
+            controllers.rotationTime, controllers.rotation = times, values[:, :4]
+        elif controllerType == ControllerType.ControllerScale:
+            controllers.scaleTime, controllers.scale = times, values[:, [0, 0, 0]]  # uniform scale
+        elif controllerType == ControllerType.ControllerSelfIllumColor:
+            controllers.selfIllumColorTime, controllers.selfIllumColor = times, values[:, :3]
+        elif controllerType == ControllerType.ControllerAlpha:
+            controllers.alphaTime, controllers.alpha = times, values[:, 0]
+
+    wrapper.seek(back)
+    debugDecreaseDepth()
+    return controllers
+
+
+#  Function that wraps animation for static mesh (which has no animation, only first key)
+def getStaticNodeControllers(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    controllerKeyDef: ArrayDefinition,
+    controllerDataDef: ArrayDefinition
+):
+    controllersData = StaticControllersData.default()
+    controllers = readNodeControllers(wrapper, modelData, controllerKeyDef, controllerDataDef)
+    if len(controllers.position) > 0:
+        controllersData.position = tuple(controllers.position[0].tolist())
+    if len(controllers.rotation) > 0:
+        x, y, z, w = controllers.rotation[0].tolist()  # stored as x, y, z, w
+        controllersData.rotation = (w, x, y, z)
+    if len(controllers.scale) > 0:
+        controllersData.scale = tuple(controllers.scale[0].tolist())
+    if len(controllers.alpha) > 0:
+        controllersData.alpha = float(controllers.alpha[0])
+    if len(controllers.selfIllumColor) > 0:
+        controllersData.selfIllumColor = tuple(controllers.selfIllumColor[0].tolist())
+    controllersData.computeLocalTransform()
+
+    return controllersData
+
+
+_TEXTURE_FOLDERS = ('meshes00', 'textures00', 'textures01')
+_TEXTURE_EXTENSIONS = ('dds', 'txi', 'jpg', 'jpeg')  # by priority, existence probes (!d, !r, ...) also see .txi
+_TEXTURE_IMAGE_EXTENSIONS = ('dds', 'tga', 'jpg', 'jpeg', 'png')  # by priority, images only
+_ARCHIVE_TEXTURE_EXTENSIONS = ('dds', 'tga')  # images only, a .txi sidecar must not hide its .tga
+_MODEL_EXTENSIONS = ('mdb',)
+
+
+def _getTextureFoldersStamp(folders: List[str]):
+    stamp = []
+    for folder in folders:
+        try:
+            stamp.append(os.stat(folder).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+#  Case-insensitive texture name -> {extension: path} map of a base directory, scanned once and cached for the session;
+#  every extension keeps its path in the first folder holding it. revalidate compares the folder modification times
+#  (added/removed files) and rescans if they changed
+def getTextureIndex(baseDirectory: str, revalidate: bool = False):
+    key = os.path.normcase(os.path.abspath(baseDirectory))
+    folders = [os.path.join(baseDirectory, folder) for folder in _TEXTURE_FOLDERS]
+    cached = getCache('textureIndexes').get(key)
+    if cached is not None and not revalidate:
+        return cached[1]
+
+    stamp = _getTextureFoldersStamp(folders)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    extensions = set(_TEXTURE_EXTENSIONS + _TEXTURE_IMAGE_EXTENSIONS)
+    index = {}
+    for folder in folders:
+        try:
+            entries = os.scandir(folder)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                name, extension = os.path.splitext(entry.name)
+                extension = extension[1:].lower()
+                if extension not in extensions or not entry.is_file():
+                    continue
+                index.setdefault(name.lower(), {}).setdefault(extension, entry.path)
+
+    print('texture index', baseDirectory=baseDirectory, textures=len(index))
+    getCache('textureIndexes')[key] = (stamp, index)
+    return index
+
+
+#  Path (or archive resource) of the texture with the first of the extensions found
+def getTexture(
+    modelData: ModelData,
+    name: str,
+    extensions: Tuple[str, ...] = _TEXTURE_EXTENSIONS
+):
+    if modelData.resourceProvider is not None:
+        return modelData.resourceProvider.find(name, _ARCHIVE_TEXTURE_EXTENSIONS)
+    paths = getTextureIndex(modelData.baseDirectory).get(name.lower(), {})
+    return next((paths[extension] for extension in extensions if extension in paths), None)
+
+
+#  Image file (or archive resource) of a texture, a .txi sidecar never hides it
+def findTextureImage(
+    modelData: ModelData,
+    name: str
+):
+    return getTexture(modelData, name, _TEXTURE_IMAGE_EXTENSIONS)
+
+
+def readTextures(
+    wrapper: FileWrapper,
+    modelData: ModelData
+):
+    wrapper.seek(
+        modelData.offsetRawData + modelData.offsetTexData
+            if modelData.fileVersion == 133
+            else modelData.offsetTexData + modelData.offsetTextureInfo
+    )
+
+    textureCount = wrapper.readUInt32()
+    offTexture = wrapper.readUInt32()
+
+    materialContent = ""
+    for i in range(textureCount):
+        line = wrapper.readStringUntilNull()
+        materialContent += "{}\n".format(line)
+
+    return ModelMaterial.fromString(materialContent)
+
+
+def evaluateTextures(
+    modelData: ModelData,
+    material: ModelMaterial,
+    textureCount: int,
+    staticTextureStrings: Optional[List[str]],
+    tVertsArrayDefinitions: List[ArrayDefinition],
+    lightMapDayNight: bool,
+    lightMapName: str
+):
+    material.textures = OrderedDict((
+        ('texture0', material.textures['texture0'] if 'texture0' in material.textures else ''),
+        ('texture1', material.textures['texture1'] if 'texture1' in material.textures else ''),
+        ('texture2', material.textures['texture2'] if 'texture2' in material.textures else ''),
+        ('texture3', material.textures['texture3'] if 'texture3' in material.textures else '')
+    ))
+
+    for t in range(textureCount):
+        textureType = 'texture{}'.format(t)
+        if material.textures[textureType] == "" and staticTextureStrings is not None:
+            material.textures[textureType] = staticTextureStrings[t]
+
+        if tVertsArrayDefinitions[t].nbUsedEntries == 0:
+            material.textures[textureType] = ""
+
+        if material.textures[textureType] == "":
+            continue
+
+        if lightMapDayNight and material.textures[textureType] == lightMapName:
+            if getTexture(modelData, material.textures[textureType] + "!d") is not None:  # dzien
+                material.textures[textureType] = material.textures[textureType] + "!d"
+            elif getTexture(modelData, material.textures[textureType] + "!r") is not None:  # rano
+                material.textures[textureType] = material.textures[textureType] + "!r"
+            elif getTexture(modelData, material.textures[textureType] + "!p") is not None:  # poludnie
+                material.textures[textureType] = material.textures[textureType] + "!p"
+            elif getTexture(modelData, material.textures[textureType] + "!w") is not None:  # wieczor
+                material.textures[textureType] = material.textures[textureType] + "!w"
+            elif getTexture(modelData, material.textures[textureType] + "!n") is not None:  # noc
+                material.textures[textureType] = material.textures[textureType] + "!n"
+            else:
+                material.textures[textureType] = ""
+
+
+#  Face records: plane normal + distance, surface id, (v133: 12 unknown bytes), vertex indices, (v133: 4 unknown bytes)
+_FACE_RECORD_DTYPE_133 = np.dtype({
+    'names': ['plane', 'surface', 'indices'],
+    'formats': [('<f4', (4,)), '<i4', ('<i4', (3,))],
+    'offsets': [0, 16, 32],
+    'itemsize': 48
+})
+_FACE_RECORD_DTYPE_136 = np.dtype({
+    'names': ['plane', 'surface', 'indices'],
+    'formats': [('<f4', (4,)), '<i4', ('<i4', (3,))],
+    'offsets': [0, 16, 20],
+    'itemsize': 32
+})
+
+
+def getFaceRecordDtype(fileVersion: int):
+    return _FACE_RECORD_DTYPE_133 if fileVersion == 133 else _FACE_RECORD_DTYPE_136
+
+
+#  Reads a per-vertex float array as (vertexCount, columns), rows past the used entries stay zero
+def readVertexArray(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    definition: ArrayDefinition,
+    vertexCount: int,
+    columns: int = 3
+):
+    usedEntries = min(definition.nbUsedEntries, vertexCount)
+    wrapper.seek(modelData.offsetRawData + definition.firstElemOffset)
+    if usedEntries == vertexCount:
+        return wrapper.readFloat32Array(vertexCount * columns).reshape(vertexCount, columns)
+
+    data = np.zeros((vertexCount, columns), dtype=np.float32)
+    if usedEntries > 0:
+        data[:usedEntries] = wrapper.readFloat32Array(usedEntries * columns).reshape(usedEntries, columns)
+    return data
+
+
+#  Fills vertex/face arrays of the buffer straight from the mesh arrays
+def readMeshBufferArrays(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    meshBuffer: ModelMeshBuffer,
+    vertexArrayDefinition: ArrayDefinition,
+    normalsArrayDefinition: ArrayDefinition,
+    tangentsArrayDefinition: ArrayDefinition,
+    biNormalsArrayDefinition: ArrayDefinition,
+    tVertsArrayDefinitions: List[ArrayDefinition],
+    facesArrayDefinition: ArrayDefinition
+):
+    vertexCount = max(
+        vertexArrayDefinition.nbUsedEntries,
+        normalsArrayDefinition.nbUsedEntries,
+        tangentsArrayDefinition.nbUsedEntries,
+        biNormalsArrayDefinition.nbUsedEntries
+    )
+
+    meshBuffer.positions = readVertexArray(wrapper, modelData, vertexArrayDefinition, vertexCount)
+    meshBuffer.normals = readVertexArray(wrapper, modelData, normalsArrayDefinition, vertexCount)
+    if tangentsArrayDefinition.nbUsedEntries > 0:
+        meshBuffer.tangents = readVertexArray(wrapper, modelData, tangentsArrayDefinition, vertexCount)
+    if biNormalsArrayDefinition.nbUsedEntries > 0:
+        meshBuffer.biNormals = readVertexArray(wrapper, modelData, biNormalsArrayDefinition, vertexCount)
+
+    wrapper.seek(modelData.offsetRawData + facesArrayDefinition.firstElemOffset)
+    faces = wrapper.readStructArray(getFaceRecordDtype(modelData.fileVersion), facesArrayDefinition.nbUsedEntries)
+    meshBuffer.indices = np.ascontiguousarray(faces['indices'], dtype=np.int32)
+
+    meshBuffer.tCoordChannels = [
+        readVertexArray(wrapper, modelData, tVertsArrayDefinition, vertexCount, columns=2)
+            if tVertsArrayDefinition.nbUsedEntries > 0
+            else None
+        for tVertsArrayDefinition in tVertsArrayDefinitions
+    ]
+
+
+def readMeshNode(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    name: str
+):
+    debugIncreaseDepth()
+    header = wrapper.readLayout(MESH_HEADER_LAYOUT)
+    modelData.offsetTextureInfo = header.offsetTextureInfo
+
+    wrapper.seek(modelData.offsetRawData + header.offMeshArrays)
+    wrapper.seek(4, relative=True)
+
+    vertexArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    normalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    tangentsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    biNormalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    tVertsArrayDefinitions = [
+        ArrayDefinition.fromWrapper(wrapper) for i in range(4)
+    ]
+    unknownArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    facesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+
+    modelData.offsetTexData = wrapper.readUInt32() if modelData.fileVersion == 133 else modelData.offsetTexData
+
+    if vertexArrayDefinition.nbUsedEntries == 0 or facesArrayDefinition.nbUsedEntries == 0:
+        debugDecreaseDepth()
+        return
+
+    material = readTextures(wrapper, modelData)
+    evaluateTextures(
+        modelData, material, 4, header.textureStrings, tVertsArrayDefinitions, header.dayNightLightMaps,
+        header.lightMapName
+    )
+    material.setMaterialParameters(**getMaterialParameters(header))
+    meshBuffer = ModelMeshBuffer(
+        name=name,
+        material=material,
+        boundingBox=ModelBoundingBox(min=header.boundingBoxMin, max=header.boundingBoxMax)
+    )
+    readMeshBufferArrays(
+        wrapper, modelData, meshBuffer, vertexArrayDefinition, normalsArrayDefinition, tangentsArrayDefinition,
+        biNormalsArrayDefinition, tVertsArrayDefinitions[:len(material.textures)], facesArrayDefinition
+    )
+
+    debugDecreaseDepth()
+    # TODO load custom materials based on textureStrings[0] (typically will be __shader__)
+    return meshBuffer
+
+
+def readTexturePaintNode(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    name: str
+):
+    debugIncreaseDepth()
+    header = wrapper.readLayout(TEXTURE_PAINT_HEADER_LAYOUT)
+    layersArrayDefinitions = header.layersArray
+
+    wrapper.seek(modelData.offsetRawData + header.offMeshArrays)
+    wrapper.seek(4, relative=True)
+    vertexArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    normalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    tangentsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    biNormalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    tVertsArrayDefinitions = [
+        ArrayDefinition.fromWrapper(wrapper) for i in range(4)
+    ]
+    unknownArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    facesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+
+    if vertexArrayDefinition.nbUsedEntries == 0 or facesArrayDefinition.nbUsedEntries == 0:
+        debugDecreaseDepth()
+        return
+
+    textureLayers = []
+    for i in range(layersArrayDefinitions.nbUsedEntries):
+        wrapper.seek(modelData.offsetRawData + layersArrayDefinitions.firstElemOffset + i * 52)
+        textureLayer = ModelTextureLayer(hasTexture=wrapper.readByte() == 1)
+
+        if not textureLayer.hasTexture:
+            continue
+
+        wrapper.seek(3 + 4, relative=True)  # Unknown, Offset to material
+        textureLayer.texture = wrapper.readString(32)
+        weightsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+        textureLayer.weights = readArray(wrapper, modelData, weightsArrayDefinition, wrapper.readFloat32)
+        textureLayers.append(textureLayer)
+
+    material = ModelMaterial(
+        textures=OrderedDict((('texture0', header.lightMapName),)),
+        textureStrings=[],
+        **getMaterialParameters(header)
+    )
+    evaluateTextures(
+        modelData, material, 1, None, tVertsArrayDefinitions, header.dayNightLightMaps, header.lightMapName
+    )
+    meshBuffer = ModelMeshBuffer(
+        name=name,
+        material=material,
+        boundingBox=ModelBoundingBox(min=header.boundingBoxMin, max=header.boundingBoxMax),
+        textureLayers=textureLayers
+    )
+    readMeshBufferArrays(
+        wrapper, modelData, meshBuffer, vertexArrayDefinition, normalsArrayDefinition, tangentsArrayDefinition,
+        biNormalsArrayDefinition, tVertsArrayDefinitions[:len(material.textures)], facesArrayDefinition
+    )
+
+    debugDecreaseDepth()
+    # TODO load custom materials based on textureStrings[0] (typically will be __shader__)
+    return meshBuffer
+
+
+#  Groups the 4 influences per vertex by bone; 255 (and out of table) bone indices are unused influences,
+#  weights under weightThreshold are dropped before the remaining ones get normalized;
+#  bonePalette (bone table resolved to joints) attaches the joint to each group
+def groupSkinWeights(
+    weights: np.ndarray,
+    boneIndices: np.ndarray,
+    boneNames: List[str],
+    vertexCount: int,
+    weightThreshold: float = 0.0,
+    normalizeWeights: bool = True,
+    bonePalette: List[Optional[ModelJoint]] = None
+):
+    vertexCount = min(vertexCount, len(weights) // 4, len(boneIndices) // 4)
+    weights = weights[:vertexCount * 4].reshape(vertexCount, 4)
+    boneIndices = boneIndices[:vertexCount * 4].reshape(vertexCount, 4)
+
+    used = (boneIndices != 255) & (boneIndices < len(boneNames))
+    if weightThreshold > 0:
+        used &= weights >= weightThreshold
+
+    weights = np.where(used, weights, 0.0).astype(np.float32)
+    if normalizeWeights:
+        totals = weights.sum(axis=1, keepdims=True)
+        np.divide(weights, totals, out=weights, where=totals > 0)
+
+    vertexIds, influences = np.nonzero(used)
+    bones = boneIndices[vertexIds, influences].astype(np.int64)
+    strengths = weights[vertexIds, influences]
+
+    # influences of a vertex naming the same bone twice add up (one entry per vertex and bone),
+    # the pairs come out sorted by bone then vertex
+    pairs, inverse = np.unique(bones * vertexCount + vertexIds, return_inverse=True)
+    summed = np.zeros(len(pairs), dtype=np.float32)
+    np.add.at(summed, inverse.ravel(), strengths)
+    bones, vertexIds, strengths = pairs // vertexCount, (pairs % vertexCount).astype(np.int32), summed
+    groupBones, groupStarts = np.unique(bones, return_index=True)
+    groupEnds = np.append(groupStarts[1:], len(bones))
+
+    return [
+        ModelBoneWeights(
+            boneName=boneNames[bone],
+            vertexIds=vertexIds[start:end],
+            strengths=strengths[start:end],
+            joint=bonePalette[bone] if bonePalette is not None else None
+        ) for bone, start, end in zip(groupBones.tolist(), groupStarts.tolist(), groupEnds.tolist())
+    ]
+
+
+def readSkinNode(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    parentMesh: ModelMesh,
+    name: str,
+    weightThreshold: float = 0.0,
+    normalizeWeights: bool = True
+):
+    debugIncreaseDepth()
+    header = wrapper.readLayout(MESH_HEADER_LAYOUT)
+    modelData.offsetTextureInfo = header.offsetTextureInfo
+
+    wrapper.seek(4, relative=True)
+    bonesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+
+    back = wrapper.offset
+    wrapper.seek(modelData.offsetTexData + bonesArrayDefinition.firstElemOffset)
+    boneNames = []
+    for i in range(bonesArrayDefinition.nbUsedEntries):
+        boneId = wrapper.readUInt32()
+        boneNames.append(wrapper.readString(92).split('+')[0])  # FIXME seems to collect garbage with name
+    bonePalette = [parentMesh.getJointByName(boneName) for boneName in boneNames]
+
+    wrapper.seek(back)
+    wrapper.seek(4, relative=True)
+    vertexArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    normalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    tangentsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    biNormalsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    tVertsArrayDefinitions = [
+        ArrayDefinition.fromWrapper(wrapper) for i in range(4)
+    ]
+    unknownArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    facesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+
+    print(vertexArrayDefinition, facesArrayDefinition)
+
+    modelData.offsetTexData = wrapper.readUInt32() if modelData.fileVersion == 133 else modelData.offsetTexData
+
+    if vertexArrayDefinition.nbUsedEntries == 0 or facesArrayDefinition.nbUsedEntries == 0:
+        debugDecreaseDepth()
+        return
+
+    wrapper.seek(24 + 12, relative=True)
+    weightsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    weights = readArray(wrapper, modelData, weightsArrayDefinition, wrapper.readFloat32)
+    boneIndicesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    boneIndices = readArray(wrapper, modelData, boneIndicesArrayDefinition, wrapper.readUByte)
+
+    material = readTextures(wrapper, modelData)
+    evaluateTextures(
+        modelData, material, 4, header.textureStrings, tVertsArrayDefinitions, header.dayNightLightMaps,
+        header.lightMapName
+    )
+    material.setMaterialParameters(**getMaterialParameters(header))
+    meshBuffer = ModelMeshBuffer(
+        name=name,
+        material=material,
+        boundingBox=ModelBoundingBox(min=header.boundingBoxMin, max=header.boundingBoxMax),
+        bonePalette=bonePalette
+    )
+    readMeshBufferArrays(
+        wrapper, modelData, meshBuffer, vertexArrayDefinition, normalsArrayDefinition, tangentsArrayDefinition,
+        biNormalsArrayDefinition, tVertsArrayDefinitions[:len(material.textures)], facesArrayDefinition
+    )
+
+    meshBuffer.boneWeights = groupSkinWeights(
+        weights, boneIndices, boneNames, vertexArrayDefinition.nbUsedEntries, weightThreshold, normalizeWeights,
+        bonePalette
+    )
+
+    debugDecreaseDepth()
+    # TODO load custom materials based on textureStrings[0] (typically will be __shader__)
+    return meshBuffer
+
+
+def loadSkinNode(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    joint: ModelJoint,
+    parentMesh: ModelMesh,
+    weightThreshold: float = 0.0,
+    normalizeWeights: bool = True
+):
+    debugIncreaseDepth()
+    print('post load skin node', name=joint.name)
+    meshBuffer = readSkinNode(
+        wrapper=wrapper,
+        modelData=modelData,
+        parentMesh=parentMesh,
+        name=joint.name,
+        weightThreshold=weightThreshold,
+        normalizeWeights=normalizeWeights
+    )
+    if meshBuffer is not None:
+        parentMesh.meshBuffers.append(meshBuffer)
+        joint.attachedMeshes.append(meshBuffer)
+    debugDecreaseDepth()
+    return meshBuffer
+
+
+#  Node count and skin node count of the tree rooted at the current offset (only the node headers are read)
+def countNodes(
+    wrapper: FileWrapper,
+    modelData: ModelData
+) -> Tuple[int, int]:
+    nodeCount, skinCount = 0, 0
+    pending = [wrapper.offset]
+    while pending:
+        offset = pending.pop()
+        nodeCount += 1
+        wrapper.seek(offset + 104)  # Function pointers, inherit color flag, id, name, parent geometry, parent node
+        childrenNodesDef = ArrayDefinition.fromWrapper(wrapper)
+        wrapper.seek(offset + 160)  # controllers, node flags/type, fixed rot + imposter group, LODs
+        if wrapper.readUInt32() == NodeType.NodeTypeSkin.value:
+            skinCount += 1
+        pending.extend(
+            modelData.offsetModelData + childOffset
+            for childOffset in readArray(wrapper, modelData, childrenNodesDef, wrapper.readUInt32).tolist()
+        )
+    return nodeCount, skinCount
+
+
+def loadNode(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    parentMesh: ModelMesh = None,
+    parentTransform: np.ndarray = _defaultMatrix(),
+    # why the fuck in petooh THIS IS A POINTER FOR EVERY RECURSIVE CALL?!
+    postLoad: List[Tuple[int, StaticControllersData, ModelJoint]] = [],
+    loadGeometry: bool = True,
+    parentJoint: ModelJoint = None
+):
+    if parentMesh is None:  # root node
+        parentMesh = ModelMesh()
+    for _ in iterNode(wrapper, modelData, parentMesh, parentTransform, postLoad, loadGeometry, parentJoint):
+        pass
+    return parentMesh, postLoad
+
+
+#  Decodes the node tree depth first, yielding (mesh buffer or None, joint) once each node is decoded;
+#  skin nodes are only queued in postLoad (they need the whole tree)
+def iterNode(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    parentMesh: ModelMesh,
+    parentTransform: np.ndarray,
+    postLoad: List[Tuple[int, StaticControllersData, ModelJoint]],
+    loadGeometry: bool = True,
+    parentJoint: ModelJoint = None
+) -> Iterator[Tuple[Optional[ModelMeshBuffer], ModelJoint]]:
+    debugIncreaseDepth()
+
+    wrapper.seek(24 + 4, relative=True)  # Function pointers, inherit color flag
+    id = wrapper.readUInt32()
+    name = wrapper.readString(64)
+
+    wrapper.seek(8, relative=True)  # parent geometry, parent node
+    childrenNodesDef = ArrayDefinition.fromWrapper(wrapper)
+    children = readArray(wrapper, modelData, childrenNodesDef, wrapper.readUInt32)
+
+    controllerKeyDef = ArrayDefinition.fromWrapper(wrapper)
+    controllerDataDef = ArrayDefinition.fromWrapper(wrapper)
+
+    controllersData = getStaticNodeControllers(wrapper, modelData, controllerKeyDef, controllerDataDef)
+    controllersData.globalTransform = parentTransform @ controllersData.localTransform
+
+    wrapper.seek(4 + 8, relative=True)  # node flags/type, fixed rot + imposter group ?
+    minLOD = wrapper.readInt32()
+    maxLOD = wrapper.readInt32()
+    type = NodeType(wrapper.readUInt32())
+
+    joint = parentMesh.jointsByName.get(name)  # not the supermodel ones, they are shared
+    if joint is None:
+        joint = ModelJoint(
+            localMatrix=controllersData.localTransform,
+            globalMatrix=controllersData.globalTransform,
+            name=name,
+            animatedPosition=controllersData.position,
+            animatedScale=controllersData.scale,
+            animatedRotation=controllersData.rotation,#.invert()
+            parent=parentJoint
+        )
+        parentMesh.addJoint(joint)
+        if parentJoint is not None:
+            parentJoint.children.append(joint)
+
+    print('load node', name=name, type=type)
+
+    meshBuffer = None
+    if not loadGeometry:
+        pass
+    elif type == NodeType.NodeTypeTrimesh:
+        meshBuffer = readMeshNode(wrapper, modelData, joint.name)
+    elif type == NodeType.NodeTypeSkin:
+        # these should be loaded after other types
+        postLoad.append((wrapper.offset, controllersData, joint))
+    elif type == NodeType.NodeTypeSpeedTree:
+        print('spt node should be loaded')
+        # TODO SPT NODE LOADING
+    elif type == NodeType.NodeTypeTexturePaint:
+        meshBuffer = readTexturePaintNode(wrapper, modelData, joint.name)
+
+    if meshBuffer is not None:
+        print('attach buffer')
+        parentMesh.meshBuffers.append(meshBuffer)
+        joint.attachedMeshes.append(meshBuffer)
+    yield meshBuffer, joint
+
+    for childOffset in children.tolist():
+        wrapper.seek(modelData.offsetModelData + childOffset)
+        yield from iterNode(
+            wrapper, modelData, parentMesh, controllersData.globalTransform, postLoad, loadGeometry, joint
+        )
+
+    debugDecreaseDepth()
+
+
+def readAnimationNode(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    parentMesh: ModelMesh,
+    children: List[ModelAnimationNode] = []
+):
+    debugIncreaseDepth()
+    wrapper.seek(24 + 4, relative=True)  # Function pointers, inherit color flag
+    id = wrapper.readUInt32()
+    name = wrapper.readString(64)
+
+    wrapper.seek(8, relative=True)  # parent geometry + parent node
+    childNodesArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    childNodes = readArray(wrapper, modelData, childNodesArrayDefinition, wrapper.readUInt32)
+
+    controllerKeyArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    controllerDataArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    controllers = readNodeControllers(wrapper, modelData, controllerKeyArrayDefinition, controllerDataArrayDefinition)
+
+    wrapper.seek(4 + 8, relative=True)  # node flags/type, fixed rot + imposter group ?
+    minLOD = wrapper.readFloat32()
+    maxLOD = wrapper.readFloat32()
+    type = NodeType(wrapper.readUInt32())
+
+    animation = ModelAnimationNode(
+        id=id,
+        name=name,
+        minLOD=minLOD,
+        maxLOD=maxLOD,
+        joint=parentMesh.getJointByName(name)
+    )
+
+    print('read animation node', id=id, name=name)
+    if animation.joint is not None:
+        animation.positionTime, animation.position = controllers.positionTime, controllers.position
+        animation.rotationTime, animation.rotation = controllers.rotationTime, controllers.rotation
+        animation.scaleTime, animation.scale = controllers.scaleTime, controllers.scale
+        # TODO check if other types of controllers required
+
+    for childNodeOffset in childNodes.tolist():
+        wrapper.seek(modelData.offsetModelData + childNodeOffset)
+        animation.children.append(readAnimationNode(wrapper, modelData, parentMesh, []))
+
+    debugDecreaseDepth()
+    return animation
+
+
+#  Reads only the clip headers (name, length, bounds, root node offset...), no animation node is decoded
+def readAnimationDirectory(
+    wrapper: FileWrapper,
+    modelData: ModelData
+):
+    debugIncreaseDepth()
+    wrapper.seek(
+        modelData.offsetModelData + modelData.offsetRawData
+            if modelData.fileVersion == 133
+            else modelData.offsetTexData
+    )
+    chunkStart = wrapper.offset
+
+    wrapper.seek(4, relative=True)
+    animationsArrayDefinition = ArrayDefinition.fromWrapper(wrapper)
+    wrapper.seek(chunkStart + animationsArrayDefinition.firstElemOffset)
+    animationOffsets = wrapper.readUInt32Array(animationsArrayDefinition.nbUsedEntries)
+
+    animations = []
+    for animationOffset in animationOffsets.tolist():
+        wrapper.seek(modelData.offsetModelData + animationOffset)
+        header = wrapper.readLayout(ANIMATION_HEADER_LAYOUT)
+
+        print('read animation', rootName=header.rootName, name=header.name, length=header.length)
+        animations.append(ModelAnimationMeta(
+            name=header.name,
+            rootName=header.rootName,
+            animationNode=None,
+            length=header.length,
+            transitionTime=header.transitionTime,
+            animationBox=ModelBoundingBox(min=header.boundingBoxMin, max=header.boundingBoxMax),
+            animationSphere=ModelBoundingSphere(*header.boundingSphere),
+            offsetRootNode=header.offsetRootNode
+        ))
+
+    debugDecreaseDepth()
+    return animations
+
+
+#  Decodes the node tree of a clip from the directory
+def loadAnimation(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    parentMesh: ModelMesh,
+    animation: ModelAnimationMeta
+):
+    debugIncreaseDepth()
+    print('load animation', name=animation.name)
+    wrapper.seek(modelData.offsetModelData + animation.offsetRootNode)
+    animation.animationNode = readAnimationNode(wrapper, modelData, parentMesh)
+    debugDecreaseDepth()
+    return animation
+
+
+#  Adds the clip directory to the mesh and decodes the clips whose name matches animationFilter (all if None)
+def loadAnimations(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    parentMesh: ModelMesh,
+    animationFilter: Optional[Pattern] = None
+):
+    for _ in iterAnimations(wrapper, modelData, parentMesh, animationFilter):
+        pass
+
+
+#  Reads the clip directory into parentMesh, then decodes the clips matching animationFilter, yielding after each one
+def iterAnimations(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    parentMesh: ModelMesh,
+    animationFilter: Optional[Pattern] = None
+) -> Iterator[ModelAnimationMeta]:
+    debugIncreaseDepth()
+    animations = readAnimationDirectory(wrapper, modelData)
+    parentMesh.animations.extend(animations)
+
+    for animation in animations:
+        if animationFilter is None or animationFilter.search(animation.name):
+            loadAnimation(wrapper, modelData, parentMesh, animation)
+            yield animation
+    debugDecreaseDepth()
+
+
+#  Clips iterAnimations (and iterSuperModelAnimations when superModel is given) will decode
+def countAnimations(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    animationFilter: Optional[Pattern] = None,
+    superModel: Optional[ModelSuperModel] = None
+) -> int:
+    back = wrapper.offset
+    count = sum(
+        1 for animation in readAnimationDirectory(wrapper, modelData)
+        if animationFilter is None or animationFilter.search(animation.name)
+    )
+    wrapper.seek(back)
+    return count + len(_selectSuperModelAnimations(superModel, animationFilter)[1])
+
+
+#  Clip name filter from the user: regular expression, or plain substring if it is not a valid one
+def compileAnimationFilter(animationFilter: str) -> Optional[Pattern]:
+    if not animationFilter:
+        return None
+    try:
+        return re.compile(animationFilter, re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(animationFilter), re.IGNORECASE)
+
+
+#  Supermodel file (.mdb, else .mba) from the first search directory containing it
+def resolveSuperModelPath(superModelName: str, searchDirectories: List[str]) -> Optional[str]:
+    for directory in searchDirectories:
+        for extension in ('.mdb', '.mba'):
+            for fileName in (superModelName + extension, superModelName.lower() + extension):
+                path = os.path.join(directory, fileName)
+                if os.path.isfile(path):
+                    return path
+    return None
+
+
+#  Wrapper over a model file (mapped) or an archive resource (view on the mapped archive)
+def openSource(source) -> FileWrapper:
+    if isinstance(source, str):
+        return FileWrapper.fromFile(open(source, "rb"), mapped=True)
+    return source.openWrapper()
+
+
+#  Identifies a model file version or an archive resource (archives are reindexed when they change)
+def getSourceKey(source):
+    if isinstance(source, str):
+        return fileKey(source)
+    archivePath, size, mtime = fileKey(source.archive.path)
+    return "{}#{}".format(archivePath, source.resourceIndex), size, mtime
+
+
+#  Parses the supermodel chain once per session: skeleton (no geometry) and clip directory, cached by file
+def loadSuperModel(
+    superModelName: str,
+    searchDirectories: List[str],
+    visitedPaths: Optional[set] = None,
+    provider: Optional[ResourceProvider] = None
+) -> Optional[ModelSuperModel]:
+    if superModelName.lower() in ('', 'null'):
+        return None
+
+    if provider is not None:
+        source = provider.find(superModelName, _MODEL_EXTENSIONS)
+    else:
+        source = resolveSuperModelPath(superModelName, searchDirectories)
+    if source is None:
+        print('supermodel not found', name=superModelName)
+        return None
+    return loadSuperModelSource(source, searchDirectories, visitedPaths, provider)
+
+
+#  Supermodel (and its chain) of an already resolved file path or archive resource, cached by source
+def loadSuperModelSource(
+    source,
+    searchDirectories: List[str],
+    visitedPaths: Optional[set] = None,
+    provider: Optional[ResourceProvider] = None
+) -> Optional[ModelSuperModel]:
+    visitedPaths = set() if visitedPaths is None else visitedPaths
+    key = getSourceKey(source)
+    if key[0] in visitedPaths:
+        print('supermodel loop', source=source)
+        return None
+    visitedPaths.add(key[0])
+
+    superModels = getCache('superModels')
+    superModel = superModels.get(key)
+    if superModel is not None:
+        return superModel
+
+    debugIncreaseDepth()
+    print('load supermodel', source=source)
+    with openSource(source) as wrapper:
+        if provider is not None:
+            modelData = loadMeta(wrapper, provider.archiveDirectory, source.name)
+            modelData.resourceProvider = provider
+        else:
+            modelData = loadMeta(wrapper, os.path.dirname(source), os.path.splitext(os.path.basename(source))[0])
+        parent = loadSuperModel(modelData.superModel, searchDirectories, visitedPaths, provider)
+
+        skeleton = ModelMesh(superMesh=parent.skeleton if parent is not None else None)
+        wrapper.seek(modelData.offsetModelData + modelData.offsetRootNode)
+        loadNode(wrapper, modelData, skeleton, _defaultMatrix(), [], loadGeometry=False)
+        skeleton.animations = readAnimationDirectory(wrapper, modelData)
+    debugDecreaseDepth()
+
+    superModel = ModelSuperModel(
+        source=source, modelData=modelData, skeleton=skeleton, parent=parent, searchDirectories=searchDirectories
+    )
+    superModels[key] = superModel
+    return superModel
+
+
+#  Pickle references to the objects of the supermodel chain used by modelMesh: they are shared by every model of the
+#  session, so parse cache artifacts and worker transports refer to them instead of carrying copies
+def getSuperModelReferences(modelMesh: ModelMesh) -> dict:
+    superModel = None
+    if modelMesh.superMesh is not None:
+        superModel = next(
+            (cached for cached in getCache('superModels').values() if cached.skeleton is modelMesh.superMesh), None
+        )
+
+    references = {}
+    while superModel is not None:
+        base = (superModel.source, tuple(superModel.searchDirectories), getSourceKey(superModel.source))
+        references[id(superModel)] = base + ('superModel', 0)
+        references[id(superModel.skeleton)] = base + ('skeleton', 0)
+        references[id(superModel.modelData)] = base + ('modelData', 0)
+        for index, joint in enumerate(superModel.skeleton.joints):
+            references[id(joint)] = base + ('joint', index)
+        for index, animation in enumerate(superModel.skeleton.animations):
+            references[id(animation)] = base + ('animation', index)
+        superModel = superModel.parent
+    return references
+
+
+#  Resolver of the references of getSuperModelReferences for one load: the supermodels are loaded if needed and checked
+#  once, LookupError when one is gone or changed since
+def makeSuperModelResolver():
+    superModels = {}
+
+    def resolve(reference):
+        source, searchDirectories, sourceKey, kind, index = reference
+        superModel = superModels.get(sourceKey)
+        if superModel is None:
+            try:
+                if getSourceKey(source) != sourceKey:
+                    raise LookupError('supermodel changed: {!r}'.format(source))
+            except OSError:
+                raise LookupError('supermodel not found: {!r}'.format(source))
+
+            provider = getResourceProvider(source.archiveDirectory) if not isinstance(source, str) else None
+            superModel = loadSuperModelSource(source, list(searchDirectories), provider=provider)
+            if superModel is None:
+                raise LookupError('supermodel not loaded: {!r}'.format(source))
+            superModels[sourceKey] = superModel
+
+        if kind == 'superModel':
+            return superModel
+        if kind == 'skeleton':
+            return superModel.skeleton
+        if kind == 'modelData':
+            return superModel.modelData
+        if kind == 'joint':
+            return superModel.skeleton.joints[index]
+        return superModel.skeleton.animations[index]
+
+    return resolve
+
+
+#  Clips of the supermodel chain matching animationFilter (nearest supermodel wins on name clashes),
+#  each one decoded at most once per session; copies are returned so they can be modified freely
+def loadSuperModelAnimations(
+    superModel: Optional[ModelSuperModel],
+    animationFilter: Optional[Pattern] = None
+) -> List[ModelAnimationMeta]:
+    animations = []
+    for _ in iterSuperModelAnimations(superModel, animations, animationFilter):
+        pass
+    return animations
+
+
+#  (selected clips, the ones still to decode) for each supermodel of the chain
+def _selectSuperModelAnimations(
+    superModel: Optional[ModelSuperModel],
+    animationFilter: Optional[Pattern] = None
+) -> Tuple[List[Tuple[ModelSuperModel, List[ModelAnimationMeta]]], List[ModelAnimationMeta]]:
+    chain, pending = [], []
+    names = set()
+    while superModel is not None:
+        selected = [
+            animation for animation in superModel.skeleton.animations
+            if animation.name not in names and (animationFilter is None or animationFilter.search(animation.name))
+        ]
+        chain.append((superModel, selected))
+        pending.extend(animation for animation in selected if not animation.isLoaded)
+        names.update(animation.name for animation in selected)
+        superModel = superModel.parent
+    return chain, pending
+
+
+#  Same as loadSuperModelAnimations, the copies being appended to animations, yielding after each decoded clip
+def iterSuperModelAnimations(
+    superModel: Optional[ModelSuperModel],
+    animations: List[ModelAnimationMeta],
+    animationFilter: Optional[Pattern] = None
+) -> Iterator[ModelAnimationMeta]:
+    for superModel, selected in _selectSuperModelAnimations(superModel, animationFilter)[0]:
+        pending = [animation for animation in selected if not animation.isLoaded]
+        if pending:
+            with openSource(superModel.source) as wrapper:
+                for animation in pending:
+                    loadAnimation(wrapper, superModel.modelData, superModel.skeleton, animation)
+                    yield animation
+
+        animations.extend(animation.copy() for animation in selected)
+
+
+def loadMeta(
+    wrapper: FileWrapper,
+    baseDirectory: str,
+    modelName: str
+):
+    if wrapper.readByte() != 0:
+        raise Exception('File is not binary!')
+
+    wrapper.seek(4)
+    fileVersion = wrapper.readUInt32() & 0x0fffffff
+    modelCount = wrapper.readUInt32()
+    offsetModelData = 32
+    if fileVersion not in [133, 136] and modelCount != 1:
+        raise Exception(
+            'Version 133 or 136 expected, got {0}; Model count 1 expected, got {1}'
+                .format(fileVersion, modelCount)
+        )
+
+    wrapper.seek(4, relative=True)
+    sizeModelData = wrapper.readUInt32()
+
+    wrapper.seek(4, relative=True)
+    modelData = ModelData(
+        baseDirectory=baseDirectory,
+        modelName=modelName,
+        fileVersion=fileVersion,
+        offsetModelData=offsetModelData,
+        sizeModelData=sizeModelData,
+        offsetRawData=wrapper.readUInt32() + offsetModelData if fileVersion == 133 else offsetModelData,
+        sizeRawData=wrapper.readUInt32() if fileVersion == 133 else 0,
+        offsetTexData=wrapper.readUInt32() + offsetModelData if fileVersion == 136 else offsetModelData,
+        sizeTexData=wrapper.readUInt32() if fileVersion == 136 else 0,
+        offsetTextureInfo=-1,  # will be filled later
+        offsetRootNode=-1,
+        modelType=-1,
+        firstLOD=-1,
+        lastLOD=-1,
+        detailMap='',
+        modelScale=-1,
+        superModel='',
+        animationScale=-1
+    )
+
+    wrapper.seek(8, relative=True)
+    modelData.name = wrapper.readString(64)
+
+    modelData.offsetRootNode = wrapper.readUInt32()
+    wrapper.seek(32, relative=True)
+    modelData.type = wrapper.readUByte()
+
+    wrapper.seek(3 + 48, relative=True)
+    modelData.firstLOD = wrapper.readFloat32()
+    modelData.lastLOD = wrapper.readFloat32()
+
+    wrapper.seek(16, relative=True)
+    modelData.detailMap = wrapper.readString(64)
+
+    wrapper.seek(4, relative=True)
+    modelData.modelScale = wrapper.readFloat32()
+    modelData.superModel = wrapper.readString(60)
+    modelData.animationScale = wrapper.readFloat32()
+
+    wrapper.seek(16, relative=True)
+    return modelData
+
+
+#  Decodes the model into modelMesh, yielding (mesh buffer or None, joint or None) after each node, skin and
+#  decoded clip; modelMesh is complete (skin weights, animations) once the generator is exhausted
+def iterParseWrapper(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    modelMesh: ModelMesh,
+    superModel: Optional[ModelSuperModel],
+    global_matrix: Optional[np.ndarray] = None,
+    weight_threshold: float = 0.0,
+    normalize_weights: bool = True,
+    import_animations: bool = True,
+    animation_filter: str = "",
+    import_supermodel_animations: bool = False,
+) -> Iterator[Tuple[Optional[ModelMeshBuffer], Optional[ModelJoint]]]:
+    debugSetDepth(0)
+    modelMesh.modelData = modelData
+    wrapper.seek(modelData.offsetModelData + modelData.offsetRootNode)
+
+    postLoad = []
+    yield from iterNode(
+        wrapper=wrapper,
+        modelData=modelData,
+        parentMesh=modelMesh,
+        parentTransform=np.asarray(global_matrix, dtype=np.float64) if global_matrix is not None
+            else _defaultMatrix(),
+        postLoad=postLoad
+    )
+
+    debugSetDepth(0)
+    for offset, controllersData, joint in postLoad:
+        wrapper.seek(offset)
+        meshBuffer = loadSkinNode(
+            wrapper=wrapper,
+            modelData=modelData,
+            parentMesh=modelMesh,
+            joint=joint,
+            weightThreshold=weight_threshold,
+            normalizeWeights=normalize_weights
+        )
+        yield meshBuffer, joint
+
+    if import_animations:
+        debugSetDepth(0)
+        animationFilter = compileAnimationFilter(animation_filter)
+        for _ in iterAnimations(wrapper, modelData, modelMesh, animationFilter):
+            yield None, None
+        if import_supermodel_animations:
+            for _ in iterSuperModelAnimations(superModel, modelMesh.animations, animationFilter):
+                yield None, None
+
+
+#  Model, skin weights and animations read from wrapper once its metadata is known
+def parseWrapper(
+    wrapper: FileWrapper,
+    modelData: ModelData,
+    superModel: Optional[ModelSuperModel],
+    **options
+) -> ModelMesh:
+    modelMesh = ModelMesh(superMesh=superModel.skeleton if superModel is not None else None)
+    for _ in iterParseWrapper(wrapper, modelData, modelMesh, superModel, **options):
+        pass
+    return modelMesh
+
+
+#  Incremental parse of a file: iterating yields (mesh buffer or None, joint or None) after each decoding step (node,
+#  skin, clip), so the caller can consume (and drop) the buffers and report progress while the rest is parsed;
+#  modelMesh is complete once the iteration ends
+class ModelStream(object):
+    def __init__(self, path: str, base_path: str = '../', **options):
+        super(object, self).__init__()
+        self.path = path
+        self.basePath = base_path
+        self.options = options
+        self.modelMesh: Optional[ModelMesh] = None
+        self.stepCount = 0  # nodes, skins and clips to decode
+        self.loadedCount = 0
+
+    # fraction of the decoding steps done so far
+    @property
+    def progress(self) -> float:
+        return self.loadedCount / self.stepCount if self.stepCount > 0 else 0.0
+
+    def __iter__(self) -> Iterator[Tuple[Optional[ModelMeshBuffer], Optional[ModelJoint]]]:
+        debugSetDepth(0)
+        modelName = os.path.splitext(os.path.basename(self.path))[0]
+        baseDirectory = os.path.join(os.path.dirname(self.path), self.basePath)
+
+        with FileWrapper.fromFile(open(self.path, "rb"), mapped=True) as wrapper:
+            modelData = loadMeta(wrapper, baseDirectory, modelName)
+            print(name=modelData.modelName, version=modelData.fileVersion)
+            getTextureIndex(baseDirectory, revalidate=True)
+
+            superModel = loadSuperModel(
+                modelData.superModel,
+                [os.path.dirname(self.path), baseDirectory, os.path.join(baseDirectory, 'meshes00')]
+            )
+
+            wrapper.seek(modelData.offsetModelData + modelData.offsetRootNode)
+            self.stepCount = sum(countNodes(wrapper, modelData))
+            if self.options.get('import_animations', True):
+                self.stepCount += countAnimations(
+                    wrapper,
+                    modelData,
+                    compileAnimationFilter(self.options.get('animation_filter', "")),
+                    superModel if self.options.get('import_supermodel_animations', False) else None
+                )
+
+            self.modelMesh = ModelMesh(superMesh=superModel.skeleton if superModel is not None else None)
+            for step in iterParseWrapper(wrapper, modelData, self.modelMesh, superModel, **self.options):
+                self.loadedCount += 1
+                yield step
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__name__, self.path)
+
+
+#  Parses a model file into a ModelMesh (arrays and tuples only, modelMesh.modelData holds the file header);
+#  base_path is relative to the model folder, global_matrix a (4, 4) array applied to the root node
+def parse_mdb(
+    path: str,
+    base_path: str = '../',
+    **options
+) -> ModelMesh:
+    stream = ModelStream(path, base_path, **options)
+    for _ in stream:
+        pass
+    return stream.modelMesh
+
+
+#  Same as parse_mdb for a model stored in the game archives (KEY files of archive_directory), read in place
+def parse_mdb_resource(
+    resource_name: str,
+    archive_directory: str,
+    **options
+) -> ModelMesh:
+    debugSetDepth(0)
+    provider = getResourceProvider(archive_directory)
+    resource = provider.find(resource_name, _MODEL_EXTENSIONS)
+    if resource is None:
+        raise Exception('Model {} not found in the archives of {}'.format(resource_name, archive_directory))
+
+    with resource.openWrapper() as wrapper:
+        modelData = loadMeta(wrapper, archive_directory, resource.name)
+        modelData.resourceProvider = provider
+        print(name=modelData.modelName, version=modelData.fileVersion, source=resource)
+
+        superModel = loadSuperModel(modelData.superModel, [], provider=provider)
+        return parseWrapper(wrapper, modelData, superModel, **options)
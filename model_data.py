@@ -2,13 +2,22 @@
 #  [notification to myself]
 #  [notification to myself] DONT EVEN TRY TO USE BLENDER OBJECT TYPES HERE, BASTARD!
 #  [notification to myself]
+import copy
+import hashlib
 import os
 import re
 from collections import OrderedDict
 from enum import Enum
 
-from mathutils import Vector, Quaternion, Matrix, Color, Euler
-from typing import List, Tuple, Dict, OrderedDict as TOrderedDict
+import numpy as np
+from typing import List, Optional, Tuple, Dict, OrderedDict as TOrderedDict
+
+#  plain value types, this module must stay importable without Blender (no mathutils)
+Vector2 = Tuple[float, float]
+Vector3 = Tuple[float, float, float]
+Quaternion4 = Tuple[float, float, float, float]  # w, x, y, z
+Color3 = Tuple[float, float, float]
+Matrix4 = np.ndarray  # (4, 4) float64, column vectors (translation in the last column)
 
 
 class ModelData(object):
@@ -51,23 +60,34 @@ class ModelData(object):
         self.modelScale = modelScale
         self.superModel = superModel
         self.animationScale = animationScale
+        self.resourceProvider = None  # archive_utils.ResourceProvider when read from the game archives
 
     def __repr__(self) -> str:
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
 
 
 def _defaultMatrix():
-    return Matrix([
-        [0, 0, 0, 0],
-        [0, 0, 0, 0],
-        [0, 0, 0, 0],
-        [0, 0, 0, 0]
+    return np.identity(4)
+
+
+#  (3, 3) rotation matrix of a unit quaternion (w, x, y, z)
+def quaternionToMatrix(rotation: Quaternion4) -> np.ndarray:
+    w, x, y, z = rotation
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]
     ])
 
 
+def normalizeQuaternion(rotation: Quaternion4) -> Quaternion4:
+    length = float(np.sqrt(sum(value * value for value in rotation)))
+    return tuple(value / length for value in rotation) if length > 0 else (1.0, .0, .0, .0)
+
+
 class StaticControllersData(object):
-    def __init__(self, position: Vector, rotation: Quaternion, scale: Vector, localTransform: Matrix,
-                 globalTransform: Matrix, alpha: float, selfIllumColor: Color = None):
+    def __init__(self, position: Vector3, rotation: Quaternion4, scale: Vector3, localTransform: Matrix4,
+                 globalTransform: Matrix4, alpha: float, selfIllumColor: Color3 = None):
         super().__init__()
         self.position = position
         self.rotation = rotation
@@ -81,18 +101,18 @@ class StaticControllersData(object):
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
 
     def computeLocalTransform(self):
-        qPos = Matrix.Translation((self.position.x, self.position.y, self.position.z))
-        qRot = Euler((self.rotation.x, self.rotation.y, self.rotation.z)).to_matrix().to_4x4()
-        qScale = Matrix.Scale(1.0, 4, (self.scale.x, self.scale.y, self.scale.z))
+        transform = np.identity(4)
+        transform[:3, :3] = quaternionToMatrix(normalizeQuaternion(self.rotation)) * np.asarray(self.scale)
+        transform[:3, 3] = self.position
 
-        self.localTransform = qPos @ qRot @ qScale
+        self.localTransform = transform
 
     @classmethod
     def default(cls):
         return cls(
-            Vector((.0, .0, .0)),
-            Quaternion((.0, .0, .0, .0)),
-            Vector((1.0, 1.0, 1.0)),
+            (.0, .0, .0),
+            (1.0, .0, .0, .0),
+            (1.0, 1.0, 1.0),
             _defaultMatrix(),
             _defaultMatrix(),
             1.0,
@@ -100,18 +120,28 @@ class StaticControllersData(object):
         )
 
 
+def _emptyTimes():
+    return np.zeros(0, dtype=np.float32)
+
+
+def _emptyValues(columns: int):
+    return np.zeros((0, columns), dtype=np.float32)
+
+
+# animated channels, times are (K,) float32 and values (K, c) float32 arrays
+# (rotation keeps the 4 components in file order, alpha values are (K,))
 class ControllersData(object):
     def __init__(self,
-                 positionTime: List[float],
-                 position: List[Vector],
-                 rotationTime: List[float],
-                 rotation: List[Quaternion],
-                 scaleTime: List[float],
-                 scale: List[Vector],
-                 alphaTime: List[float],
-                 alpha: List[float],
-                 selfIllumColorTime: List[float],
-                 selfIllumColor: List[Color]
+                 positionTime: np.ndarray,
+                 position: np.ndarray,
+                 rotationTime: np.ndarray,
+                 rotation: np.ndarray,
+                 scaleTime: np.ndarray,
+                 scale: np.ndarray,
+                 alphaTime: np.ndarray,
+                 alpha: np.ndarray,
+                 selfIllumColorTime: np.ndarray,
+                 selfIllumColor: np.ndarray
                  ):
         super().__init__()
         self.positionTime = positionTime
@@ -127,15 +157,21 @@ class ControllersData(object):
 
     @classmethod
     def default(cls):
-        return cls([], [], [], [], [], [], [], [], [], [])
+        return cls(
+            _emptyTimes(), _emptyValues(3),
+            _emptyTimes(), _emptyValues(4),
+            _emptyTimes(), _emptyValues(3),
+            _emptyTimes(), _emptyTimes(),
+            _emptyTimes(), _emptyValues(3)
+        )
 
 
 class ModelWeight(object):
     def __init__(self,
                  vertexId: int,
                  strength: float,
-                 staticPos: Vector = None,
-                 staticNormal: Vector = None
+                 staticPos: Vector3 = None,
+                 staticNormal: Vector3 = None
                  ):
         super().__init__()
         self.vertexId = vertexId
@@ -148,7 +184,7 @@ class ModelWeight(object):
 
 
 class ModelPositionKey(object):
-    def __init__(self, frame: int, position: Vector):
+    def __init__(self, frame: int, position: Vector3):
         super().__init__()
         self.frame = frame
         self.position = position
@@ -158,7 +194,7 @@ class ModelPositionKey(object):
 
 
 class ModelScaleKey(object):
-    def __init__(self, frame: int, scale: Vector):
+    def __init__(self, frame: int, scale: Vector3):
         super().__init__()
         self.frame = frame
         self.scale = scale
@@ -168,7 +204,7 @@ class ModelScaleKey(object):
 
 
 class ModelRotationKey(object):
-    def __init__(self, frame: int, rotation: Quaternion):
+    def __init__(self, frame: int, rotation: Quaternion4):
         super().__init__()
         self.frame = frame
         self.rotation = rotation
@@ -180,19 +216,20 @@ class ModelRotationKey(object):
 class ModelJoint(object):
     def __init__(self,
                  name: str,
-                 animatedPosition: Vector,
-                 animatedScale: Vector,
-                 animatedRotation: Vector,
-                 localMatrix: Matrix,
-                 globalMatrix: Matrix,
-                 globalAnimatedMatrix: Matrix = _defaultMatrix(),
-                 localAnimatedMatrix: Matrix = _defaultMatrix(),
+                 animatedPosition: Vector3,
+                 animatedScale: Vector3,
+                 animatedRotation: Vector3,
+                 localMatrix: Matrix4,
+                 globalMatrix: Matrix4,
+                 globalAnimatedMatrix: Matrix4 = _defaultMatrix(),
+                 localAnimatedMatrix: Matrix4 = _defaultMatrix(),
                  children=None,
                  attachedMeshes=None,
                  weights=None,
                  positionKeys=None,
                  scaleKeys=None,
                  rotationKeys=None,
+                 parent=None,
                  ):
         super(object, self).__init__()
         if rotationKeys is None:
@@ -221,13 +258,16 @@ class ModelJoint(object):
         self.positionKeys = positionKeys
         self.scaleKeys = scaleKeys
         self.rotationKeys = rotationKeys
+        self.parent = parent
 
     def __repr__(self) -> str:
-        return "{}({!r})".format(self.__class__.__name__, self.__dict__)
+        # parent by name only, children already link back to this joint
+        fields = dict(self.__dict__, parent=self.parent.name if self.parent is not None else None)
+        return "{}({!r})".format(self.__class__.__name__, fields)
 
 
 class ModelBoundingBox(object):
-    def __init__(self, min: Vector, max: Vector):
+    def __init__(self, min: Vector3, max: Vector3):
         super().__init__()
         self.min = min
         self.max = max
@@ -238,12 +278,12 @@ class ModelBoundingBox(object):
 
 class ModelVertex(object):
     def __init__(self,
-                 position: Vector = None,
-                 normal: Vector = None,
-                 color: Color = None,
-                 tCoords: Vector = None,
-                 biNormal: Vector = None,
-                 tangent: Vector = None
+                 position: Vector3 = None,
+                 normal: Vector3 = None,
+                 color: Color3 = None,
+                 tCoords: Vector2 = None,
+                 biNormal: Vector3 = None,
+                 tangent: Vector3 = None
                  ):
         super().__init__()
         self.position = position
@@ -257,13 +297,13 @@ class ModelVertex(object):
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
 
     @classmethod
-    def fromCoords(cls, x: float, y: float, z: float, nx: float, ny: float, nz: float, color: Color, tu: float,
+    def fromCoords(cls, x: float, y: float, z: float, nx: float, ny: float, nz: float, color: Color3, tu: float,
                    tv: float):
         return cls(
-            Vector((x, y, z)),
-            Vector((nx, ny, nz)),
+            (x, y, z),
+            (nx, ny, nz),
             color,
-            Vector((tu, tv))
+            (tu, tv)
         )
 
 
@@ -280,9 +320,9 @@ class ModelMaterial(object):
                  strings=None,
                  floats=None,
                  vectors=None,
-                 diffuseColor: Color = None,
-                 ambientColor: Color = None,
-                 specularColor: Color = None,
+                 diffuseColor: Color3 = None,
+                 ambientColor: Color3 = None,
+                 specularColor: Color3 = None,
                  shininess: float = None,
                  shadow: bool = None,
                  beaming: bool = None,
@@ -382,9 +422,9 @@ class ModelMaterial(object):
         self.enableSpecular = enableSpecular
 
     def setMaterialParameters(self,
-                              diffuseColor: Color = None,
-                              ambientColor: Color = None,
-                              specularColor: Color = None,
+                              diffuseColor: Color3 = None,
+                              ambientColor: Color3 = None,
+                              specularColor: Color3 = None,
                               shininess: float = None,
                               shadow: bool = None,
                               beaming: bool = None,
@@ -485,6 +525,24 @@ class ModelMaterial(object):
     def hasMaterial(self):
         return len(self.shader) > 0 or len(self.textures) > 0
 
+    # canonical digest of what a built material depends on, equal materials share one Blender material
+    def materialHash(self) -> str:
+        def canonical(value):
+            if isinstance(value, dict):
+                return sorted((key, canonical(item)) for key, item in value.items())
+            if isinstance(value, (list, tuple, np.ndarray)):
+                return tuple(round(float(item), 6) for item in value)
+            if isinstance(value, float):
+                return round(value, 6)
+            return value
+
+        fields = (
+            self.shader, self.textures, self.bumpmaps, self.strings, self.floats, self.vectors,
+            self.diffuseColor, self.ambientColor, self.specularColor, self.shininess, self.transparencyHint
+        )
+        content = repr([canonical(field) for field in fields]).encode('utf-8')
+        return hashlib.blake2b(content, digest_size=16).hexdigest()
+
     def __repr__(self) -> str:
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
 
@@ -520,7 +578,7 @@ class ModelMaterial(object):
                 i += 2
             elif dataType == 'vector':
                 id, x, y, z, w = data[i + 1: i + 6]
-                instance.vectors[id] = Vector((float(x), float(y), float(z)))
+                instance.vectors[id] = (float(x), float(y), float(z))
                 i += 5
             i += 1
 
@@ -536,6 +594,24 @@ class ModelMaterial(object):
             return instance
 
 
+# skin influences of one bone: ids of the affected vertices and their weights
+class ModelBoneWeights(object):
+    def __init__(self,
+                 boneName: str,
+                 vertexIds: np.ndarray,
+                 strengths: np.ndarray,
+                 joint: ModelJoint = None
+                 ):
+        super().__init__()
+        self.boneName = boneName
+        self.vertexIds = vertexIds
+        self.strengths = strengths
+        self.joint = joint
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__name__, self.__dict__)
+
+
 class ModelTextureLayer(object):
     def __init__(self,
                  hasTexture: bool,
@@ -553,28 +629,119 @@ class ModelTextureLayer(object):
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
 
 
+# vertex data is kept as contiguous arrays (struct of arrays):
+# positions/normals/tangents/biNormals (N, 3) float32, colors (N, 3) float32, indices (F, 3) int32,
+# tCoordChannels one (N, 2) float32 array per texture slot (texture0..texture3, None when the slot has no UVs),
+# boneWeights the skin influences grouped per bone and bonePalette the skin's bone table resolved to joints
+# (skin nodes only);
+# missing tangents/biNormals/colors are None (colors default to white)
 class ModelMeshBuffer(object):
     def __init__(self,
                  name: str,
                  material: ModelMaterial = None,
-                 vertices=None,
-                 indices=None,
+                 positions: np.ndarray = None,
+                 normals: np.ndarray = None,
+                 tangents: np.ndarray = None,
+                 biNormals: np.ndarray = None,
+                 colors: np.ndarray = None,
+                 tCoordChannels: List[Optional[np.ndarray]] = None,
+                 indices: np.ndarray = None,
                  boundingBox: ModelBoundingBox = None,
                  textureLayers=None,
+                 boneWeights: List[ModelBoneWeights] = None,
+                 bonePalette: List[Optional[ModelJoint]] = None,
                  ):
         super().__init__()
+        if bonePalette is None:
+            bonePalette = []
+        if boneWeights is None:
+            boneWeights = []
         if textureLayers is None:
             textureLayers = []
-        if vertices is None:
-            vertices = []
+        if tCoordChannels is None:
+            tCoordChannels = []
+        if positions is None:
+            positions = np.zeros((0, 3), dtype=np.float32)
         if indices is None:
-            indices = []
+            indices = np.zeros((0, 3), dtype=np.int32)
         self.name = name
         self.material = material
-        self.vertices = vertices
+        self.positions = positions
+        self.normals = normals
+        self.tangents = tangents
+        self.biNormals = biNormals
+        self.colors = colors
+        self.tCoordChannels = tCoordChannels
         self.indices = indices
         self.boundingBox = boundingBox
         self.textureLayers = textureLayers
+        self.boneWeights = boneWeights
+        self.bonePalette = bonePalette
+
+    @property
+    def vertexCount(self) -> int:
+        return len(self.positions)
+
+    @property
+    def faceCount(self) -> int:
+        return len(self.indices)
+
+    # diffuse (first) UV channel
+    @property
+    def tCoords(self) -> Optional[np.ndarray]:
+        return self.tCoordChannels[0] if len(self.tCoordChannels) > 0 else None
+
+    # UVs expanded per face corner ((F * 3, 2), face after face) for every channel present
+    def getLoopTCoords(self) -> List[Tuple[int, np.ndarray]]:
+        loopVertices = self.indices.ravel()
+        return [
+            (channel, tCoords[loopVertices])
+            for channel, tCoords in enumerate(self.tCoordChannels)
+            if tCoords is not None
+        ]
+
+    # digest of what ends up in the Blender mesh (positions, normals, faces, UVs, skin weights),
+    # equal buffers share one mesh
+    def geometryHash(self) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        arrays = [self.positions, self.normals, self.indices] + list(self.tCoordChannels)
+        for boneWeights in self.boneWeights:  # deform weights are mesh data too
+            digest.update(boneWeights.boneName.encode('utf-8') + b'\x00')
+            arrays += [np.asarray(boneWeights.vertexIds), np.asarray(boneWeights.strengths)]
+        for array in arrays:
+            if array is None:
+                digest.update(b'-')
+                continue
+            array = np.ascontiguousarray(array)
+            digest.update(str((array.dtype.str, array.shape)).encode('ascii'))
+            digest.update(array.data)
+        return digest.hexdigest()
+
+    # drops the geometry and skin arrays once they have been copied elsewhere (e.g. into Blender),
+    # name and material are kept
+    def releaseArrays(self):
+        self.positions = np.zeros((0, 3), dtype=np.float32)
+        self.normals = self.tangents = self.biNormals = self.colors = None
+        self.tCoordChannels = []
+        self.indices = np.zeros((0, 3), dtype=np.int32)
+        self.boneWeights = []
+
+    # per-vertex objects, built on demand (slow, only for debugging / old callers)
+    @property
+    def vertices(self) -> List[ModelVertex]:
+        def row(array, i):
+            return tuple(array[i].tolist()) if array is not None else None
+
+        return [
+            ModelVertex(
+                position=row(self.positions, i),
+                normal=row(self.normals, i),
+                color=tuple(self.colors[i].tolist()) if self.colors is not None else (1.0, 1.0, 1.0),
+                tCoords=row(self.tCoords, i),
+                biNormal=row(self.biNormals, i),
+                tangent=row(self.tangents, i)
+            ) for i in range(self.vertexCount)
+        ]
 
     def __repr__(self) -> str:
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
@@ -597,6 +764,7 @@ class ModelBoundingSphere(object):
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
 
 
+# keys are kept as arrays like in ControllersData
 class ModelAnimationNode(object):
     def __init__(self,
                  id: int,
@@ -604,43 +772,55 @@ class ModelAnimationNode(object):
                  minLOD: float,
                  maxLOD: float,
                  joint: ModelJoint,
-                 positionKeys=None,
-                 scaleKeys=None,
-                 rotationKeys=None,
+                 positionTime: np.ndarray = None,
+                 position: np.ndarray = None,
+                 rotationTime: np.ndarray = None,
+                 rotation: np.ndarray = None,
+                 scaleTime: np.ndarray = None,
+                 scale: np.ndarray = None,
                  children=None
                  ):
         super(object, self).__init__()
         if children is None:
             children = []
-        if rotationKeys is None:
-            rotationKeys = []
-        if scaleKeys is None:
-            scaleKeys = []
-        if positionKeys is None:
-            positionKeys = []
         self.id = id
         self.name = name
         self.minLOD = minLOD
         self.maxLOD = maxLOD
         self.joint = joint
-        self.positionKeys = positionKeys
-        self.scaleKeys = scaleKeys
-        self.rotationKeys = rotationKeys
+        self.positionTime = positionTime if positionTime is not None else _emptyTimes()
+        self.position = position if position is not None else _emptyValues(3)
+        self.rotationTime = rotationTime if rotationTime is not None else _emptyTimes()
+        self.rotation = rotation if rotation is not None else _emptyValues(4)
+        self.scaleTime = scaleTime if scaleTime is not None else _emptyTimes()
+        self.scale = scale if scale is not None else _emptyValues(3)
         self.children = children
 
+    @property
+    def keyCount(self) -> int:
+        return len(self.positionTime) + len(self.rotationTime) + len(self.scaleTime)
+
+    # copy of the node tree, key arrays are shared
+    def copyTree(self):
+        node = copy.copy(self)
+        node.children = [child.copyTree() for child in self.children]
+        return node
+
     def __repr__(self) -> str:
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
 
 
+# clip directory entry, animationNode stays None until the clip is decoded (from offsetRootNode)
 class ModelAnimationMeta(object):
     def __init__(self,
                  name: str,
                  rootName: str,
-                 animationNode: ModelAnimationNode,
+                 animationNode: Optional[ModelAnimationNode],
                  length: float,
                  transitionTime: float,
                  animationBox: ModelBoundingBox,
                  animationSphere: ModelBoundingSphere,
+                 offsetRootNode: int = -1,
                  ):
         super(object, self).__init__()
         self.name = name
@@ -650,6 +830,18 @@ class ModelAnimationMeta(object):
         self.transitionTime = transitionTime
         self.animationBox = animationBox
         self.animationSphere = animationSphere
+        self.offsetRootNode = offsetRootNode
+
+    @property
+    def isLoaded(self) -> bool:
+        return self.animationNode is not None
+
+    # copy which can be modified without touching this clip (key arrays are shared)
+    def copy(self):
+        animation = copy.copy(self)
+        if self.animationNode is not None:
+            animation.animationNode = self.animationNode.copyTree()
+        return animation
 
     def __repr__(self) -> str:
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
@@ -663,7 +855,9 @@ class ModelMesh(object):
                  meshType: int = 0,
                  joints=None,
                  weights=None,
-                 animations=None
+                 animations=None,
+                 superMesh=None,
+                 modelData: ModelData = None
                  ):
         super(object, self).__init__()
         if animations is None:
@@ -681,12 +875,42 @@ class ModelMesh(object):
         self.joints = joints
         self.weights = weights
         self.animations = animations
+        self.superMesh = superMesh  # skeleton of the supermodel, joints not found here are looked up there
+        self.modelData = modelData  # header of the file this mesh was parsed from
+        self.jointsByName = {}
+        for joint in joints:
+            self.jointsByName.setdefault(joint.name, joint)
+
+    # joints must be added through here to keep the name index in sync
+    def addJoint(self, joint: ModelJoint):
+        self.joints.append(joint)
+        self.jointsByName.setdefault(joint.name, joint)
 
     def getJointByName(self, name):
-        try:
-            return next(filter(lambda joint: joint.name == name, self.joints))
-        except StopIteration:
-            return None
+        joint = self.jointsByName.get(name)
+        if joint is None and self.superMesh is not None:
+            return self.superMesh.getJointByName(name)
+        return joint
 
     def __repr__(self) -> str:
         return "{}({!r})".format(self.__class__.__name__, self.__dict__)
+
+
+# parsed supermodel shared by every model referencing it: skeleton without geometry and clip directory
+class ModelSuperModel(object):
+    def __init__(self,
+                 source,
+                 modelData: ModelData,
+                 skeleton: ModelMesh,
+                 parent=None,
+                 searchDirectories=None
+                 ):
+        super(object, self).__init__()
+        self.source = source  # file path or archive resource
+        self.modelData = modelData
+        self.skeleton = skeleton
+        self.parent = parent  # supermodel of this supermodel
+        self.searchDirectories = searchDirectories or []  # where the chain was resolved from
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__name__, self.source)
@@ -0,0 +1,294 @@
+import os
+
+import bpy
+from bpy.props import StringProperty, FloatProperty, BoolProperty, IntProperty, CollectionProperty
+from bpy_extras.io_utils import orientation_helper, ImportHelper, axis_conversion
+
+from . import bl_info
+
+
+#  options shared by the single file and the batch importers
+class ImportMDBOptions:
+    base_path: StringProperty(
+        name="Extracted BIF base path",
+        description="The Wither extracted .bif path (contains textures00/ meshes00/)",
+        default="../",
+    )
+
+    cache_directory: StringProperty(
+        name="Parse cache folder",
+        description="Parsed models are stored here and reused while the file is unchanged (empty disables the cache)",
+        default="",
+        subtype='DIR_PATH',
+    )
+
+    weight_threshold: FloatProperty(
+        name="Skin weight threshold",
+        description="Skin influences with a smaller weight are dropped",
+        default=0.0,
+        min=0.0,
+        max=1.0,
+    )
+
+    normalize_weights: BoolProperty(
+        name="Normalize skin weights",
+        description="Rescale the influences of every vertex to sum up to 1",
+        default=True,
+    )
+
+    import_armature: BoolProperty(
+        name="Import armature",
+        description="Build an armature from the node hierarchy and rig the skinned meshes to it",
+        default=True,
+    )
+
+    import_materials: BoolProperty(
+        name="Import materials",
+        description="Build node materials from the model materials, identical ones and their images are shared",
+        default=True,
+    )
+
+    deduplicate_meshes: BoolProperty(
+        name="Share identical meshes",
+        description="Objects with identical geometry (in this model or imported earlier in the session) share one mesh",
+        default=True,
+    )
+
+    import_animations: BoolProperty(
+        name="Import animations",
+        description="Decode the animation clips of the file",
+        default=True,
+    )
+
+    animation_filter: StringProperty(
+        name="Animation filter",
+        description="Only clips whose name matches this regular expression are decoded (empty decodes all)",
+        default="",
+    )
+
+    import_supermodel_animations: BoolProperty(
+        name="Import supermodel animations",
+        description="Also decode the clips of the supermodel chain (parsed once per session)",
+        default=False,
+    )
+
+    simplify_animations: BoolProperty(
+        name="Simplify animations",
+        description="Drop keys that interpolation reproduces within tolerance and collapse constant channels",
+        default=False,
+    )
+
+    position_tolerance: FloatProperty(
+        name="Position tolerance",
+        description="Largest position error allowed when dropping keys",
+        default=0.001,
+        min=0.0,
+        precision=4,
+    )
+
+    rotation_tolerance: FloatProperty(
+        name="Rotation tolerance",
+        description="Largest rotation error allowed when dropping keys",
+        default=0.001,
+        min=0.0,
+        subtype='ANGLE',
+    )
+
+    scale_tolerance: FloatProperty(
+        name="Scale tolerance",
+        description="Largest scale error allowed when dropping keys",
+        default=0.001,
+        min=0.0,
+        precision=4,
+    )
+
+    resample_fps: FloatProperty(
+        name="Resample FPS",
+        description="Resample the keys at this rate before simplification (0 keeps the original keys)",
+        default=0.0,
+        min=0.0,
+    )
+
+    # reloads the importer modules (to pick up changes) and returns import_mdb with the operator keywords
+    def prepareImport(self, ignore=()):
+        import importlib
+
+        # imports to be updated; model_data and archive_utils are not: the session caches hold instances of their
+        # classes (supermodels, archive indexes), reloading would make them unpicklable
+        from . import file_utils, model_types, debug_utils, anim_utils
+        from . import pickle_utils, mdb_parser, parse_cache, transport_utils, import_mdb
+
+        importlib.reload(file_utils)
+        importlib.reload(anim_utils)
+        importlib.reload(model_types)
+        importlib.reload(debug_utils)
+        importlib.reload(pickle_utils)
+        importlib.reload(mdb_parser)
+        importlib.reload(parse_cache)
+        importlib.reload(transport_utils)
+        importlib.reload(import_mdb)
+
+        keywords = self.as_keywords(
+            ignore=(
+                "axis_forward",
+                "axis_up",
+                "filter_glob",
+            ) + tuple(ignore)
+        )
+
+        if keywords.get("cache_directory"):
+            keywords["cache_directory"] = bpy.path.abspath(keywords["cache_directory"])
+
+        global_matrix = axis_conversion(from_forward=self.axis_forward, from_up=self.axis_up).to_4x4()
+        keywords["global_matrix"] = global_matrix
+
+        debug_utils.setDebug(bl_info['support'] == 'TESTING')
+        return import_mdb, keywords
+
+
+@orientation_helper(axis_forward='Y', axis_up='Z')
+class ImportMDB(bpy.types.Operator, ImportHelper, ImportMDBOptions):
+    """Import from MDB file format (.mdb, .mba)"""
+    bl_idname = "import_scene.thewitcher_mdb"
+    bl_label = 'Import MDB'
+    bl_options = {'UNDO'}
+
+    filename_ext = ".mdb;.mba"
+    filter_glob: StringProperty(default="*.mdb;*.mba", options={'HIDDEN'})
+
+    def execute(self, context):
+        import_mdb, keywords = self.prepareImport()
+        return import_mdb.load(self, context, **keywords)
+
+
+@orientation_helper(axis_forward='Y', axis_up='Z')
+class ImportMDBBackground(bpy.types.Operator, ImportHelper, ImportMDBOptions):
+    """Import from MDB file format in the background, the UI stays responsive (Esc cancels and removes the import)"""
+    bl_idname = "import_scene.thewitcher_mdb_background"
+    bl_label = 'Import MDB (background)'
+    bl_options = {'UNDO'}
+
+    filename_ext = ".mdb;.mba"
+    filter_glob: StringProperty(default="*.mdb;*.mba", options={'HIDDEN'})
+
+    def execute(self, context):
+        import_mdb, keywords = self.prepareImport()
+        self._task = import_mdb.BackgroundImport(self, context, **keywords)
+        self._task.start()
+
+        windowManager = context.window_manager
+        self._timer = windowManager.event_timer_add(0.05, window=context.window)
+        windowManager.modal_handler_add(self)
+        windowManager.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._task.cancel()
+            self.finish(context)
+            self.report({'INFO'}, "Import cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        try:
+            finished = self._task.step(context)
+        except Exception as error:
+            self._task.cancel()
+            self.finish(context)
+            self.report({'ERROR'}, "{}: {}".format(os.path.basename(self.filepath), error))
+            return {'CANCELLED'}
+
+        if finished:
+            self.finish(context)
+            return {'FINISHED'}
+
+        context.window_manager.progress_update(int(self._task.progress * 100))
+        context.workspace.status_text_set("Importing {}: {:.0%} (Esc to cancel)".format(
+            os.path.basename(self.filepath), self._task.progress
+        ))
+        return {'RUNNING_MODAL'}
+
+    def finish(self, context):
+        windowManager = context.window_manager
+        windowManager.event_timer_remove(self._timer)
+        windowManager.progress_end()
+        context.workspace.status_text_set(None)
+
+
+@orientation_helper(axis_forward='Y', axis_up='Z')
+class ImportMDBBatch(bpy.types.Operator, ImportHelper, ImportMDBOptions):
+    """Import several MDB files (the selected ones, or the whole folder), parsed in parallel worker processes"""
+    bl_idname = "import_scene.thewitcher_mdb_batch"
+    bl_label = 'Import MDB (batch)'
+    bl_options = {'UNDO'}
+
+    filename_ext = ".mdb;.mba"
+    filter_glob: StringProperty(default="*.mdb;*.mba", options={'HIDDEN'})
+
+    files: CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+
+    workers: IntProperty(
+        name="Worker processes",
+        description="Processes parsing the files (0 uses every core)",
+        default=0,
+        min=0,
+    )
+
+    def execute(self, context):
+        import_mdb, keywords = self.prepareImport(ignore=("filepath", "files", "directory", "workers"))
+        fileNames = [file.name for file in self.files if file.name] or sorted(
+            name for name in os.listdir(self.directory) if name.lower().endswith(('.mdb', '.mba'))
+        )
+        filePaths = [os.path.join(self.directory, fileName) for fileName in fileNames]
+        return import_mdb.loadBatch(self, context, filePaths, workers=self.workers, **keywords)
+
+
+@orientation_helper(axis_forward='Y', axis_up='Z')
+class ImportMDBArchive(bpy.types.Operator, ImportMDBOptions):
+    """Import MDB models straight from the game archives (.key/.bif), without extracting them"""
+    bl_idname = "import_scene.thewitcher_mdb_archive"
+    bl_label = 'Import MDB from archives'
+    bl_options = {'UNDO'}
+
+    archive_directory: StringProperty(
+        name="Archive folder",
+        description="The Witcher Data folder, holding the .key files (and the .bif files they reference)",
+        default="",
+        subtype='DIR_PATH',
+    )
+
+    resource_names: StringProperty(
+        name="Models",
+        description="Names of the models to import, separated by commas or spaces (e.g. an_bird)",
+        default="",
+    )
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        import_mdb, keywords = self.prepareImport(ignore=("archive_directory", "resource_names"))
+        resourceNames = [name for name in self.resource_names.replace(',', ' ').split() if name]
+        if not self.archive_directory or not resourceNames:
+            self.report({'ERROR'}, "An archive folder and at least one model name are needed")
+            return {'CANCELLED'}
+        archiveDirectory = bpy.path.abspath(self.archive_directory)
+        return import_mdb.loadResources(self, context, resourceNames, archiveDirectory, **keywords)
+
+
+def menu_func_import(self, context):
+    self.layout.operator(ImportMDB.bl_idname, text="The Witcher (.mdb, .mba)")
+    self.layout.operator(ImportMDBBackground.bl_idname, text="The Witcher, in background (.mdb, .mba)")
+    self.layout.operator(ImportMDBBatch.bl_idname, text="The Witcher, batch (.mdb, .mba)")
+    self.layout.operator(ImportMDBArchive.bl_idname, text="The Witcher, from archives (.key, .bif)")
+
+
+classes = (
+    ImportMDB,
+    ImportMDBBackground,
+    ImportMDBBatch,
+    ImportMDBArchive,
+)
@@ -0,0 +1,118 @@
+#  optional on-disk cache of parsed models: one artifact per model file and parse options made of a small header,
+#  the pickled graph and its arrays (aligned), read back through a memory map so nothing is parsed nor copied
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+from typing import Optional
+
+import numpy as np
+
+from .debug_utils import debugPrint as print
+from .mdb_parser import parse_mdb, getSuperModelReferences, makeSuperModelResolver, PARSER_FORMAT_VERSION
+from .model_data import ModelMesh
+from .pickle_utils import ARRAY_ALIGNMENT, dumpWithArrays, loadWithArrays
+
+_MAGIC = b'MDBC'
+_HEADER = struct.Struct('<4sIQQ')  # magic, parser format version, metadata size, offset of the arrays
+_DIGEST_CHUNK = 1 << 20
+
+
+def _digestFile(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(_DIGEST_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _optionsKey(options: dict) -> str:
+    return repr(sorted(
+        (name, np.asarray(value).tolist() if isinstance(value, np.ndarray) else value)
+        for name, value in options.items()
+    ))
+
+
+#  What an artifact must match to be used: same file (path, size, mtime, content), parser and parse options
+def getCacheKey(path: str, options: dict) -> tuple:
+    stat = os.stat(path)
+    return (
+        os.path.normcase(os.path.abspath(path)),
+        stat.st_size,
+        stat.st_mtime_ns,
+        _digestFile(path),
+        PARSER_FORMAT_VERSION,
+        _optionsKey(options),
+    )
+
+
+def getArtifactPath(cacheDirectory: str, path: str, options: dict) -> str:
+    name = os.path.normcase(os.path.abspath(path)) + _optionsKey(options)
+    return os.path.join(cacheDirectory, hashlib.blake2b(name.encode('utf-8'), digest_size=16).hexdigest() + '.mdbc')
+
+
+#  Cached model if the artifact exists and matches key, its arrays are views on the mapped artifact
+def readArtifact(artifactPath: str, key: tuple) -> Optional[ModelMesh]:
+    try:
+        with open(artifactPath, 'rb') as file:
+            content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None  # missing or empty
+
+    try:
+        magic, version, metadataSize, arraysOffset = _HEADER.unpack_from(content, 0)
+        if magic != _MAGIC or version != PARSER_FORMAT_VERSION:
+            return None
+        storedKey, table, payload = pickle.loads(content[_HEADER.size:_HEADER.size + metadataSize])
+        if storedKey != key:
+            return None
+        return loadWithArrays(payload, content, arraysOffset, table, makeSuperModelResolver())
+    except (
+        struct.error, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, LookupError
+    ) as error:  # LookupError: the supermodel changed or is gone
+        print('unreadable parse cache artifact', path=artifactPath, error=error)
+        return None
+
+
+#  The supermodel chain is stored as references (see getSuperModelReferences), not copied
+def writeArtifact(artifactPath: str, key: tuple, modelMesh: ModelMesh):
+    try:
+        payload, arrays, table, _ = dumpWithArrays(modelMesh, getSuperModelReferences(modelMesh))
+    except pickle.PicklingError as error:  # objects of classes since reloaded by the operator
+        print('parse cache artifact not written', path=artifactPath, error=error)
+        return
+    metadata = pickle.dumps((key, table, payload), protocol=pickle.HIGHEST_PROTOCOL)
+    arraysOffset = (_HEADER.size + len(metadata) + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+    temporaryPath = '{}.{}.tmp'.format(artifactPath, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(artifactPath), exist_ok=True)
+        with open(temporaryPath, 'wb') as file:
+            file.write(_HEADER.pack(_MAGIC, PARSER_FORMAT_VERSION, len(metadata), arraysOffset))
+            file.write(metadata)
+            for array, (offset, _, _) in zip(arrays, table):
+                file.seek(arraysOffset + offset)
+                file.write(np.ascontiguousarray(array).data)
+        os.replace(temporaryPath, artifactPath)
+    except OSError as error:  # read-only folder, artifact mapped by another import on Windows...
+        print('parse cache artifact not written', path=artifactPath, error=error)
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+
+
+#  parse_mdb going through the cache when cache_directory is set
+def parseModel(path: str, cache_directory: str = '', **options) -> ModelMesh:
+    if not cache_directory:
+        return parse_mdb(path, **options)
+
+    key = getCacheKey(path, options)
+    artifactPath = getArtifactPath(cache_directory, path, options)
+    modelMesh = readArtifact(artifactPath, key)
+    if modelMesh is not None:
+        print('parse cache hit', path=path)
+        return modelMesh
+
+    modelMesh = parse_mdb(path, **options)
+    writeArtifact(artifactPath, key, modelMesh)
+    return modelMesh
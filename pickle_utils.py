@@ -0,0 +1,89 @@
+#  pickling of object graphs holding NumPy arrays: the graph is pickled, the arrays are kept aside
+#  (persistent ids) so they can be laid out in a shared memory block or a file and read back as views;
+#  external objects (shared, owned by someone else) are pickled as references resolved when loading
+import io
+import pickle
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+ARRAY_ALIGNMENT = 64
+
+# (offset, dtype, shape) of an array in its block
+ArrayEntry = Tuple[int, str, Tuple[int, ...]]
+
+
+def _isDetachable(array: np.ndarray) -> bool:
+    return not array.dtype.hasobject and array.nbytes > 0
+
+
+class _ArrayPickler(pickle.Pickler):
+    def __init__(self, file, externals: Dict[int, tuple]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays = []
+        self.externals = externals
+
+    def persistent_id(self, obj):
+        reference = self.externals.get(id(obj))
+        if reference is not None:
+            return 'external', reference
+        if isinstance(obj, np.ndarray) and _isDetachable(obj):
+            self.arrays.append(obj)
+            return len(self.arrays) - 1
+        return None
+
+
+class _ArrayUnpickler(pickle.Unpickler):
+    def __init__(self, file, arrays: List[np.ndarray], resolve: Optional[Callable]):
+        super().__init__(file)
+        self.arrays = arrays
+        self.resolve = resolve
+
+    def persistent_load(self, pid):
+        if isinstance(pid, tuple):
+            if self.resolve is None:
+                raise pickle.UnpicklingError('external reference without resolver: {!r}'.format(pid[1]))
+            return self.resolve(pid[1])
+        return self.arrays[pid]
+
+
+#  (pickled graph, arrays it references, aligned layout of these arrays, total layout size);
+#  externals maps id() of the objects to pickle as references to these references
+def dumpWithArrays(
+    obj,
+    externals: Optional[Dict[int, tuple]] = None
+) -> Tuple[bytes, List[np.ndarray], List[ArrayEntry], int]:
+    stream = io.BytesIO()
+    pickler = _ArrayPickler(stream, externals or {})
+    pickler.dump(obj)
+
+    table = []
+    size = 0
+    for array in pickler.arrays:
+        size = (size + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+        table.append((size, array.dtype.str, array.shape))
+        size += array.nbytes
+    return stream.getvalue(), pickler.arrays, table, size
+
+
+#  Copies the arrays into buffer at offset according to their layout
+def writeArrays(buffer, offset: int, arrays: List[np.ndarray], table: List[ArrayEntry]):
+    for array, (arrayOffset, dtype, shape) in zip(arrays, table):
+        np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset + arrayOffset)[...] = array
+
+
+#  Rebuilds the graph, its arrays being read-only views on buffer (which must outlive them),
+#  resolve(reference) gives back the external objects
+def loadWithArrays(
+    payload: bytes,
+    buffer,
+    offset: int,
+    table: List[ArrayEntry],
+    resolve: Optional[Callable] = None
+):
+    arrays = []
+    for arrayOffset, dtype, shape in table:
+        array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset + arrayOffset)
+        array.flags.writeable = False
+        arrays.append(array)
+    return _ArrayUnpickler(io.BytesIO(payload), arrays, resolve).load()
@@ -0,0 +1,21 @@
+#  caches living for the whole Blender session
+#  (the operator reloads the other modules on every import, this one must keep its state so it is never reloaded)
+import os
+from typing import Dict
+
+_CACHES: Dict[str, dict] = {}
+
+
+def getCache(name: str) -> dict:
+    return _CACHES.setdefault(name, {})
+
+
+def clearCaches():
+    for cache in _CACHES.values():
+        cache.clear()
+
+
+#  Identifies a file version: same path, size and modification time
+def fileKey(path: str):
+    stat = os.stat(path)
+    return os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,14 @@
+#  the repository is the add-on package itself (relative imports), the tests import it as mdb_blender like the README
+import importlib.util
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'mdb_blender' not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        'mdb_blender', os.path.join(_ROOT, '__init__.py'), submodule_search_locations=[_ROOT]
+    )
+    _package = importlib.util.module_from_spec(_spec)
+    sys.modules['mdb_blender'] = _package
+    _spec.loader.exec_module(_package)
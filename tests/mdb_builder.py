@@ -0,0 +1,238 @@
+#  small synthetic .mdb files (v133 or v136) built in memory for the parser tests
+#  everything is allocated past the animation directory, which sits at a fixed offset for both versions:
+#  v136 reads it at offsetTexData, v133 at offsetModelData + offsetRawData
+import os
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mdb_blender.mdb_parser import MESH_HEADER_LAYOUT, ANIMATION_HEADER_LAYOUT
+from mdb_blender.model_types import ControllerType, NodeType
+
+MODEL_DATA = 32
+ANIMATION_DIRECTORY = 1024
+_ANIMATION_DIRECTORY_SIZE = 64
+_NODE_SIZE = 164  # node header up to (and including) the node type
+
+
+#  Layout record packed from keyword fields, the others zero
+def packLayout(layout, **fields) -> bytes:
+    values = list(layout.struct.unpack(bytes(layout.size)))
+    for name, (first, count, _) in zip(layout.record._fields, layout.plan):
+        if name in fields:
+            values[first:first + count] = fields[name] if count > 1 else [fields[name]]
+    return layout.struct.pack(*values)
+
+
+#  Face records as stored by the version: 48 bytes with unknown fields in v133, 32 bytes in v136
+def packFaces(fileVersion: int, faces: np.ndarray) -> bytes:
+    records = []
+    for face in np.asarray(faces).tolist():
+        if fileVersion == 133:
+            records.append(struct.pack('<4fi12x3i4x', 0.0, 0.0, 1.0, 0.0, 0, *face))
+        else:
+            records.append(struct.pack('<4fi3i', 0.0, 0.0, 1.0, 0.0, 0, *face))
+    return b''.join(records)
+
+
+class MdbBuilder(object):
+    def __init__(self, fileVersion: int = 136, name: str = 'model', superModel: str = 'NULL'):
+        super(object, self).__init__()
+        self.fileVersion = fileVersion
+        self.name = name
+        self.superModel = superModel
+        self.buffer = bytearray(ANIMATION_DIRECTORY + _ANIMATION_DIRECTORY_SIZE)
+        self.animationOffsets: List[int] = []
+        self.nextNodeId = 0
+
+        # mesh arrays are relative to offsetRawData, texture infos and skin bones to offsetTexData (v136)
+        self.rawBase = MODEL_DATA if fileVersion == 136 else ANIMATION_DIRECTORY - MODEL_DATA
+        self.texBase = ANIMATION_DIRECTORY
+
+    #  Absolute offset of data appended to the file (4 bytes aligned)
+    def alloc(self, data: bytes) -> int:
+        self.buffer.extend(bytes(-len(self.buffer) % 4))
+        offset = len(self.buffer)
+        self.buffer.extend(data)
+        return offset
+
+    #  (offset, used, allocated) of an array of count entries, offset relative to base (0 when empty)
+    def arrayDefinition(self, data: bytes, count: int, base: int = MODEL_DATA) -> bytes:
+        offset = self.alloc(data) - base if count > 0 else 0
+        return struct.pack('<3I', offset, count, count)
+
+    #  Controller key records and data of [(type, times, values)], values (rows, columns) in file order
+    def controllers(self, channels: Sequence[Tuple[ControllerType, Sequence[float], Sequence]]) -> bytes:
+        keys, data = [], []
+        for controllerType, times, values in channels:
+            values = np.asarray(values, dtype=np.float32).reshape(len(times), -1)
+            keys.append(struct.pack(
+                '<IhhhBB', controllerType.value, len(times), len(data), len(data) + len(times), values.shape[1], 0
+            ))
+            data.extend(times)
+            data.extend(values.ravel().tolist())
+        return self.arrayDefinition(b''.join(keys), len(keys)) + self.arrayDefinition(
+            struct.pack('<{}f'.format(len(data)), *data), len(data)
+        )
+
+    #  Node record (and the type specific data which follows it), returns its absolute offset
+    def node(
+        self,
+        name: str,
+        nodeType: NodeType = NodeType.NodeTypeNode,
+        children: Sequence[int] = (),
+        channels: Sequence = (),
+        extra: bytes = b''
+    ) -> int:
+        record = bytearray(_NODE_SIZE)
+        struct.pack_into('<I64s', record, 28, self.nextNodeId, name.encode('ascii'))
+        childOffsets = [child - MODEL_DATA for child in children]
+        record[104:116] = self.arrayDefinition(
+            struct.pack('<{}I'.format(len(childOffsets)), *childOffsets), len(childOffsets)
+        )
+        record[116:140] = self.controllers(channels)
+        struct.pack_into('<I', record, 160, nodeType.value)
+        self.nextNodeId += 1
+        return self.alloc(bytes(record) + extra)
+
+    #  Texture info block, its offset relative to base
+    def textureInfo(self, lines: Sequence[str], base: int) -> int:
+        content = b''.join(line.encode('ascii') + b'\x00' for line in lines)
+        return self.alloc(struct.pack('<II', len(lines), 0) + content) - base
+
+    #  Vertex, normal, tangent, biNormal, 4 UV channels, unknown and face array definitions
+    def meshArrays(self, positions, faces, uvChannels: Sequence[Optional[np.ndarray]] = ()) -> bytes:
+        positions = np.asarray(positions, dtype=np.float32)
+        normals = np.tile(np.array([0.0, 0.0, 1.0], dtype=np.float32), (len(positions), 1))
+        uvChannels = list(uvChannels) + [None] * (4 - len(uvChannels))
+        definitions = [
+            self.arrayDefinition(positions.tobytes(), len(positions), self.rawBase),
+            self.arrayDefinition(normals.tobytes(), len(normals), self.rawBase),
+            self.arrayDefinition(b'', 0),
+            self.arrayDefinition(b'', 0),
+        ]
+        for uvs in uvChannels:
+            uvs = np.zeros((0, 2), dtype=np.float32) if uvs is None else np.asarray(uvs, dtype=np.float32)
+            definitions.append(self.arrayDefinition(uvs.tobytes(), len(uvs), self.rawBase))
+        definitions.append(self.arrayDefinition(b'', 0))
+        definitions.append(self.arrayDefinition(packFaces(self.fileVersion, faces), len(faces), self.rawBase))
+        return b''.join(definitions)
+
+    def trimesh(self, name: str, positions, faces, uvChannels=(), textures=('NULL',) * 4, **node) -> int:
+        lines = ['texture texture{} {}'.format(slot, texture) for slot, texture in enumerate(textures)
+                 if texture != 'NULL']
+        arrays = struct.pack('<4x') + self.meshArrays(positions, faces, uvChannels)
+        if self.fileVersion == 133:
+            arrays += struct.pack('<I', self.textureInfo(lines, self.rawBase))
+            textureInfo = 0
+        else:
+            textureInfo = self.textureInfo(lines, self.texBase)
+
+        header = packLayout(
+            MESH_HEADER_LAYOUT,
+            offMeshArrays=self.alloc(arrays) - self.rawBase,
+            textureStrings=tuple(texture.encode('ascii') for texture in textures),
+            offsetTextureInfo=textureInfo
+        )
+        return self.node(name, NodeType.NodeTypeTrimesh, extra=header, **node)
+
+    #  Skin node (v136 only: v133 reads the bone table from wherever the previous mesh left offsetTexData)
+    def skin(self, name: str, positions, faces, boneNames: Sequence[str], weights, boneIndices, **node) -> int:
+        assert self.fileVersion == 136
+        bones = b''.join(struct.pack('<I92s', index, boneName.encode('ascii'))
+                         for index, boneName in enumerate(boneNames))
+        weights = np.asarray(weights, dtype=np.float32).ravel()
+        boneIndices = np.asarray(boneIndices, dtype=np.uint8).ravel()
+
+        extra = packLayout(MESH_HEADER_LAYOUT, offsetTextureInfo=self.textureInfo([], self.texBase))
+        extra += struct.pack('<4x') + self.arrayDefinition(bones, len(boneNames), self.texBase)
+        extra += struct.pack('<4x') + self.meshArrays(positions, faces)
+        extra += bytes(24 + 12)
+        extra += self.arrayDefinition(weights.tobytes(), len(weights))
+        extra += self.arrayDefinition(boneIndices.tobytes(), len(boneIndices))
+        return self.node(name, NodeType.NodeTypeSkin, extra=extra, **node)
+
+    def animation(self, name: str, rootNode: int, length: float = 1.0, rootName: str = 'root'):
+        header = packLayout(
+            ANIMATION_HEADER_LAYOUT,
+            name=name.encode('ascii'),
+            offsetRootNode=rootNode - MODEL_DATA,
+            length=length,
+            rootName=rootName.encode('ascii')
+        )
+        self.animationOffsets.append(self.alloc(header) - MODEL_DATA)
+
+    def build(self, rootNode: int, modelScale: float = 1.0) -> bytes:
+        content = self.buffer
+        struct.pack_into('<BxxxII', content, 0, 0, self.fileVersion, 1)
+        struct.pack_into('<I', content, 16, len(content) - MODEL_DATA)
+        if self.fileVersion == 133:
+            struct.pack_into('<II', content, 24, self.rawBase - MODEL_DATA, len(content) - self.rawBase)
+        else:
+            struct.pack_into('<II', content, 24, self.texBase - MODEL_DATA, len(content) - self.texBase)
+
+        struct.pack_into('<64sI', content, MODEL_DATA + 8, self.name.encode('ascii'), rootNode - MODEL_DATA)
+        struct.pack_into(
+            '<f60sf', content, MODEL_DATA + 252, modelScale, self.superModel.encode('ascii'), 1.0
+        )
+
+        count = len(self.animationOffsets)
+        struct.pack_into('<4x3I', content, ANIMATION_DIRECTORY, 16, count, count)
+        struct.pack_into('<{}I'.format(count), content, ANIMATION_DIRECTORY + 16, *self.animationOffsets)
+        return bytes(content)
+
+    def write(self, path, rootNode: int) -> str:
+        with open(str(path), 'wb') as file:
+            file.write(self.build(rootNode))
+        return str(path)
+
+
+# the model most tests parse: root -> bone (static transform) -> mesh, plus a skin under root (v136) and one clip
+POSITIONS = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+FACES = np.array([[0, 1, 2], [0, 2, 3]], dtype=np.int32)
+UVS = np.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0]], dtype=np.float32)
+BONE_POSITION = (1.0, 2.0, 3.0)
+BONE_ROTATION = (0.0, 0.0, 0.70710677, 0.70710677)  # x, y, z, w as stored: 90 degrees around z
+BONE_SCALE = 2.0
+SKIN_WEIGHTS = [[0.5, 0.25, 0.25, 0.0], [2.0, 0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0]]
+SKIN_BONE_INDICES = [[0, 0, 1, 255], [1, 255, 255, 255], [0, 255, 255, 255], [255, 255, 255, 255]]
+CLIP_TIMES = [0.0, 1.0]
+CLIP_POSITIONS = [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+CLIP_ROTATIONS = [list(BONE_ROTATION), [0.0, 0.0, 0.0, 1.0]]
+
+
+def writeModel(
+    directory,
+    fileVersion: int = 136,
+    name: str = 'model',
+    superModel: str = 'NULL',
+    skinBones: Sequence[str] = ('bone', 'root')
+) -> str:
+    builder = MdbBuilder(fileVersion, name, superModel)
+    mesh = builder.trimesh('mesh', POSITIONS, FACES, [UVS], textures=('tex0', 'NULL', 'NULL', 'NULL'))
+    bone = builder.node('bone', children=[mesh], channels=[
+        (ControllerType.ControllerPosition, [0.0], [BONE_POSITION]),
+        (ControllerType.ControllerOrientation, [0.0], [BONE_ROTATION]),
+        (ControllerType.ControllerScale, [0.0], [[BONE_SCALE]]),
+    ])
+    children = [bone]
+    if fileVersion == 136:
+        children.append(builder.skin('skin', POSITIONS, FACES, skinBones, SKIN_WEIGHTS, SKIN_BONE_INDICES))
+    root = builder.node('root', children=children)
+
+    clipBone = builder.node('bone', channels=[
+        (ControllerType.ControllerPosition, CLIP_TIMES, CLIP_POSITIONS),
+        (ControllerType.ControllerOrientation, CLIP_TIMES, CLIP_ROTATIONS),
+    ])
+    builder.animation('idle', builder.node('root', children=[clipBone]), length=1.0)
+    return builder.write(os.path.join(str(directory), name + '.mdb'), root)
+
+
+#  Skeleton only supermodel: root -> superBone
+def writeSuperModel(directory, name: str = 'base') -> str:
+    builder = MdbBuilder(136, name)
+    root = builder.node('root', children=[builder.node('superBone', channels=[
+        (ControllerType.ControllerPosition, [0.0], [(0.0, 0.0, 1.0)]),
+    ])])
+    return builder.write(os.path.join(str(directory), name + '.mdb'), root)
@@ -0,0 +1,55 @@
+import pytest
+
+from mdb_blender.file_utils import FileWrapper, StructLayout, ArrayDefinition, readArray, _dataToString
+from mdb_blender.mdb_parser import MESH_HEADER_LAYOUT, TEXTURE_PAINT_HEADER_LAYOUT, ANIMATION_HEADER_LAYOUT
+from mdb_blender.model_data import ModelData
+
+
+def test_data_to_string():
+    assert _dataToString(b'bone01\x00\xdc\xdc\xdcgarbage') == 'bone01'
+    assert _dataToString(b'b\xdcone\xff') == 'bone'  # non-ascii bytes are dropped
+    assert _dataToString(b'\x00bone') == ''
+    assert _dataToString(memoryview(b'tex\x00')) == 'tex'
+
+
+def test_data_to_string_interned():
+    first = _dataToString(bytearray(b'shared_name\x00\x01'))
+    second = _dataToString(b'shared_name\x00\x02')
+    assert first == second == 'shared_name'
+    assert first is second
+
+
+@pytest.mark.parametrize('layout, size', [
+    (MESH_HEADER_LAYOUT, 764),
+    (TEXTURE_PAINT_HEADER_LAYOUT, 456),
+    (ANIMATION_HEADER_LAYOUT, 240),
+])
+def test_header_layout_sizes(layout, size):
+    assert layout.size == size
+
+
+def test_struct_layout_fields():
+    layout = StructLayout('Record', (
+        (None, '4x'),
+        ('count', 'I'),
+        ('bounds', '3f', list),
+        ('name', '8s', _dataToString),
+    ))
+    assert layout.size == 4 + 4 + 12 + 8
+
+    content = layout.struct.pack(7, 1.0, 2.0, 3.0, b'abc\x00')
+    record = FileWrapper(content).readLayout(layout)
+    assert record == (7, [1.0, 2.0, 3.0], 'abc')
+    assert record.count == 7
+
+
+def test_read_array():
+    modelData = ModelData(
+        baseDirectory='', modelName='', fileVersion=136, offsetModelData=4, sizeModelData=0, offsetRawData=4,
+        sizeRawData=0, offsetTexData=4, sizeTexData=0, offsetTextureInfo=-1, offsetRootNode=-1, modelType=-1,
+        firstLOD=-1, lastLOD=-1, detailMap='', modelScale=-1, superModel='', animationScale=-1
+    )
+    wrapper = FileWrapper(bytes(4) + bytes([1, 0, 0, 0, 2, 0, 0, 0, 3, 0, 0, 0]))
+    values = readArray(wrapper, modelData, ArrayDefinition(4, 2, 2), wrapper.readUInt32)
+    assert values.tolist() == [2, 3]
+    assert wrapper.offset == 0
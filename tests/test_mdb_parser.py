@@ -0,0 +1,196 @@
+import numpy as np
+import pytest
+
+from mdb_blender.mdb_parser import parse_mdb, groupSkinWeights, getFaceRecordDtype, getTexture, findTextureImage, \
+    getTextureIndex
+from mdb_blender.model_data import ModelData
+from mdb_blender.model_types import ControllerType
+
+from mdb_builder import MdbBuilder, writeModel, POSITIONS, FACES, UVS, BONE_POSITION, CLIP_TIMES, CLIP_POSITIONS, \
+    CLIP_ROTATIONS
+
+
+def getBuffer(modelMesh, name):
+    return next(meshBuffer for meshBuffer in modelMesh.meshBuffers if meshBuffer.name == name)
+
+
+@pytest.mark.parametrize('fileVersion, itemSize', [(133, 48), (136, 32)])
+def test_face_record_strides(fileVersion, itemSize):
+    dtype = getFaceRecordDtype(fileVersion)
+    assert dtype.itemsize == itemSize
+    assert dtype.fields['indices'][1] == (32 if fileVersion == 133 else 20)
+
+
+@pytest.mark.parametrize('fileVersion', [133, 136])
+def test_parse_geometry(tmp_path, fileVersion):
+    modelMesh = parse_mdb(writeModel(tmp_path, fileVersion), import_animations=False)
+
+    assert modelMesh.modelData.fileVersion == fileVersion
+    meshBuffer = getBuffer(modelMesh, 'mesh')
+    np.testing.assert_array_equal(meshBuffer.positions, POSITIONS)
+    np.testing.assert_array_equal(meshBuffer.indices, FACES)
+    assert meshBuffer.positions.dtype == np.float32 and meshBuffer.indices.dtype == np.int32
+
+    assert len(meshBuffer.tCoordChannels) == 4
+    np.testing.assert_array_equal(meshBuffer.tCoordChannels[0], UVS)
+    assert meshBuffer.tCoordChannels[1:] == [None, None, None]
+    assert meshBuffer.material.textures['texture0'] == 'tex0'
+
+
+@pytest.mark.parametrize('fileVersion', [133, 136])
+def test_parse_joint_hierarchy(tmp_path, fileVersion):
+    modelMesh = parse_mdb(writeModel(tmp_path, fileVersion), import_animations=False)
+
+    root, bone, mesh = (modelMesh.getJointByName(name) for name in ('root', 'bone', 'mesh'))
+    assert root.parent is None
+    assert bone.parent is root and mesh.parent is bone
+    assert [child.name for child in root.children][0] == 'bone'
+    assert bone.children == [mesh]
+    assert mesh.attachedMeshes == [getBuffer(modelMesh, 'mesh')]
+
+
+def test_parse_static_transform(tmp_path):
+    modelMesh = parse_mdb(writeModel(tmp_path), import_animations=False)
+    root, bone, mesh = (modelMesh.getJointByName(name) for name in ('root', 'bone', 'mesh'))
+
+    # no controllers: identity
+    np.testing.assert_array_equal(root.localMatrix, np.identity(4))
+    assert root.animatedRotation == (1.0, 0.0, 0.0, 0.0)
+
+    # stored x, y, z, w, kept as w, x, y, z
+    np.testing.assert_allclose(bone.animatedRotation, (0.70710677, 0.0, 0.0, 0.70710677), atol=1e-6)
+    assert bone.animatedPosition == BONE_POSITION
+    assert bone.animatedScale == (2.0, 2.0, 2.0)
+    np.testing.assert_allclose(bone.localMatrix, [
+        [0.0, -2.0, 0.0, 1.0],
+        [2.0, 0.0, 0.0, 2.0],
+        [0.0, 0.0, 2.0, 3.0],
+        [0.0, 0.0, 0.0, 1.0],
+    ], atol=1e-6)
+    np.testing.assert_allclose(mesh.globalMatrix, bone.globalMatrix)
+
+
+def test_parse_global_matrix(tmp_path):
+    globalMatrix = np.diag([1.0, 1.0, 1.0, 1.0])
+    globalMatrix[:3, 3] = (10.0, 0.0, 0.0)
+    modelMesh = parse_mdb(writeModel(tmp_path), import_animations=False, global_matrix=globalMatrix)
+
+    bone = modelMesh.getJointByName('bone')
+    np.testing.assert_allclose(bone.globalMatrix[:3, 3], (11.0, 2.0, 3.0), atol=1e-6)
+    np.testing.assert_allclose(bone.localMatrix[:3, 3], BONE_POSITION)
+
+
+@pytest.mark.parametrize('fileVersion', [133, 136])
+def test_parse_clip_arrays(tmp_path, fileVersion):
+    modelMesh = parse_mdb(writeModel(tmp_path, fileVersion))
+
+    assert [animation.name for animation in modelMesh.animations] == ['idle']
+    animation = modelMesh.animations[0]
+    assert animation.length == 1.0 and animation.rootName == 'root'
+    root = animation.animationNode
+    assert root.name == 'root' and [child.name for child in root.children] == ['bone']
+
+    bone = root.children[0]
+    assert bone.joint is modelMesh.getJointByName('bone')
+    np.testing.assert_array_equal(bone.positionTime, CLIP_TIMES)
+    np.testing.assert_array_equal(bone.position, CLIP_POSITIONS)
+    np.testing.assert_array_equal(bone.rotationTime, CLIP_TIMES)
+    np.testing.assert_array_equal(bone.rotation, np.asarray(CLIP_ROTATIONS, dtype=np.float32))  # file order
+    assert bone.position.dtype == np.float32 and bone.position.shape == (2, 3)
+    assert len(bone.scaleTime) == 0
+
+
+def test_parse_animation_filter(tmp_path):
+    path = writeModel(tmp_path)
+    assert parse_mdb(path, animation_filter='walk').animations[0].animationNode is None
+    assert parse_mdb(path, import_animations=False).animations == []
+
+
+def test_parse_skin(tmp_path):
+    modelMesh = parse_mdb(writeModel(tmp_path), import_animations=False)
+
+    meshBuffer = getBuffer(modelMesh, 'skin')
+    np.testing.assert_array_equal(meshBuffer.positions, POSITIONS)
+    assert [joint.name for joint in meshBuffer.bonePalette] == ['bone', 'root']
+    assert modelMesh.getJointByName('skin').attachedMeshes == [meshBuffer]
+
+    weights = {boneWeights.boneName: boneWeights for boneWeights in meshBuffer.boneWeights}
+    assert sorted(weights) == ['bone', 'root']
+    assert weights['bone'].joint is modelMesh.getJointByName('bone')
+    np.testing.assert_array_equal(weights['bone'].vertexIds, [0, 2])
+    np.testing.assert_allclose(weights['bone'].strengths, [0.75, 1.0])
+    np.testing.assert_array_equal(weights['root'].vertexIds, [0, 1])
+    np.testing.assert_allclose(weights['root'].strengths, [0.25, 1.0])
+
+
+def test_narrow_controller_skipped(tmp_path):
+    builder = MdbBuilder()
+    root = builder.node('root', channels=[
+        (ControllerType.ControllerOrientation, [0.0], [[0.0, 0.0]]),
+        (ControllerType.ControllerPosition, [0.0], [[1.0, 2.0, 3.0]]),
+    ])
+    modelMesh = parse_mdb(builder.write(tmp_path / 'narrow.mdb', root))
+
+    root = modelMesh.getJointByName('root')
+    assert root.animatedRotation == (1.0, 0.0, 0.0, 0.0)
+    assert root.animatedPosition == (1.0, 2.0, 3.0)
+
+
+def test_group_skin_weights():
+    weights = np.array([
+        0.5, 0.5, 0.0, 0.0,
+        3.0, 1.0, 0.0, 0.0,
+        0.2, 0.0, 0.0, 0.0,
+    ], dtype=np.float32)
+    boneIndices = np.array([
+        0, 0, 255, 255,  # the same bone twice: summed
+        1, 2, 255, 255,
+        2, 255, 255, 255,
+    ], dtype=np.uint8)
+
+    groups = groupSkinWeights(weights, boneIndices, ['a', 'b', 'c'], 3)
+    assert [group.boneName for group in groups] == ['a', 'b', 'c']
+    a, b, c = groups
+    np.testing.assert_array_equal(a.vertexIds, [0])
+    np.testing.assert_allclose(a.strengths, [1.0])
+    np.testing.assert_array_equal(b.vertexIds, [1])
+    np.testing.assert_allclose(b.strengths, [0.75])
+    np.testing.assert_array_equal(c.vertexIds, [1, 2])
+    np.testing.assert_allclose(c.strengths, [0.25, 1.0])
+    assert a.vertexIds.dtype == np.int32 and a.strengths.dtype == np.float32
+
+
+def test_group_skin_weights_options():
+    weights = np.array([0.6, 0.3, 0.1, 0.0], dtype=np.float32)
+    boneIndices = np.array([0, 1, 7, 255], dtype=np.uint8)  # 7: outside the bone table
+
+    raw = groupSkinWeights(weights, boneIndices, ['a', 'b'], 1, normalizeWeights=False)
+    np.testing.assert_allclose([group.strengths[0] for group in raw], [0.6, 0.3])
+
+    thresholded = groupSkinWeights(weights, boneIndices, ['a', 'b'], 1, weightThreshold=0.5)
+    assert [group.boneName for group in thresholded] == ['a']
+    np.testing.assert_allclose(thresholded[0].strengths, [1.0])
+
+    assert groupSkinWeights(weights[:0], boneIndices[:0], ['a'], 0) == []
+
+
+def test_texture_lookup(tmp_path):
+    for folder, fileName in (('meshes00', 'Wall.txi'), ('textures00', 'wall.tga'), ('textures01', 'wall.dds'),
+                             ('meshes00', 'floor.txi'), ('textures00', 'floor.jpg'), ('textures00', 'sky.png')):
+        (tmp_path / folder).mkdir(exist_ok=True)
+        (tmp_path / folder / fileName).write_bytes(b'')
+    modelData = ModelData(
+        baseDirectory=str(tmp_path), modelName='', fileVersion=136, offsetModelData=32, sizeModelData=0,
+        offsetRawData=32, sizeRawData=0, offsetTexData=32, sizeTexData=0, offsetTextureInfo=-1, offsetRootNode=-1,
+        modelType=-1, firstLOD=-1, lastLOD=-1, detailMap='', modelScale=-1, superModel='', animationScale=-1
+    )
+
+    index = getTextureIndex(str(tmp_path), revalidate=True)
+    assert sorted(index['wall']) == ['dds', 'tga', 'txi']
+
+    # images never resolve to a .txi sidecar, the existence probes still see it
+    assert findTextureImage(modelData, 'WALL').endswith('wall.dds')
+    assert findTextureImage(modelData, 'floor').endswith('floor.jpg')
+    assert findTextureImage(modelData, 'sky').endswith('sky.png')
+    assert getTexture(modelData, 'floor').endswith('floor.txi')
+    assert findTextureImage(modelData, 'missing') is None
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+from mdb_blender import parse_cache
+from mdb_blender.parse_cache import parseModel
+
+from mdb_builder import writeModel, writeSuperModel, POSITIONS
+
+
+def test_parse_cache_round_trip(tmp_path, monkeypatch):
+    path = writeModel(tmp_path)
+    cacheDirectory = str(tmp_path / 'cache')
+
+    parsed = parseModel(path, cache_directory=cacheDirectory, import_animations=True)
+    assert len(os.listdir(cacheDirectory)) == 1
+
+    # a hit must not parse again
+    monkeypatch.setattr(parse_cache, 'parse_mdb', lambda *args, **kwargs: pytest.fail('parsed again'))
+    cached = parseModel(path, cache_directory=cacheDirectory, import_animations=True)
+
+    assert cached is not parsed
+    assert [joint.name for joint in cached.joints] == [joint.name for joint in parsed.joints]
+    for cachedBuffer, parsedBuffer in zip(cached.meshBuffers, parsed.meshBuffers):
+        assert cachedBuffer.name == parsedBuffer.name
+        np.testing.assert_array_equal(cachedBuffer.positions, parsedBuffer.positions)
+        np.testing.assert_array_equal(cachedBuffer.indices, parsedBuffer.indices)
+    np.testing.assert_array_equal(cached.meshBuffers[0].positions, POSITIONS)
+
+    bone = cached.animations[0].animationNode.children[0]
+    np.testing.assert_array_equal(bone.position, parsed.animations[0].animationNode.children[0].position)
+    assert bone.joint is cached.getJointByName('bone')
+    skin = next(meshBuffer for meshBuffer in cached.meshBuffers if meshBuffer.name == 'skin')
+    assert skin.boneWeights[0].joint is cached.getJointByName(skin.boneWeights[0].boneName)
+
+
+def test_parse_cache_options_and_changes(tmp_path):
+    path = writeModel(tmp_path)
+    cacheDirectory = str(tmp_path / 'cache')
+
+    parseModel(path, cache_directory=cacheDirectory, import_animations=True)
+    parseModel(path, cache_directory=cacheDirectory, import_animations=False)
+    assert len(os.listdir(cacheDirectory)) == 2  # one artifact per parse options
+
+    artifactPath = parse_cache.getArtifactPath(cacheDirectory, path, {'import_animations': False})
+    assert parse_cache.readArtifact(artifactPath, parse_cache.getCacheKey(path, {'import_animations': False}))
+
+    writeModel(tmp_path, fileVersion=133)  # same path, other content
+    assert parse_cache.readArtifact(artifactPath, parse_cache.getCacheKey(path, {'import_animations': False})) is None
+    assert parseModel(path, cache_directory=cacheDirectory, import_animations=False).modelData.fileVersion == 133
+
+
+def test_parse_cache_super_model_reference(tmp_path):
+    writeSuperModel(tmp_path)
+    path = writeModel(tmp_path, superModel='base', skinBones=('bone', 'superBone'))
+    cacheDirectory = str(tmp_path / 'cache')
+
+    parsed = parseModel(path, cache_directory=cacheDirectory)
+    cached = parseModel(path, cache_directory=cacheDirectory)
+
+    assert cached is not parsed
+    assert cached.superMesh is parsed.superMesh  # the session's supermodel, not a copy
+    superBone = parsed.superMesh.getJointByName('superBone')
+    skin = next(meshBuffer for meshBuffer in cached.meshBuffers if meshBuffer.name == 'skin')
+    assert skin.bonePalette[1] is superBone
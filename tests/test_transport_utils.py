@@ -0,0 +1,58 @@
+import numpy as np
+
+from mdb_blender.transport_utils import packModel, unpackModel, releaseModel, discardModel, parseForTransport
+from mdb_blender.mdb_parser import parse_mdb
+
+from mdb_builder import writeModel, writeSuperModel
+
+
+def getBuffer(modelMesh, name):
+    return next(meshBuffer for meshBuffer in modelMesh.meshBuffers if meshBuffer.name == name)
+
+
+def test_transport_round_trip(tmp_path):
+    parsed = parse_mdb(writeModel(tmp_path))
+    packed = packModel(parsed)
+    assert packed[1] is not None  # the arrays went to a shared memory block
+
+    unpacked, block = unpackModel(packed)
+    try:
+        assert [joint.name for joint in unpacked.joints] == [joint.name for joint in parsed.joints]
+        for name in ('mesh', 'skin'):
+            np.testing.assert_array_equal(getBuffer(unpacked, name).positions, getBuffer(parsed, name).positions)
+            np.testing.assert_array_equal(getBuffer(unpacked, name).indices, getBuffer(parsed, name).indices)
+        np.testing.assert_array_equal(getBuffer(unpacked, 'mesh').tCoordChannels[0],
+                                      getBuffer(parsed, 'mesh').tCoordChannels[0])
+
+        # joints stay shared between the hierarchy, the skin and the clips
+        bone = unpacked.getJointByName('bone')
+        skin = getBuffer(unpacked, 'skin')
+        assert skin.bonePalette[0] is bone
+        assert next(weights for weights in skin.boneWeights if weights.boneName == 'bone').joint is bone
+        assert unpacked.getJointByName('mesh').parent is bone
+        assert getBuffer(unpacked, 'mesh') in unpacked.getJointByName('mesh').attachedMeshes
+        assert unpacked.animations[0].animationNode.children[0].joint is bone
+    finally:
+        releaseModel(block)
+
+
+def test_transport_super_model_joints(tmp_path):
+    writeSuperModel(tmp_path)
+    path = writeModel(tmp_path, superModel='base', skinBones=('bone', 'superBone'))
+
+    parsed = parse_mdb(path)
+    unpacked, block = unpackModel(parseForTransport(path, {}))
+    try:
+        # supermodel joints resolve to this process's supermodel, as the parsed model's do
+        superBone = parsed.superMesh.getJointByName('superBone')
+        assert unpacked.superMesh is parsed.superMesh
+        skin = getBuffer(unpacked, 'skin')
+        assert skin.bonePalette[1] is superBone
+        assert next(weights for weights in skin.boneWeights if weights.boneName == 'superBone').joint is superBone
+    finally:
+        releaseModel(block)
+
+
+def test_transport_discard(tmp_path):
+    packed = packModel(parse_mdb(writeModel(tmp_path)))
+    discardModel(packed)
@@ -0,0 +1,77 @@
+#  moves parsed models between processes: the object graph is pickled, the numeric arrays it holds are not,
+#  they are copied once into a shared memory block and come back as views on it; the supermodel chain is sent
+#  as references
+import os
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Tuple
+
+from .model_data import ModelMesh
+from .mdb_parser import getSuperModelReferences, makeSuperModelResolver
+from .parse_cache import parseModel
+from .pickle_utils import ArrayEntry, dumpWithArrays, writeArrays, loadWithArrays
+
+
+# worker side handles of the blocks sent so far, on Windows a block disappears with its last handle
+# so they are kept until the worker exits (the pool is shut down at the end of the batch)
+_SENT_BLOCKS: List[shared_memory.SharedMemory] = []
+
+
+#  (pickled graph, shared memory block name, layout of the arrays in the block), block is None without arrays
+def packModel(modelMesh: ModelMesh) -> Tuple[bytes, Optional[str], List[ArrayEntry]]:
+    payload, arrays, table, size = dumpWithArrays(modelMesh, getSuperModelReferences(modelMesh))
+    if size == 0:
+        return payload, None, table
+
+    block = shared_memory.SharedMemory(create=True, size=size)
+    writeArrays(block.buf, 0, arrays, table)
+
+    # the receiving process unlinks the block, this one must not clean it up on exit
+    resource_tracker.unregister(block._name, 'shared_memory')
+    if os.name == 'nt':
+        _SENT_BLOCKS.append(block)
+    else:
+        block.close()
+    return payload, block.name, table
+
+
+#  Rebuilds the graph with its arrays as (read-only) views on the block and the supermodel chain as this process's
+#  own (parsed once per session); the returned block must be passed to releaseModel once the arrays are not
+#  referenced anymore
+def unpackModel(packed) -> Tuple[ModelMesh, Optional[shared_memory.SharedMemory]]:
+    payload, blockName, table = packed
+    block = shared_memory.SharedMemory(name=blockName) if blockName is not None else None
+    if block is not None and os.name != 'nt':
+        block.unlink()  # the mapping stays valid until closed
+    try:
+        modelMesh = loadWithArrays(
+            payload, block.buf if block is not None else None, 0, table, makeSuperModelResolver()
+        )
+    except Exception:
+        releaseModel(block)
+        raise
+    return modelMesh, block
+
+
+def releaseModel(block: Optional[shared_memory.SharedMemory]):
+    if block is None:
+        return
+    try:
+        block.close()
+    except BufferError:
+        pass  # arrays still point into the block, it is released together with them
+
+
+#  Frees the block of a packed model that will not be unpacked (failed or cancelled batch)
+def discardModel(packed):
+    _, blockName, _ = packed
+    if blockName is None:
+        return
+    block = shared_memory.SharedMemory(name=blockName)
+    block.close()
+    if os.name != 'nt':
+        block.unlink()
+
+
+#  Worker entry: parses (or reads from the parse cache) a model and packs it for the main process
+def parseForTransport(path: str, options: dict):
+    return packModel(parseModel(path, **options))